@@ -1,32 +1,37 @@
+import argparse
 import torch
-import torch.nn as nn
-import os
 
 from yureka.learn import models
-from yureka.engine import constants
+from yureka.learn.models.res import Network
+from yureka.learn.models.script import to_torch_script
+from yureka.engine import constants, load_state_dicts
 
 
-class Network(nn.Module):
-    def __init__(self, tower, policy, value):
-        super(Network, self).__init__()
-        self.tower = tower
-        self.policy = policy
-        self.value = value
+parser = argparse.ArgumentParser(
+    description='Saves a ResNet as a frozen TorchScript model for the engine')
+parser.add_argument('-r', '--resnet', default=constants.DEFAULT_RESNET)
+parser.add_argument(
+    '-t', '--tower-file', default=constants.DEFAULT_RESNET_TOWER_FILE)
+parser.add_argument(
+    '-p', '--policy-file', default=constants.DEFAULT_RESNET_POLICY_FILE)
+parser.add_argument(
+    '-v', '--value-file', default=constants.DEFAULT_RESNET_VALUE_FILE)
+parser.add_argument(
+    '-c', '--cuda-device', type=int,
+    help='freeze for this cuda device instead of the cpu')
+parser.add_argument('-o', '--output', default='model.pt')
+args = parser.parse_args()
 
-    def forward(self, x):
-        x = self.tower(x)
-        return self.policy(x), self.value(x)
-
-
-tower, policy, value = models.create(constants.DEFAULT_RESNET)
-tower.load_state_dict(
-    torch.load(os.path.expanduser(constants.DEFAULT_RESNET_TOWER_FILE)))
-policy.load_state_dict(
-    torch.load(os.path.expanduser(constants.DEFAULT_RESNET_POLICY_FILE)))
-value.load_state_dict(
-    torch.load(os.path.expanduser(constants.DEFAULT_RESNET_VALUE_FILE)))
-
-network = Network(tower, policy, value).eval()
-input = torch.randn(16, 21, 8, 8)
-traced_script_module = torch.jit.trace(network, input)
-traced_script_module.save("model.pt")
+tower, policy, value = models.create(args.resnet)
+load_state_dicts([
+    (tower, args.tower_file),
+    (policy, args.policy_file),
+    (value, args.value_file),
+])
+if args.cuda_device is None:
+    device = torch.device('cpu')
+else:
+    device = torch.device('cuda', args.cuda_device)
+network = to_torch_script(Network(tower, policy, value), device=device)
+network.save(args.output)
+print(f'Saved {args.output}')
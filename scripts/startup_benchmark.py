@@ -0,0 +1,64 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+parser = argparse.ArgumentParser(
+    description='Measures how long the engine takes to answer uci and isready')
+parser.add_argument(
+    '-e', '--engine', default='yureka.yureka_mcts',
+    help='module of the engine to start')
+parser.add_argument(
+    '-o', '--option', action='append', default=[],
+    help='engine option to set before isready, e.g. "Use ResNet=false"')
+parser.add_argument('-r', '--runs', type=int, default=5)
+args = parser.parse_args()
+
+
+def wait_for(engine, expected):
+    while True:
+        line = engine.stdout.readline()
+        if not line:
+            raise RuntimeError(f'engine exited before {expected}')
+        if line.strip() == expected:
+            return
+
+
+def run():
+    start = time.monotonic()
+    engine = subprocess.Popen(
+        [sys.executable, '-m', args.engine],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        bufsize=1,
+    )
+    try:
+        engine.stdin.write('uci\n')
+        wait_for(engine, 'uciok')
+        uciok = time.monotonic() - start
+        for option in args.option:
+            name, value = option.split('=', 1)
+            engine.stdin.write(f'setoption name {name} value {value}\n')
+        engine.stdin.write('isready\n')
+        wait_for(engine, 'readyok')
+        readyok = time.monotonic() - start
+        engine.stdin.write('quit\n')
+        engine.wait()
+    finally:
+        engine.kill()
+    return uciok, readyok
+
+
+uciok_times = []
+readyok_times = []
+for i in range(args.runs):
+    uciok, readyok = run()
+    print(f'run {i}: uciok {uciok:.3f}s, readyok {readyok:.3f}s')
+    uciok_times.append(uciok)
+    readyok_times.append(readyok)
+
+print(f'median time to uciok: {statistics.median(uciok_times):.3f}s')
+print(f'median time to readyok: {statistics.median(readyok_times):.3f}s')
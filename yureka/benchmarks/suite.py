@@ -0,0 +1,368 @@
+import argparse
+import attr
+import chess
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import torch
+
+from ..learn import models
+from ..learn.data.board_data import get_board_data
+from ..learn.data.chess_dataset import (
+    ChessDataset,
+    LMDBChessDataset,
+    get_tensor_from_row,
+)
+from ..learn.data.move_translator import (
+    translate_to_engine_move,
+    get_engine_move_index,
+)
+from ..learn.models.res import ResNet
+from ..mcts import MCTS, Node, SearchLimits
+from ..mcts.networks import PolicyNetwork, ValueNetwork
+
+
+# the numbers depend on the machine, so they're kept out of the repo
+BASELINES_FILE = os.path.join('~', '.cache', 'yureka', 'baselines.json')
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_TIME = 0.5  # seconds
+DEFAULT_ROUNDS = 3
+BATCH_SIZES = (1, 8, 64)
+SEARCH_NODES = 100
+DATASET_ROWS = 1024
+DATASET_BATCH = 64
+
+# openings, middlegames and endgames, with both sides to move
+POSITIONS = [
+    chess.STARTING_FEN,
+    'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1',
+    'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3',
+    'r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2PP1N2/PP3PPP/RNBQ1RK1 b - - 0 7',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    '8/8/4k3/8/2P5/8/4K3/8 w - - 0 1',
+]
+
+# small enough that the benchmarks measure the code around the model
+# rather than the model itself
+TINY_RESNET = {
+    **models.get_config('ResNet.v0'),
+    'name': 'Tiny',
+    'conv_block_out_channels': 16,
+    'res_block_out_channels': 16,
+    'res_blocks': 1,
+    'policy_out_channels': 8,
+    'value_hidden': 16,
+}
+
+
+class BenchmarkSkipped(Exception):
+    pass
+
+
+@attr.s
+class Benchmark():
+    name = attr.ib()
+    # what the work is counted in, e.g. positions
+    unit = attr.ib()
+    # takes a temporary directory and returns a function that does some
+    # work and returns how many units it did
+    setup = attr.ib()
+
+
+def get_boards():
+    return [chess.Board(fen) for fen in POSITIONS]
+
+
+def get_rows(count):
+    boards = get_boards()
+    return [
+        get_board_data(boards[i % len(boards)], boards[i % len(boards)].turn)
+        for i in range(count)
+    ]
+
+
+def create_networks():
+    # the same random weights every run
+    torch.manual_seed(0)
+    tower, policy, value = models.create_from_config(TINY_RESNET)
+    return (
+        PolicyNetwork(ResNet(tower, policy), cuda=False, train=False),
+        ValueNetwork(ResNet(tower, value), cuda=False),
+    )
+
+
+def setup_encode(tmpdir):
+    boards = get_boards()
+
+    def encode():
+        for board in boards:
+            get_tensor_from_row(get_board_data(board, board.turn))
+        return len(boards)
+    return encode
+
+
+def setup_move_index(tmpdir):
+    boards = [(b, list(b.legal_moves)) for b in get_boards()]
+
+    def move_index():
+        count = 0
+        for board, moves in boards:
+            for move in moves:
+                get_engine_move_index(
+                    translate_to_engine_move(move, board.turn))
+            count += len(moves)
+        return count
+    return move_index
+
+
+def setup_policy(batch_size, tmpdir):
+    policy, _ = create_networks()
+    if batch_size == 1:
+        boards = get_boards()
+
+        def get_probs():
+            for board in boards:
+                policy.get_probs(board)
+            return len(boards)
+        return get_probs
+    # the engine only evaluates one position at a time, so bigger batches
+    # go through the same input buffer and model directly
+    rows = get_rows(batch_size)
+
+    def evaluate():
+        with torch.no_grad():
+            policy.model(policy.inputs.fill(rows))
+        return batch_size
+    return evaluate
+
+
+def setup_value(batch_size, tmpdir):
+    _, value = create_networks()
+    if batch_size == 1:
+        boards = get_boards()
+
+        def get_value():
+            for board in boards:
+                value.get_value(board, board.turn)
+            return len(boards)
+        return get_value
+    rows = get_rows(batch_size)
+
+    def evaluate():
+        with torch.no_grad():
+            value.network(value.inputs.fill(rows))
+        return batch_size
+    return evaluate
+
+
+def setup_search(tmpdir):
+    policy, value = create_networks()
+    boards = get_boards()
+
+    def search():
+        nodes = 0
+        for board in boards:
+            mcts = MCTS(Node(board=board.copy()), value, policy)
+            # the info lines aren't part of the benchmark
+            with contextlib.redirect_stdout(io.StringIO()):
+                mcts.search(SearchLimits(nodes=SEARCH_NODES))
+            nodes += mcts.nodes
+        return nodes
+    return search
+
+
+def get_dataset_rows():
+    rows = []
+    for i, row in enumerate(get_rows(DATASET_ROWS)):
+        board = chess.Board(POSITIONS[i % len(POSITIONS)])
+        move = next(iter(board.legal_moves))
+        rows.append({
+            **row,
+            'move': translate_to_engine_move(move, board.turn),
+            'value': 0,
+        })
+    return rows
+
+
+def read_batches(dataset):
+    start = 0
+
+    def read():
+        nonlocal start
+        dataset.__getitems__(list(range(start, start + DATASET_BATCH)))
+        start = (start + DATASET_BATCH) % (DATASET_ROWS - DATASET_BATCH)
+        return DATASET_BATCH
+    return read
+
+
+def setup_csv_dataset(tmpdir):
+    import pandas as pd
+    path = os.path.join(tmpdir, 'bench.csv')
+    pd.DataFrame(get_dataset_rows()).to_csv(path, index=False)
+    return read_batches(ChessDataset(path))
+
+
+def setup_lmdb_dataset(tmpdir):
+    import pandas as pd
+    if not hasattr(pd, 'read_msgpack'):
+        raise BenchmarkSkipped(
+            'LMDBChessDataset needs a pandas with msgpack support')
+    import lmdb
+    path = os.path.join(tmpdir, 'bench.lmdb')
+    env = lmdb.open(path, map_size=2**30)
+    with env.begin(write=True) as txn:
+        for i, row in enumerate(get_dataset_rows()):
+            txn.put(f'{i}'.encode(), pd.Series(row).to_msgpack())
+    env.close()
+    return read_batches(LMDBChessDataset(path))
+
+
+BENCHMARKS = [
+    Benchmark('encode', 'positions', setup_encode),
+    Benchmark('move index', 'moves', setup_move_index),
+    *(
+        Benchmark(f'policy batch {b}', 'positions',
+                  functools.partial(setup_policy, b))
+        for b in BATCH_SIZES
+    ),
+    *(
+        Benchmark(f'value batch {b}', 'positions',
+                  functools.partial(setup_value, b))
+        for b in BATCH_SIZES
+    ),
+    Benchmark('mcts search', 'nodes', setup_search),
+    Benchmark('csv dataset', 'samples', setup_csv_dataset),
+    Benchmark('lmdb dataset', 'samples', setup_lmdb_dataset),
+]
+
+
+def measure(work, min_time=DEFAULT_MIN_TIME, rounds=DEFAULT_ROUNDS):
+    # units per second of the fastest round, which is the one the least
+    # disturbed by everything else running on the machine
+    work()
+    best = 0
+    for _ in range(rounds):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            count += work()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = max(best, count / elapsed)
+    return best
+
+
+def run_benchmarks(benchmarks, min_time=DEFAULT_MIN_TIME,
+                   rounds=DEFAULT_ROUNDS):
+    # returns the rate of every benchmark, None for the skipped ones
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for benchmark in benchmarks:
+            try:
+                work = benchmark.setup(tmpdir)
+            except BenchmarkSkipped as e:
+                print(f'{benchmark.name:<16} skipped: {e}')
+                results[benchmark.name] = None
+                continue
+            rate = measure(work, min_time=min_time, rounds=rounds)
+            print(f'{benchmark.name:<16} {rate:>12,.1f} {benchmark.unit}/s')
+            results[benchmark.name] = rate
+    return results
+
+
+def find_regressions(results, baselines, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    for name, rate in results.items():
+        baseline = baselines.get(name)
+        if rate is None or baseline is None:
+            continue
+        if rate < baseline * (1 - tolerance):
+            regressions.append(
+                f'{name}: {rate:,.1f}/s, baseline {baseline:,.1f}/s '
+                f'({rate / baseline - 1:+.0%})')
+    return regressions
+
+
+def load_baselines(path):
+    path = os.path.expanduser(path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(path, baselines):
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Measures the throughput of the hot paths of the engine '
+                    'with tiny random models, and fails if any of them '
+                    'fell behind its baseline on this machine')
+    parser.add_argument(
+        'names', nargs='*',
+        help='benchmarks to run, all of them by default')
+    parser.add_argument('-b', '--baselines', default=BASELINES_FILE)
+    parser.add_argument(
+        '-s', '--save', action='store_true',
+        help='record the results as the new baselines instead of comparing '
+             'against them')
+    parser.add_argument(
+        '-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+        help='fraction of its baseline a benchmark can lose')
+    parser.add_argument(
+        '--min-time', type=float, default=DEFAULT_MIN_TIME,
+        help='seconds each round runs for at least')
+    parser.add_argument('-r', '--rounds', type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument(
+        '-j', '--threads', type=int, default=1,
+        help='torch threads, one keeps the numbers comparable')
+    args = parser.parse_args()
+
+    benchmarks = BENCHMARKS
+    if args.names:
+        unknown = set(args.names) - {b.name for b in BENCHMARKS}
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        benchmarks = [b for b in BENCHMARKS if b.name in args.names]
+    torch.set_num_threads(args.threads)
+    results = run_benchmarks(
+        benchmarks, min_time=args.min_time, rounds=args.rounds)
+
+    if args.save:
+        baselines = load_baselines(args.baselines)
+        baselines.update(
+            {name: round(rate, 1) for name, rate in results.items() if rate})
+        save_baselines(args.baselines, baselines)
+        print(f'Saved {args.baselines}')
+        return
+    baselines = load_baselines(args.baselines)
+    if not baselines:
+        # nothing to compare against, the results are only reported
+        print(f'No baselines in {args.baselines}, record them with --save')
+        return
+    regressions = find_regressions(results, baselines, args.tolerance)
+    if regressions:
+        print('Regressions:', file=sys.stderr)
+        for regression in regressions:
+            print(f'  {regression}', file=sys.stderr)
+        sys.exit(1)
+    print('No regressions')
+
+
+if __name__ == '__main__':
+    run()
@@ -1,24 +1,71 @@
 import attr
 import re
 import chess
+import concurrent.futures
 import sys
-import torch
+import threading
+import time
 import os
 
-from ..learn import models
-from ..learn.models.res import ResNet
-from ..mcts.networks import (
-    PolicyNetwork,
-    ValueNetwork,
-    ZeroValue,
-    RandomPolicy,
+# torch and everything that needs it are imported where they're used, so
+# that the engine can answer uci while they're still being imported
+from ..mcts import Node, MCTS, SearchLimits, TreeReclaimer
+from ..mcts.constants import (
+    DEFAULT_CONFIDENCE,
+    DEFAULT_MIXING,
+    DEFAULT_ROLLOUT_DEPTH,
+    DEFAULT_SEED,
+    DEFAULT_INFO_INTERVAL,
+    DEFAULT_HASH,
+    NODE_BYTES,
 )
-from ..mcts import Node, MCTS
-from ..mcts.constants import DEFAULT_CONFIDENCE
 from ..common.utils import print_flush
 
 from . import constants
-from .time_manager import TimeManager
+from .bench import bench, read_epd
+from .time_manager import TimeManager, parse_time_control
+
+
+def preload():
+    # importing torch takes seconds, get it started in the background
+    from ..learn import models  # noqa: F401
+    from ..mcts import networks  # noqa: F401
+
+
+def load_state_dict(path):
+    import inspect
+    import torch
+    path = os.path.expanduser(path)
+    # torch.load can only memory-map checkpoints since torch 2.1
+    if 'mmap' in inspect.signature(torch.load).parameters:
+        try:
+            # only the pages that are actually used get read
+            return torch.load(path, map_location='cpu', mmap=True)
+        except RuntimeError:
+            # saved in the legacy format, which can't be memory-mapped
+            pass
+    return torch.load(path, map_location='cpu')
+
+
+def load_script(path, cuda_device=None):
+    import torch
+    from ..learn.models.script import load_torch_script
+    if torch.cuda.is_available():
+        device = torch.device('cuda', cuda_device)
+    else:
+        device = torch.device('cpu')
+    return load_torch_script(os.path.expanduser(path), device=device)
+
+
+def load_state_dicts(modules_and_paths):
+    # read the checkpoints in parallel, most of it is I/O
+    if not modules_and_paths:
+        return
+    modules, paths = zip(*modules_and_paths)
+    with concurrent.futures.ThreadPoolExecutor(len(paths)) as executor:
+        state_dicts = list(executor.map(load_state_dict, paths))
+    for module, state_dict in zip(modules, state_dicts):
+        module.load_state_dict(state_dict)
 
 
 @attr.s
@@ -31,11 +78,22 @@ class UCIEngine():
             'position': self.position,
             'go': self.go,
             'stop': self.stop,
+            'ponderhit': self.ponderhit,
             'setoption': self.setoption,
             'quit': self.quit,
         }
         self.model_option_changed = True
         self.engine_option_changed = True
+        self.search_thread = None
+        self.stop_event = threading.Event()
+        self.emit_bestmove = True
+        self.preloader = threading.Thread(target=preload, daemon=True)
+        self.preloader.start()
+
+    def wait_for_preload(self):
+        # torch can't be imported from two threads at once, so this has to
+        # be called before importing anything that needs it
+        self.preloader.join()
 
     def init_engine(self):
         raise NotImplementedError
@@ -51,14 +109,22 @@ class UCIEngine():
 
     def print_options(self):
         for name, option in self.options.items():
-            print_flush(f"option name {name} type {option['type']} default"
-                        f" {option['default']}")
+            default = option['default']
+            if default == '':
+                default = '<empty>'
+            line = f"option name {name} type {option['type']} default" \
+                f" {default}"
+            if option['type'] == 'spin':
+                line += f" min {option['min']} max {option['max']}"
+            print_flush(line)
 
     def setoption(self, args):
         m = re.match(r'name\s+(.+)\s+value\s+(.+)', args)
         if m:
             name = m.group(1)
             value = m.group(2)
+            if value == '<empty>':
+                value = ''
         else:
             self.unknown_handler(args)
             return
@@ -71,19 +137,54 @@ class UCIEngine():
         else:
             self.engine_option_changed = True
 
+    def searching(self):
+        return self.search_thread is not None and \
+            self.search_thread.is_alive()
+
+    def start_search(self, target, *args):
+        self.stop_search()
+        self.stop_event.clear()
+        self.emit_bestmove = True
+        self.search_thread = threading.Thread(
+            target=target,
+            args=args,
+            daemon=True,
+        )
+        self.search_thread.start()
+
+    def stop_search(self, emit_bestmove=True):
+        # the search thread prints bestmove on its way out
+        if self.search_thread is None:
+            return
+        self.emit_bestmove = emit_bestmove
+        self.stop_event.set()
+        self.search_thread.join()
+        self.search_thread = None
+
     def stop(self, args):
+        self.stop_search()
+
+    def ponderhit(self, args):
         pass
 
     def isready(self, args):
+        if self.searching():
+            # must be answered right away, even in the middle of a search
+            print_flush('readyok')
+            return
+        self.apply_options()
+        print_flush('readyok')
+
+    def apply_options(self):
         if self.model_option_changed:
             self.init_models()
             self.model_option_changed = False
         if self.engine_option_changed:
             self.init_engine()
             self.engine_option_changed = False
-        print_flush('readyok')
 
     def ucinewgame(self, args):
+        self.stop_search()
         self.init_engine()
 
     def position(self, args):
@@ -108,6 +209,7 @@ class UCIEngine():
                     self.unknown_handler(args)
                     return
 
+        self.stop_search()
         self.new_position(fen, moves)
 
     def new_position(self, fen, moves):
@@ -117,6 +219,7 @@ class UCIEngine():
         raise NotImplementedError
 
     def quit(self, args):
+        self.stop_search()
         sys.exit()
 
     def unknown_handler(self, command):
@@ -140,8 +243,12 @@ class UCIEngine():
 
     def listen(self):
         while True:
-            command = input()
-            self.handle(command)
+            try:
+                command = input()
+            except EOFError:
+                self.quit('')
+            if command.strip():
+                self.handle(command)
 
 
 @attr.s
@@ -149,6 +256,7 @@ class UCIPolicyEngine(UCIEngine):
     model_name = attr.ib(default=constants.DEFAULT_MODEL)
     model_file = attr.ib(default=constants.DEFAULT_MODEL_FILE)
     cuda_device = attr.ib(default=None)
+    script_file = attr.ib(default=constants.DEFAULT_SCRIPT_FILE)
 
     def __attrs_post_init__(self):
         super().__attrs_post_init__()
@@ -174,17 +282,33 @@ class UCIPolicyEngine(UCIEngine):
                 'py_type': int,
                 'model': True,
             },
+            'Script File': {
+                'type': 'string',
+                'default': constants.DEFAULT_SCRIPT_FILE,
+                'attr_name': 'script_file',
+                'py_type': str,
+                'model': True,
+            },
         }
         self.model = None
 
     def init_models(self):
-        if self.model_name != constants.RANDOM_POLICY:
+        self.wait_for_preload()
+        from ..learn import models
+        from ..mcts.networks import Head
+        if self.script_file:
+            self.model = Head(
+                load_script(self.script_file, self.cuda_device), 0)
+        elif self.model_name != constants.RANDOM_POLICY:
             self.model = models.create(self.model_name)
-            self.model.load_state_dict(
-                torch.load(os.path.expanduser(self.model_file)))
+            self.model.load_state_dict(load_state_dict(self.model_file))
+        else:
+            self.model = None
 
     def init_engine(self):
-        if self.model_name == constants.RANDOM_POLICY:
+        self.wait_for_preload()
+        from ..mcts.networks import PolicyNetwork, RandomPolicy
+        if self.model is None:
             self.engine = RandomPolicy()
         else:
             self.engine = PolicyNetwork(
@@ -213,9 +337,32 @@ class UCIMCTSEngine(UCIEngine):
     policy_name = attr.ib(default=constants.DEFAULT_POLICY)
     policy_file = attr.ib(default=constants.DEFAULT_POLICY_FILE)
     confidence = attr.ib(default=DEFAULT_CONFIDENCE)
+    ponder = attr.ib(default=False)
+    seed = attr.ib(default=DEFAULT_SEED)
+    info_interval = attr.ib(default=int(DEFAULT_INFO_INTERVAL * 1000))
+    show_wdl = attr.ib(default=False)
+    profile = attr.ib(default=False)
+    hash = attr.ib(default=DEFAULT_HASH)
+    move_overhead = attr.ib(default=constants.DEFAULT_MOVE_OVERHEAD)
+    warmup_passes = attr.ib(default=constants.DEFAULT_WARMUP_PASSES)
+    script_file = attr.ib(default=constants.DEFAULT_SCRIPT_FILE)
+    fold_batch_norms = attr.ib(default=True)
+    int8 = attr.ib(default=False)
+    calibration_file = attr.ib(default=constants.DEFAULT_CALIBRATION_FILE)
+    inference_server = attr.ib(default=constants.DEFAULT_INFERENCE_SERVER)
+    model_bundle = attr.ib(default=constants.DEFAULT_MODEL_BUNDLE)
+    rollout_file = attr.ib(default=constants.DEFAULT_ROLLOUT_FILE)
+    rollout_mixing = attr.ib(default=DEFAULT_MIXING)
+    rollout_depth = attr.ib(default=DEFAULT_ROLLOUT_DEPTH)
 
     def __attrs_post_init__(self):
         super().__attrs_post_init__()
+        self.engine = None
+        self.rollout_policy = None
+        self.reclaimer = TreeReclaimer()
+        self.pondering = False
+        self.ponder_args = None
+        self.handlers['bench'] = self.bench
         self.options = {
             'Use ResNet': {
                 'type': 'check',
@@ -287,66 +434,422 @@ class UCIMCTSEngine(UCIEngine):
                 'py_type': float,
                 'model': False,
             },
+            'Ponder': {
+                'type': 'check',
+                'default': 'false',
+                'attr_name': 'ponder',
+                'py_type': lambda x: x == 'true',
+                'model': False,
+            },
+            'Seed': {
+                'type': 'spin',
+                'default': DEFAULT_SEED,
+                'min': 0,
+                'max': 2**31 - 1,
+                'attr_name': 'seed',
+                'py_type': int,
+                'model': False,
+            },
+            'Info Interval': {
+                'type': 'spin',
+                'default': int(DEFAULT_INFO_INTERVAL * 1000),
+                'min': 0,
+                'max': 60000,
+                'attr_name': 'info_interval',
+                'py_type': int,
+                'model': False,
+            },
+            'UCI_ShowWDL': {
+                'type': 'check',
+                'default': 'false',
+                'attr_name': 'show_wdl',
+                'py_type': lambda x: x == 'true',
+                'model': False,
+            },
+            'Profile': {
+                'type': 'check',
+                'default': 'false',
+                'attr_name': 'profile',
+                'py_type': lambda x: x == 'true',
+                'model': False,
+            },
+            'Hash': {
+                'type': 'spin',
+                'default': DEFAULT_HASH,
+                'min': 1,
+                'max': 65536,
+                'attr_name': 'hash',
+                'py_type': int,
+                'model': False,
+            },
+            'Move Overhead': {
+                'type': 'spin',
+                'default': constants.DEFAULT_MOVE_OVERHEAD,
+                'min': 0,
+                'max': 5000,
+                'attr_name': 'move_overhead',
+                'py_type': int,
+                'model': False,
+            },
+            'Warmup Passes': {
+                'type': 'spin',
+                'default': constants.DEFAULT_WARMUP_PASSES,
+                'min': 0,
+                'max': 100,
+                'attr_name': 'warmup_passes',
+                'py_type': int,
+                'model': True,
+            },
+            'Script File': {
+                'type': 'string',
+                'default': constants.DEFAULT_SCRIPT_FILE,
+                'attr_name': 'script_file',
+                'py_type': str,
+                'model': True,
+            },
+            'Fold BatchNorm': {
+                'type': 'check',
+                'default': 'true',
+                'attr_name': 'fold_batch_norms',
+                'py_type': lambda x: x == 'true',
+                'model': True,
+            },
+            'Int8': {
+                'type': 'check',
+                'default': 'false',
+                'attr_name': 'int8',
+                'py_type': lambda x: x == 'true',
+                'model': True,
+            },
+            'Calibration File': {
+                'type': 'string',
+                'default': constants.DEFAULT_CALIBRATION_FILE,
+                'attr_name': 'calibration_file',
+                'py_type': str,
+                'model': True,
+            },
+            'Inference Server': {
+                'type': 'string',
+                'default': constants.DEFAULT_INFERENCE_SERVER,
+                'attr_name': 'inference_server',
+                'py_type': str,
+                'model': True,
+            },
+            'Model Bundle': {
+                'type': 'string',
+                'default': constants.DEFAULT_MODEL_BUNDLE,
+                'attr_name': 'model_bundle',
+                'py_type': str,
+                'model': True,
+            },
+            'Rollout File': {
+                'type': 'string',
+                'default': constants.DEFAULT_ROLLOUT_FILE,
+                'attr_name': 'rollout_file',
+                'py_type': str,
+                'model': True,
+            },
+            'Rollout Mixing': {
+                'type': 'string',
+                'default': DEFAULT_MIXING,
+                'attr_name': 'rollout_mixing',
+                'py_type': float,
+                'model': False,
+            },
+            'Rollout Depth': {
+                'type': 'spin',
+                'default': DEFAULT_ROLLOUT_DEPTH,
+                'min': 1,
+                'max': 1000,
+                'attr_name': 'rollout_depth',
+                'py_type': int,
+                'model': False,
+            },
         }
 
-    def init_model(self, name, path):
-        model = models.create(name)
-        model.load_state_dict(torch.load(os.path.expanduser(path)))
-        return model
-
     def init_models(self):
+        self.wait_for_preload()
+        from ..mcts.networks import (
+            PolicyNetwork,
+            ValueNetwork,
+            Head,
+            SharedNetwork,
+        )
+        from ..mcts.networks.remote import RemoteNetwork
+        from ..learn.models.bundle import Bundle
+        start = time.monotonic()
+        if self.inference_server:
+            # the server owns the models and batches our positions with
+            # the ones of the other engines connected to it
+            network = SharedNetwork(
+                RemoteNetwork(os.path.expanduser(self.inference_server)))
+            self.policy = PolicyNetwork(
+                Head(network, 0), cuda=False, train=False)
+            self.value = ValueNetwork(Head(network, 1), cuda=False)
+        elif self.script_file:
+            # one frozen graph with both heads
+            network = SharedNetwork(load_script(self.script_file))
+            self.policy = PolicyNetwork(
+                Head(network, 0), train=False)
+            self.value = ValueNetwork(Head(network, 1))
+        elif self.model_bundle:
+            bundle = Bundle.load(self.model_bundle, quantized=self.int8)
+            if self.int8 and bundle.quantized is not None:
+                # quantized when the bundle was made
+                network = SharedNetwork(bundle.quantized)
+                self.policy = PolicyNetwork(
+                    Head(network, 0), cuda=False, train=False)
+                self.value = ValueNetwork(Head(network, 1), cuda=False)
+            else:
+                self.use_models(*self.load_models(bundle))
+        else:
+            self.use_models(*self.load_models())
+        self.rollout_policy = self.load_rollout_policy()
+        print_flush('info string loaded models in'
+                    f' {time.monotonic() - start:.3f} seconds')
+        self.warm_up()
+
+    def use_models(self, policy, value):
+        from ..mcts.networks import (
+            PolicyNetwork,
+            ValueNetwork,
+            ZeroValue,
+            RandomPolicy,
+        )
+        cuda = True
+        if self.int8 and self.calibration_file:
+            policy, value = self.quantize_models(policy, value)
+            # quantized models only run on the cpu
+            cuda = False
+        elif self.int8:
+            print_flush('info string Int8 needs a Calibration File')
+        if policy is None:
+            self.policy = RandomPolicy()
+        else:
+            self.policy = PolicyNetwork(policy, cuda=cuda, train=False)
+        if value is None:
+            self.value = ZeroValue()
+        else:
+            self.value = ValueNetwork(value, cuda=cuda)
+
+    def load_models(self, bundle=None):
+        # returns the float policy and value models, None for the random
+        # policy and the zero value
+        from ..learn import models
+        from ..learn.models.bundle import BundleError
+        from ..learn.models.fold import fold_batch_norms
+        from ..learn.models.res import ResNet
+        if bundle is not None:
+            if bundle.config['type'] != 'resnet':
+                raise BundleError(f'{bundle.name} is not a ResNet')
+            tower, policy, value = bundle.create(
+                folded=self.fold_batch_norms)
+            return ResNet(tower, policy), ResNet(tower, value)
         if self.use_resnet:
             tower, policy, value = models.create(self.resnet_name)
-            tower.load_state_dict(
-                torch.load(os.path.expanduser(self.resnet_tower_file)))
-            policy.load_state_dict(
-                torch.load(os.path.expanduser(self.resnet_policy_file)))
-            value.load_state_dict(
-                torch.load(os.path.expanduser(self.resnet_value_file)))
-            self.policy = PolicyNetwork(
-                ResNet(tower, policy), train=False)
-            self.value = ValueNetwork(ResNet(tower, value))
+            load_state_dicts([
+                (tower, self.resnet_tower_file),
+                (policy, self.resnet_policy_file),
+                (value, self.resnet_value_file),
+            ])
+            if self.fold_batch_norms:
+                for module in [tower, policy, value]:
+                    fold_batch_norms(module)
+            return ResNet(tower, policy), ResNet(tower, value)
+        policy = None
+        value = None
+        to_load = []
+        if self.policy_name != constants.RANDOM_POLICY:
+            policy = models.create(self.policy_name)
+            to_load.append((policy, self.policy_file))
+        if self.value_name != constants.ZERO_VALUE:
+            value = models.create(self.value_name)
+            to_load.append((value, self.value_file))
+        load_state_dicts(to_load)
+        if self.fold_batch_norms:
+            for module, _ in to_load:
+                fold_batch_norms(module)
+        return policy, value
+
+    def load_rollout_policy(self):
+        from ..learn import models
+        from ..mcts.networks.rollout import RolloutPolicy
+        if not self.rollout_file:
+            # uniformly random moves
+            return RolloutPolicy()
+        model = models.create(constants.DEFAULT_ROLLOUT)
+        load_state_dicts([(model, self.rollout_file)])
+        return RolloutPolicy(model)
+
+    def quantize_models(self, policy, value):
+        from ..learn.data.chess_dataset import ChessDataset
+        from ..learn.models.quantize import (
+            DEFAULT_CALIBRATION_POSITIONS,
+            calibration_batches,
+            quantize,
+        )
+        from ..learn.models.res import Network, ResNet
+        from ..mcts.networks import Head, SharedNetwork
+        start = time.monotonic()
+        batches = calibration_batches(ChessDataset(
+            os.path.expanduser(self.calibration_file),
+            limit=DEFAULT_CALIBRATION_POSITIONS,
+        ))
+        if isinstance(policy, ResNet) and isinstance(value, ResNet) and \
+                policy.tower is value.tower:
+            # one int8 copy of the tower, calibrated once, that evaluates
+            # the policy and the value of a playout in one batch
+            network = SharedNetwork(quantize(
+                Network(policy.tower, policy.head, value.head), batches))
+            policy, value = Head(network, 0), Head(network, 1)
         else:
-            if self.value_name == constants.ZERO_VALUE:
-                self.value = ZeroValue()
-            else:
-                self.value = self.init_model(self.value_name, self.value_file)
-                self.value = ValueNetwork(self.value)
-            if self.policy_name == constants.RANDOM_POLICY:
-                self.policy = RandomPolicy()
-            else:
-                self.policy = self.init_model(
-                    self.policy_name, self.policy_file)
-                self.policy = PolicyNetwork(self.policy, train=False)
+            if policy is not None:
+                policy = quantize(policy, batches)
+            if value is not None:
+                value = quantize(value, batches)
+        print_flush('info string quantized models in'
+                    f' {time.monotonic() - start:.3f} seconds')
+        return policy, value
+
+    def warm_up(self):
+        # the first evaluations pay for lazy initialization in torch and
+        # for growing the allocator, and a frozen graph is specialized for
+        # each shape of input it sees, so get them out of the way before
+        # the first go. a playout from a new root evaluates the positions
+        # in the batches the search will.
+        if not self.warmup_passes:
+            return
+        start = time.monotonic()
+        for _ in range(self.warmup_passes):
+            MCTS(
+                Node(),
+                self.value,
+                self.policy,
+                rollout_policy=self.rollout_policy,
+                mixing=self.rollout_mixing,
+                rollout_depth=self.rollout_depth,
+                reclaimer=self.reclaimer,
+            ).playout()
+        print_flush(f'info string {self.warmup_passes} warm-up passes in'
+                    f' {time.monotonic() - start:.3f} seconds')
 
     def init_engine(self, board=None):
         if board:
             root = Node(board=board)
         else:
             root = Node()
+        if self.engine is not None:
+            old = [self.engine.root, self.engine.previous_root]
+            self.reclaimer.reclaim(n for n in old if n is not None)
         self.engine = MCTS(
             root,
             self.value,
             self.policy,
             self.confidence,
+            seed=self.seed,
+            info_interval=self.info_interval / 1000,
+            show_wdl=self.show_wdl,
+            max_nodes=self.hash * 2**20 // NODE_BYTES,
+            reclaimer=self.reclaimer,
+            rollout_policy=self.rollout_policy,
+            mixing=self.rollout_mixing,
+            rollout_depth=self.rollout_depth,
+            profile=self.profile,
         )
-        self.time_manager = TimeManager()
+        self.time_manager = TimeManager(move_overhead=self.move_overhead)
 
     def new_position(self, fen, moves):
         board = chess.Board(fen=fen)
         for uci in moves:
+            move = chess.Move.from_uci(uci)
+            if board == self.engine.previous_board() and \
+                    not self.engine.advanced_by(move):
+                # we pondered on the wrong reply, but the tree of the
+                # position before it is still around
+                self.engine.rewind_root()
             if board == self.engine.root.board:
-                self.engine.advance_root(chess.Move.from_uci(uci))
-            board.push_uci(uci)
+                self.engine.advance_root(move)
+            board.push(move)
         if board != self.engine.root.board:
             self.init_engine(board=board)
 
     def go(self, args):
-        duration = self.time_manager.handle(self.engine.root.board.turn, args)
-        if not duration:
-            self.unknown_handler(args)
+        data = parse_time_control(args)
+        self.pondering = constants.TC_PONDER in data
+        if self.pondering:
+            # search the expected reply until ponderhit or stop
+            self.ponder_args = args
+            self.start_search(self.search, SearchLimits())
+            return
+        limits = SearchLimits()
+        clock = self.time_manager.create_clock(
+            self.engine.root.board.turn, data)
+        if clock is not None:
+            limits.duration = clock.maximum
+            limits.clock = clock
+            if clock.optimum == clock.maximum:
+                print_flush(f'info string search for {clock.maximum} seconds')
+            else:
+                print_flush(f'info string search for {clock.optimum} to'
+                            f' {clock.maximum} seconds')
+        if constants.TC_NODES in data:
+            # there's no move to play without at least one playout
+            limits.nodes = max(1, int(data[constants.TC_NODES]))
+        if constants.TC_DEPTH in data:
+            limits.depth = int(data[constants.TC_DEPTH])
+        self.start_search(self.search, limits)
+
+    def search(self, limits):
+        self.engine.search(limits, stop_event=self.stop_event)
+        if limits.infinite():
+            # bestmove is only allowed after stop when searching infinitely
+            self.stop_event.wait()
+        if not self.emit_bestmove:
             return
-        print_flush(f'info string search for {duration} seconds')
-        self.engine.search(duration)
         move = self.engine.get_move()
-        print_flush(f'bestmove {move.uci()}')
+        ponder_move = self.engine.get_ponder_move()
+        if ponder_move:
+            print_flush(f'bestmove {move.uci()} ponder {ponder_move.uci()}')
+        else:
+            print_flush(f'bestmove {move.uci()}')
+
+    def bench(self, args):
+        # not part of UCI: bench [nodes] [epd file]
+        parts = args.split(maxsplit=1)
+        try:
+            nodes = int(parts[0]) if parts else constants.DEFAULT_BENCH_NODES
+        except ValueError:
+            self.unknown_handler(f'bench {args}')
+            return
+        if nodes < 1:
+            print_flush('info string bench needs at least 1 node')
+            return
+        path = parts[1] if len(parts) > 1 else constants.DEFAULT_BENCH_FILE
+        try:
+            positions = read_epd(path)
+        except (OSError, ValueError) as e:
+            print_flush(f'info string cannot read {path}: {e}')
+            return
+        self.stop_search()
+        self.apply_options()
+        result = bench(self, positions, nodes)
+        result.print()
+        # the positions searched have nothing to do with the game
+        self.init_engine()
+        return result
+
+    def stop(self, args):
+        self.pondering = False
+        super().stop(args)
+
+    def ponderhit(self, args):
+        if not self.pondering:
+            return
+        # the opponent played the expected move, so keep searching the
+        # same tree, this time with the clock running
+        self.pondering = False
+        self.stop_search(emit_bestmove=False)
+        self.go(' '.join(
+            token for token in self.ponder_args.split()
+            if token != constants.TC_PONDER
+        ))
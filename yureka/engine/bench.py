@@ -0,0 +1,89 @@
+import attr
+import chess
+import os
+import time
+
+from ..common.utils import print_flush
+from ..mcts import SearchLimits
+
+
+def read_epd(path):
+    # (board, operations) of every position in the EPD file
+    positions = []
+    with open(os.path.expanduser(path)) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                positions.append(chess.Board.from_epd(line))
+    return positions
+
+
+def is_solved(move, operations):
+    # None if the position has no best or avoid moves to check against
+    if 'bm' in operations:
+        return move in operations['bm']
+    if 'am' in operations:
+        return move not in operations['am']
+    return None
+
+
+@attr.s
+class BenchResult():
+    positions = attr.ib(default=0)
+    nodes = attr.ib(default=0)
+    seconds = attr.ib(default=0.0)
+    # positions with a bm or am, and how many of those were solved
+    tested = attr.ib(default=0)
+    solved = attr.ib(default=0)
+
+    def nps(self):
+        if not self.seconds:
+            return 0
+        return self.nodes / self.seconds
+
+    def time_per_position(self):
+        if not self.positions:
+            return 0
+        return self.seconds / self.positions
+
+    def solved_rate(self):
+        if not self.tested:
+            return 0
+        return self.solved / self.tested
+
+    def print(self):
+        print_flush(f'Positions: {self.positions}')
+        print_flush(f'Nodes: {self.nodes}')
+        print_flush(f'Time (ms): {round(self.seconds * 1000)}')
+        print_flush(f'Nodes/second: {round(self.nps())}')
+        print_flush(
+            f'Time per position (ms): {self.time_per_position() * 1000:.1f}')
+        if self.tested:
+            print_flush(f'Solved: {self.solved}/{self.tested}'
+                        f' ({self.solved_rate():.1%})')
+
+
+def bench(engine, positions, nodes):
+    """Searches every (board, operations) of positions for nodes with
+    engine, a ready UCIMCTSEngine, starting each from an empty tree.
+    """
+    result = BenchResult()
+    for i, (board, operations) in enumerate(positions, 1):
+        engine.init_engine(board=board)
+        start = time.monotonic()
+        engine.engine.search(SearchLimits(nodes=nodes))
+        seconds = time.monotonic() - start
+        move = engine.engine.get_move()
+        solved = is_solved(move, operations)
+        result.positions += 1
+        result.nodes += engine.engine.nodes
+        result.seconds += seconds
+        name = operations.get('id', board.epd())
+        line = f'info string bench {i}/{len(positions)} {name}' \
+            f' bestmove {move.uci()}'
+        if solved is not None:
+            result.tested += 1
+            result.solved += solved
+            line += ' solved' if solved else ' failed'
+        print_flush(line)
+    return result
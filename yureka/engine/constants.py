@@ -8,6 +8,10 @@ TC_WINC = 'winc'
 TC_BINC = 'binc'
 TC_MOVESTOGO = 'movestogo'
 TC_MOVETIME = 'movetime'
+TC_INFINITE = 'infinite'
+TC_PONDER = 'ponder'
+TC_NODES = 'nodes'
+TC_DEPTH = 'depth'
 TC_KEYS = [
     TC_WTIME,
     TC_BTIME,
@@ -16,8 +20,27 @@ TC_KEYS = [
     TC_MOVESTOGO,
     TC_MOVETIME,
 ]
+TC_LIMITS = [
+    TC_NODES,
+    TC_DEPTH,
+]
+TC_FLAGS = [
+    TC_INFINITE,
+    TC_PONDER,
+]
 TC_OPPONENT_TIME_RATIO = 0.5
+# the time budget is the hard maximum, we aim to spend this much of it
+TC_OPTIMUM_RATIO = 0.6
+# spend more time if the best move changed within this fraction of the
+# optimum time
+TC_UNSTABLE_WINDOW = 0.2
+TC_UNSTABLE_EXTENSION = 1.5
+# or if the best move doesn't have this many times the visits of the
+# second best
+TC_FLAT_RATIO = 1.25
+TC_FLAT_EXTENSION = 1.3
 TC_SUDDEN_DEATH_THRESHOLD = 30000  # 30 seconds left
+DEFAULT_MOVE_OVERHEAD = 50  # milliseconds
 
 root_path = os.path.join(
     os.path.dirname(
@@ -32,7 +55,26 @@ DEFAULT_MODEL_FILE = os.path.join(
     'Policy.v2_2018-06-19_21_08_58_19.model',
 )
 
+# frozen TorchScript model with both heads, used instead of the model
+# files when set. see scripts/save_as_torch_script.py
+DEFAULT_SCRIPT_FILE = ''
+
 # UCI MCTS Engine
+# socket of a yureka_server to evaluate positions on instead of loading
+# the models
+DEFAULT_INFERENCE_SERVER = ''
+# single file with the architecture and weights of a ResNet, used instead
+# of the model files when set. see yureka/learn/models/bundle.py
+DEFAULT_MODEL_BUNDLE = ''
+# LinearPolicy that picks the moves of rollouts, uniformly random ones
+# when the Rollout File isn't set. rollouts are only played with a
+# Rollout Mixing above 0.
+DEFAULT_ROLLOUT = 'Rollout.v2'
+DEFAULT_ROLLOUT_FILE = ''
+# csv file of positions the models are calibrated on when quantized with
+# Int8
+DEFAULT_CALIBRATION_FILE = ''
+DEFAULT_WARMUP_PASSES = 2
 RANDOM_POLICY = 'random'
 DEFAULT_VALUE = 'Value.v2'
 DEFAULT_VALUE_FILE = os.path.join(
@@ -68,3 +110,13 @@ DEFAULT_RESNET_POLICY_FILE = os.path.join(
     'ResNet.v1',
     'PolicyHead_2018-06-26_17_36_08_11.model',
 )
+
+# bench, which searches every position of an EPD file for a fixed number
+# of nodes
+DEFAULT_BENCH_NODES = 200
+DEFAULT_BENCH_FILE = os.path.join(
+    root_path,
+    'yureka',
+    'engine',
+    'bench.epd',
+)
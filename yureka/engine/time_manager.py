@@ -9,16 +9,71 @@ from .constants import (
     TC_WINC,
     TC_BINC,
     TC_MOVESTOGO,
+    TC_INFINITE,
     TC_KEYS,
+    TC_LIMITS,
+    TC_FLAGS,
     TC_SUDDEN_DEATH_THRESHOLD,
     TC_OPPONENT_TIME_RATIO,
+    TC_OPTIMUM_RATIO,
+    TC_UNSTABLE_WINDOW,
+    TC_UNSTABLE_EXTENSION,
+    TC_FLAT_RATIO,
+    TC_FLAT_EXTENSION,
 )
 
 
+@attr.s
+class SearchClock():
+    """Decides when to stop a search, somewhere between the optimum and
+    the maximum time, based on how the root visits are distributed.
+    """
+    optimum = attr.ib()
+    maximum = attr.ib()
+
+    def __attrs_post_init__(self):
+        self.best_move = None
+        self.best_move_changed = 0
+
+    def budget(self, first, second, elapsed):
+        budget = self.optimum
+        if elapsed - self.best_move_changed < \
+                self.optimum * TC_UNSTABLE_WINDOW:
+            budget *= TC_UNSTABLE_EXTENSION
+        if first < second * TC_FLAT_RATIO:
+            budget *= TC_FLAT_EXTENSION
+        return min(budget, self.maximum)
+
+    def time_up(self, mcts, elapsed):
+        if elapsed >= self.maximum:
+            return True
+        if self.optimum >= self.maximum or not mcts.root.children:
+            return False
+        best_move = mcts.get_move()
+        if best_move != self.best_move:
+            self.best_move = best_move
+            self.best_move_changed = elapsed
+        visits = sorted(
+            (c.visit for c in mcts.root.children.values()),
+            reverse=True,
+        )
+        first = visits[0]
+        second = visits[1] if len(visits) > 1 else 0
+        budget = self.budget(first, second, elapsed)
+        if elapsed >= budget:
+            return True
+        # stop if the second best move can't catch up even if it gets all
+        # the playouts we can still do
+        nps = mcts.nodes / elapsed if elapsed > 0 else math.inf
+        return first - second > nps * (budget - elapsed)
+
+
 @attr.s
 class TimeManager():
     total_time = attr.ib(default=None)
     total_moves = attr.ib(default=None)
+    # milliseconds lost to I/O and the like on every move
+    move_overhead = attr.ib(default=0)
 
     def handle_movetime(self, data):
         return data[TC_MOVETIME]
@@ -99,7 +154,19 @@ class TimeManager():
         data = parse_time_control(args)
         return self.calculate_duration(color, data)
 
+    def create_clock(self, color, data):
+        maximum = self.calculate_duration(color, data)
+        if math.isinf(maximum):
+            return None
+        if TC_MOVETIME in data:
+            # asked to search for exactly this long
+            return SearchClock(maximum, maximum)
+        return SearchClock(maximum * TC_OPTIMUM_RATIO, maximum)
+
     def calculate_duration(self, color, data):
+        if TC_INFINITE in data or not any(k in data for k in TC_KEYS):
+            # search until told to stop
+            return math.inf
         if TC_MOVETIME in data:
             duration = self.handle_movetime(data)
         elif TC_MOVESTOGO in data:
@@ -108,7 +175,7 @@ class TimeManager():
             duration = self.handle_fischer(color, data)
         else:
             duration = self.handle_sudden_death(color, data)
-        return max(duration, 10) / 1000
+        return max(duration - self.move_overhead, 10) / 1000
 
 
 def parse_time_control(args):
@@ -116,6 +183,8 @@ def parse_time_control(args):
     args = args.split()
     for i in range(len(args)):
         token = args[i]
-        if token in TC_KEYS:
+        if token in TC_KEYS or token in TC_LIMITS:
             data[token] = float(args[i+1])
+        elif token in TC_FLAGS:
+            data[token] = True
     return data
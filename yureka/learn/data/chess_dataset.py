@@ -1,19 +1,38 @@
 import attr
 import chess
-import pandas as pd
 import numpy as np
 import torch
-import itertools
-import lmdb
 
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, ConcatDataset
+from torch.utils.data.dataloader import default_collate
 
 from . import move_translator
 from .board_data import BOARD_SIZE
 from .bresenham import get_line
 
 
-SIZE = (1, ) + BOARD_SIZE
+# (rank, file) of each square name, and the plane of each piece symbol
+SQUARE_COORDS = {
+    name: divmod(move_translator.square_name_to_square(name), BOARD_SIZE[0])
+    for name in chess.SQUARE_NAMES
+}
+PIECE_PLANES = {
+    symbol: chess.Piece.from_symbol(symbol).piece_type - chess.PAWN
+    for symbol in chess.PIECE_SYMBOLS[1:] + [
+        s.upper() for s in chess.PIECE_SYMBOLS[1:]]
+}
+# bump whenever the input planes change, so that model bundles trained on
+# the old ones aren't loaded
+INPUT_VERSION = 1
+SCALAR_COLUMNS = [
+    'color',
+    'move_count',
+    'b_kingside_castling',
+    'b_queenside_castling',
+    'w_kingside_castling',
+    'w_queenside_castling',
+    'no_progress',
+]
 
 
 @attr.s
@@ -49,6 +68,7 @@ class LMDBChessDataset(Dataset):
     limit = attr.ib(default=None)
 
     def __attrs_post_init__(self):
+        import lmdb
         self.env = lmdb.open(self.lmdb_name, map_size=2e11)
         self.txn = self.env.begin()
         self.cursor = self.txn.cursor()
@@ -59,12 +79,20 @@ class LMDBChessDataset(Dataset):
         return self.env.stat()['entries'] - self.offset
 
     def __getitem__(self, index):
+        return data_from_row(self.read_row(index))
+
+    def __getitems__(self, indices):
+        import pandas as pd
+        return data_from_rows(pd.DataFrame(
+            [self.read_row(index) for index in indices]))
+
+    def read_row(self, index):
+        import pandas as pd
         index = index + self.offset
-        row = pd.read_msgpack(
+        return pd.read_msgpack(
             self.cursor.get(f'{index}'.encode()),
             encoding='ascii'
         )
-        return data_from_row(row)
 
     def __del__(self):
         self.cursor.close()
@@ -86,6 +114,58 @@ def data_from_row(row):
     )
 
 
+def data_from_rows(rows):
+    value = []
+    if 'value' in rows:
+        value = torch.from_numpy(
+            rows['value'].values.astype(np.float32)).view(-1, 1)
+    move = []
+    if 'move' in rows:
+        move = torch.LongTensor([
+            move_translator.get_engine_move_index(m) for m in rows['move']])
+    return (
+        get_tensors_from_rows(rows),
+        move,
+        value,
+    )
+
+
+def collate_batch(batch):
+    if isinstance(batch, tuple):
+        # already collated by __getitems__
+        return batch
+    return default_collate(batch)
+
+
+class ConcatChessDataset(ConcatDataset):
+    def __getitems__(self, indices):
+        indices = np.asarray(indices)
+        dataset_indices = np.searchsorted(
+            self.cumulative_sizes, indices, side='right')
+        batches = []
+        positions = []
+        for d in np.unique(dataset_indices):
+            mask = dataset_indices == d
+            sample_indices = indices[mask]
+            if d > 0:
+                sample_indices = sample_indices - self.cumulative_sizes[d - 1]
+            dataset = self.datasets[d]
+            if hasattr(dataset, '__getitems__'):
+                batch = dataset.__getitems__(sample_indices.tolist())
+            else:
+                batch = default_collate(
+                    [dataset[i] for i in sample_indices.tolist()])
+            batches.append(batch)
+            positions.append(np.flatnonzero(mask))
+        if len(batches) == 1:
+            return batches[0]
+
+        # put the rows back in the order they were asked for
+        order = torch.from_numpy(np.argsort(np.concatenate(positions)))
+        return tuple(
+            torch.cat(parts)[order] for parts in zip(*batches))
+
+
 @attr.s
 class ChessDataset(Dataset):
     data_file = attr.ib()
@@ -93,6 +173,7 @@ class ChessDataset(Dataset):
     limit = attr.ib(default=None)
 
     def __attrs_post_init__(self):
+        import pandas as pd
         self.df = pd.read_csv(self.data_file, keep_default_na=False)
         self.df = self.df[self.offset:self.limit]
 
@@ -103,58 +184,115 @@ class ChessDataset(Dataset):
         row = self.df.iloc[index]
         return data_from_row(row)
 
+    def __getitems__(self, indices):
+        return data_from_rows(self.df.iloc[indices])
+
+
+@attr.s
+class TeacherDataset(Dataset):
+    """Adds a teacher's precomputed targets, the indices and probabilities
+    of its top moves and its values, to the rows of dataset. offset is the
+    row of the targets the first row of dataset is.
+    """
+    dataset = attr.ib()
+    targets = attr.ib()
+    offset = attr.ib(default=0)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        return self.dataset[index] + self.get_targets(self.offset + index)
+
+    def __getitems__(self, indices):
+        if hasattr(self.dataset, '__getitems__'):
+            batch = self.dataset.__getitems__(indices)
+        else:
+            batch = default_collate([self.dataset[i] for i in indices])
+        rows = torch.tensor(indices, dtype=torch.long) + self.offset
+        return tuple(batch) + self.get_targets(rows)
+
+    def get_targets(self, rows):
+        return (
+            self.targets['indices'][rows].long(),
+            self.targets['probs'][rows].float(),
+            self.targets['values'][rows].float(),
+        )
+
+
+def get_history(rows):
+    # number of past positions in a row, or in every row of a DataFrame
+    history = 0
+    while f'white_square_piece_{history}' in rows:
+        history += 1
+    return history
+
+
+def get_planes(history):
+    return 14 * history + len(SCALAR_COLUMNS)
+
 
 def get_tensor_from_row(row):
-    return torch.from_numpy(np.vstack((
-        get_board_data(row),
-        np.full(SIZE, row['color']),
-        np.full(SIZE, row['move_count']),
-        np.full(SIZE, row['b_kingside_castling']),
-        np.full(SIZE, row['b_queenside_castling']),
-        np.full(SIZE, row['w_kingside_castling']),
-        np.full(SIZE, row['w_queenside_castling']),
-        np.full(SIZE, row['no_progress']),
-    ))).float()
-
-
-def get_square_piece_data(data):
-    board_data = np.full(
-        (len(chess.PIECE_TYPES), BOARD_SIZE[0] * BOARD_SIZE[1]), 0)
-
-    if data:
-        for sq_symbol in data.split(','):
-            sq, symbol = sq_symbol.split('-')
-            piece = chess.Piece.from_symbol(symbol)
-            square = move_translator.square_name_to_square(sq)
-            board_data[piece.piece_type - chess.PAWN][square] = 1
-
-    return board_data.reshape((len(chess.PIECE_TYPES), ) + BOARD_SIZE)
-
-
-def get_board_data(row):
-    white_data = []
-    black_data = []
-    rep_2_data = []
-    rep_3_data = []
-    for i in itertools.count():
-        try:
-            white_data.append(
-                get_square_piece_data(row['white_square_piece_%d' % i]))
-            black_data.append(
-                get_square_piece_data(row['black_square_piece_%d' % i]))
-            rep_2_data.append(np.full(SIZE, row['rep_2_%d' % i]))
-            rep_3_data.append(np.full(SIZE, row['rep_3_%d' % i]))
-        except KeyError:
-            break
-
-    white_data = np.vstack(white_data)
-    black_data = np.vstack(black_data)
-    rep_2_data = np.vstack(rep_2_data)
-    rep_3_data = np.vstack(rep_3_data)
-
-    return np.vstack((
-        black_data,
-        white_data,
-        rep_2_data,
-        rep_3_data,
-    ))
+    planes = get_planes(get_history(row))
+    out = np.empty((planes, ) + BOARD_SIZE, dtype=np.float32)
+    return torch.from_numpy(write_planes_from_row(row, out))
+
+
+def write_planes_from_row(row, out):
+    """Writes the input planes of row into out, a float32 array of shape
+    (planes, 8, 8), and returns it.
+
+    The planes are laid out like get_tensors_from_rows does, and nothing
+    is allocated, so out can be a slot of a reusable batch.
+    """
+    history = (out.shape[0] - len(SCALAR_COLUMNS)) // 14
+    out.fill(0)
+    for i in range(history):
+        for color, offset in (('black', 6 * i), ('white', 6 * (history + i))):
+            data = row[f'{color}_square_piece_{i}']
+            if not data:
+                continue
+            for sq_symbol in data.split(','):
+                sq, symbol = sq_symbol.split('-')
+                rank, file = SQUARE_COORDS[sq]
+                out[offset + PIECE_PLANES[symbol], rank, file] = 1
+        out[12 * history + i] = row[f'rep_2_{i}']
+        out[13 * history + i] = row[f'rep_3_{i}']
+    for i, column in enumerate(SCALAR_COLUMNS):
+        out[14 * history + i] = row[column]
+    return out
+
+
+def get_tensors_from_rows(rows):
+    # decodes a whole batch at once. the planes are laid out exactly like
+    # get_tensor_from_row does for a single row
+    history = get_history(rows)
+    num_rows = len(rows)
+    planes = get_planes(history)
+    out = np.zeros((num_rows, planes) + BOARD_SIZE, dtype=np.float32)
+
+    row_indices = []
+    plane_indices = []
+    square_coords = []
+    for i in range(history):
+        for color, offset in (('black', 6 * i), ('white', 6 * (history + i))):
+            column = rows[f'{color}_square_piece_{i}'].values
+            for n, data in enumerate(column):
+                if not data:
+                    continue
+                for sq_symbol in data.split(','):
+                    sq, symbol = sq_symbol.split('-')
+                    row_indices.append(n)
+                    plane_indices.append(offset + PIECE_PLANES[symbol])
+                    square_coords.append(SQUARE_COORDS[sq])
+        out[:, 12 * history + i] = rows[f'rep_2_{i}'].values.reshape(
+            -1, 1, 1)
+        out[:, 13 * history + i] = rows[f'rep_3_{i}'].values.reshape(
+            -1, 1, 1)
+    if row_indices:
+        ranks, files = zip(*square_coords)
+        out[row_indices, plane_indices, ranks, files] = 1
+
+    for i, column in enumerate(SCALAR_COLUMNS):
+        out[:, 14 * history + i] = rows[column].values.reshape(-1, 1, 1)
+    return torch.from_numpy(out)
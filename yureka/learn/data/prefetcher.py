@@ -0,0 +1,97 @@
+import attr
+import queue
+import threading
+import torch
+
+
+STOP = object()
+
+
+@attr.s
+class Prefetcher():
+    """Iterates a DataLoader on a background thread and keeps the next
+    ``size`` batches ready on ``device``.
+    """
+    loader = attr.ib()
+    device = attr.ib()
+    size = attr.ib(default=2)
+    memory_format = attr.ib(default=torch.contiguous_format)
+
+    def __attrs_post_init__(self):
+        self.cuda = self.device.type == 'cuda'
+
+    @property
+    def sampler(self):
+        return self.loader.sampler
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.size)
+        stopped = threading.Event()
+        thread = threading.Thread(
+            target=self.load,
+            args=(batches, stopped),
+            daemon=True,
+        )
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is STOP:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                batch, event = item
+                if event is not None:
+                    current_stream = torch.cuda.current_stream()
+                    current_stream.wait_event(event)
+                    for tensor in batch:
+                        tensor.record_stream(current_stream)
+                yield batch
+        finally:
+            stopped.set()
+            thread.join()
+
+    def load(self, batches, stopped):
+        stream = torch.cuda.Stream(self.device) if self.cuda else None
+        try:
+            for batch in self.loader:
+                event = None
+                if stream is not None:
+                    with torch.cuda.stream(stream):
+                        batch = self.transfer(batch)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                else:
+                    batch = self.transfer(batch)
+                if not self.put(batches, stopped, (batch, event)):
+                    return
+        except Exception as e:
+            self.put(batches, stopped, e)
+            return
+        self.put(batches, stopped, STOP)
+
+    def put(self, batches, stopped, item):
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def transfer(self, batch):
+        # the inputs come first, followed by the labels
+        inputs, *labels = batch
+        # the loader pins its batches when training on cuda, so these
+        # copies don't block
+        return (
+            inputs.to(
+                self.device,
+                non_blocking=True,
+                memory_format=self.memory_format,
+            ),
+            *(label.to(self.device, non_blocking=True) for label in labels),
+        )
@@ -0,0 +1,25 @@
+import attr
+import itertools
+
+from torch.utils.data import Sampler
+
+
+@attr.s
+class ResumableSampler(Sampler):
+    """Skips the first ``start`` indices of the next pass over the wrapped
+    sampler, so that an epoch can be resumed without loading the rows that
+    were already trained on.
+    """
+    sampler = attr.ib()
+    start = attr.ib(default=0)
+
+    def __iter__(self):
+        start, self.start = self.start, 0
+        return itertools.islice(iter(self.sampler), start, None)
+
+    def __len__(self):
+        return len(self.sampler) - self.start
+
+    def set_epoch(self, epoch):
+        if hasattr(self.sampler, 'set_epoch'):
+            self.sampler.set_epoch(epoch)
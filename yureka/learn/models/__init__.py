@@ -2,6 +2,7 @@ import torch.nn as nn
 
 from . import res
 from .cnn import Policy, Value
+from .linear import LinearPolicy
 
 
 cnn_settings = {
@@ -53,6 +54,12 @@ cnn_settings = {
         'args': (23, 64, 1),
         'kwargs': {},
     },
+    # linear in the 12 piece planes of the current position
+    'Rollout.v2': {
+        'class': LinearPolicy,
+        'args': (12, ),
+        'kwargs': {},
+    },
 }
 
 resnet_settings = {
@@ -88,19 +95,87 @@ resnet_settings = {
         'value_hidden': 256,
         'value_out_channels': 1,
     },
+    # inverted residuals with depthwise convs, MobileNetV2 style
+    'MobileResNet.v0': {
+        'dropout': False,
+        'in_channels': 21,
+        'conv_block_out_channels': 64,
+        'conv_block_kernel': 3,
+        'conv_block_padding': 1,
+        'conv_block_stride': 1,
+        'res_block_type': 'separable',
+        'res_block_out_channels': 64,
+        'res_block_hidden_channels': 256,
+        'res_block_kernel': 3,
+        'res_block_padding': 1,
+        'res_block_stride': 1,
+        'res_blocks': 6,
+        'policy_out_channels': 8,
+        'value_hidden': 64,
+        'value_out_channels': 1,
+    },
+    # ResNet-50 style bottlenecks
+    'BottleneckResNet.v0': {
+        'dropout': False,
+        'in_channels': 21,
+        'conv_block_out_channels': 128,
+        'conv_block_kernel': 3,
+        'conv_block_padding': 1,
+        'conv_block_stride': 1,
+        'res_block_type': 'bottleneck',
+        'res_block_out_channels': 128,
+        'res_block_hidden_channels': 32,
+        'res_block_kernel': 3,
+        'res_block_padding': 1,
+        'res_block_stride': 1,
+        'res_blocks': 8,
+        'policy_out_channels': 8,
+        'value_hidden': 128,
+        'value_out_channels': 1,
+    },
 }
 
 
-def create(model_name):
+CNN_CLASSES = {
+    setting['class'].__name__: setting['class']
+    for setting in cnn_settings.values()
+}
+
+
+def get_config(model_name):
+    # everything needed to build model_name, without the settings above.
+    # model bundles carry it so they can be loaded under any name.
     if model_name in cnn_settings:
-        model_setting = cnn_settings[model_name]
-        return model_setting['class'](
-            model_name,
-            *model_setting['args'],
-            **model_setting['kwargs'],
-        )
+        setting = cnn_settings[model_name]
+        return {
+            'name': model_name,
+            'type': 'cnn',
+            'class': setting['class'].__name__,
+            'args': list(setting['args']),
+            'kwargs': dict(setting['kwargs']),
+        }
     elif model_name in resnet_settings:
-        setting = resnet_settings[model_name]
+        return {
+            'name': model_name,
+            'type': 'resnet',
+            **resnet_settings[model_name],
+        }
+    raise ValueError(f'Unknown model: {model_name}')
+
+
+def create(model_name):
+    return create_from_config(get_config(model_name))
+
+
+def create_from_config(config):
+    if config['type'] == 'cnn':
+        return CNN_CLASSES[config['class']](
+            config['name'],
+            *config['args'],
+            **config['kwargs'],
+        )
+    elif config['type'] == 'resnet':
+        setting = config
         tower = [
             res.ConvBlock(
                 setting['in_channels'],
@@ -111,13 +186,7 @@ def create(model_name):
             ),
         ]
         tower += [
-            res.ResBlock(
-                setting['conv_block_out_channels'],
-                setting['res_block_out_channels'],
-                setting['res_block_kernel'],
-                padding=setting['res_block_padding'],
-                stride=setting['res_block_stride']
-            ) for _ in range(setting['res_blocks'])
+            create_res_block(setting) for _ in range(setting['res_blocks'])
         ]
         if setting['dropout']:
             tower.append(nn.Dropout2d())
@@ -134,3 +203,23 @@ def create(model_name):
         )
 
         return tower, policy, value
+
+
+def create_res_block(setting):
+    block_type = setting.get('res_block_type', 'basic')
+    if block_type == 'basic':
+        return res.ResBlock(
+            setting['conv_block_out_channels'],
+            setting['res_block_out_channels'],
+            setting['res_block_kernel'],
+            padding=setting['res_block_padding'],
+            stride=setting['res_block_stride']
+        )
+    return res.BottleneckBlock(
+        setting['res_block_out_channels'],
+        setting['res_block_hidden_channels'],
+        setting['res_block_kernel'],
+        padding=setting['res_block_padding'],
+        stride=setting['res_block_stride'],
+        depthwise=block_type == 'separable',
+    )
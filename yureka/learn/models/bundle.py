@@ -0,0 +1,187 @@
+import argparse
+import attr
+import copy
+import io
+import os
+import torch
+
+from ..data.chess_dataset import INPUT_VERSION
+from .fold import fold_batch_norms
+from . import get_config, create_from_config
+
+
+BUNDLE_FORMAT = 1
+RESNET_MODULES = ('tower', 'policy', 'value')
+CNN_MODULES = ('model', )
+
+
+class BundleError(Exception):
+    pass
+
+
+def module_names(config):
+    if config['type'] == 'resnet':
+        return RESNET_MODULES
+    return CNN_MODULES
+
+
+@attr.s
+class Bundle():
+    """Everything needed to run a model, in one file.
+
+    The architecture config from models.get_config, the weights of every
+    module, and the version of the input planes they were trained on.
+    Optionally the weights with the batch norms folded into the convs,
+    and an int8 TorchScript model with both heads.
+    """
+    config = attr.ib()
+    state_dicts = attr.ib()
+    input_version = attr.ib(default=INPUT_VERSION)
+    folded = attr.ib(default=None)
+    quantized = attr.ib(default=None)
+
+    @classmethod
+    def from_modules(cls, model_name, modules, fold=True):
+        if not isinstance(modules, tuple):
+            modules = (modules, )
+        config = get_config(model_name)
+        names = module_names(config)
+        bundle = cls(
+            config,
+            {n: m.state_dict() for n, m in zip(names, modules)},
+        )
+        if fold:
+            bundle.folded = {
+                n: fold_batch_norms(
+                    copy.deepcopy(m).eval(), keep_batch_norms=True,
+                ).state_dict()
+                for n, m in zip(names, modules)
+            }
+        return bundle
+
+    @property
+    def name(self):
+        return self.config['name']
+
+    def create(self, folded=False):
+        """The modules of the model, as models.create returns them, with
+        the weights of the bundle, which they share. The folded weights
+        are only good for eval.
+        """
+        state_dicts = self.state_dicts
+        if folded and self.folded is not None:
+            state_dicts = self.folded
+        # no point initializing weights that are about to be replaced.
+        # the modules take the loaded tensors as they are, so a
+        # memory-mapped bundle isn't copied.
+        with torch.device('meta'):
+            modules = create_from_config(self.config)
+        if not isinstance(modules, tuple):
+            modules = (modules, )
+        for name, module in zip(module_names(self.config), modules):
+            module.load_state_dict(state_dicts[name], assign=True)
+        if folded and self.folded is None:
+            for module in modules:
+                fold_batch_norms(module.eval())
+        if len(modules) == 1:
+            return modules[0]
+        return modules
+
+    def save(self, path):
+        data = {
+            'format': BUNDLE_FORMAT,
+            'config': self.config,
+            'input_version': self.input_version,
+            'state_dicts': self.state_dicts,
+        }
+        if self.folded is not None:
+            data['folded'] = self.folded
+        if self.quantized is not None:
+            # as a tensor, so that it's memory-mapped with the rest
+            buffer = io.BytesIO()
+            torch.jit.save(self.quantized, buffer)
+            data['quantized'] = torch.frombuffer(
+                bytearray(buffer.getvalue()), dtype=torch.uint8)
+        torch.save(data, path)
+
+    @classmethod
+    def load(cls, path, quantized=True):
+        # the int8 model takes a while to deserialize, so skip it unless
+        # it's going to be used
+        path = os.path.expanduser(path)
+        # one memory-mapped read, only the weights that are used get paged
+        # in
+        data = torch.load(path, map_location='cpu', mmap=True)
+        if not isinstance(data, dict) or \
+                data.get('format') != BUNDLE_FORMAT:
+            raise BundleError(f'{path} is not a model bundle')
+        if data['input_version'] != INPUT_VERSION:
+            raise BundleError(
+                f"{path} is for input version {data['input_version']}, "
+                f'expected {INPUT_VERSION}')
+        if quantized and 'quantized' in data:
+            quantized = torch.jit.load(
+                io.BytesIO(data['quantized'].numpy().tobytes()),
+                map_location='cpu',
+            )
+        else:
+            quantized = None
+        return cls(
+            data['config'],
+            data['state_dicts'],
+            input_version=data['input_version'],
+            folded=data.get('folded'),
+            quantized=quantized,
+        )
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Bundles the architecture and weights of a model into '
+                    'one file the engine can load')
+    parser.add_argument('model')
+    parser.add_argument(
+        'model_files',
+        nargs='+',
+        help='the model file, or the tower, policy and value files of a '
+             'ResNet',
+    )
+    parser.add_argument('-o', '--output', default='model.bundle')
+    parser.add_argument(
+        '--no-fold', action='store_true',
+        help="don't include the weights with the batch norms folded")
+    parser.add_argument(
+        '-q', '--calibration-file',
+        help='csv file of positions to include an int8 ResNet calibrated '
+             'on')
+    parser.add_argument(
+        '-c', '--calibration-positions', type=int, default=1024)
+    args = parser.parse_args()
+
+    config = get_config(args.model)
+    if args.calibration_file and config['type'] != 'resnet':
+        parser.error('only ResNets can be quantized')
+    modules = create_from_config(config)
+    if not isinstance(modules, tuple):
+        modules = (modules, )
+    for module, path in zip(modules, args.model_files):
+        module.load_state_dict(torch.load(path, map_location='cpu'))
+    bundle = Bundle.from_modules(args.model, modules, fold=not args.no_fold)
+    if args.calibration_file:
+        from ..data.chess_dataset import ChessDataset
+        from .quantize import calibration_batches, quantize
+        from .res import Network
+        from .script import to_torch_script
+        batches = calibration_batches(
+            ChessDataset(
+                args.calibration_file, limit=args.calibration_positions),
+            args.calibration_positions,
+        )
+        bundle.quantized = to_torch_script(
+            quantize(Network(*modules), batches))
+    bundle.save(args.output)
+    print(f'Saved {args.output}')
+
+
+if __name__ == '__main__':
+    run()
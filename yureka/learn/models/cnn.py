@@ -91,7 +91,7 @@ class Value(Policy):
     def forward(self, x):
         x = super(Value, self).forward(x)
         # x.shape = (batch_size, out_channels, 8, 8)
-        x = self.linear_relu(x.view(x.shape[0], -1))
+        x = self.linear_relu(x.reshape(x.shape[0], -1))
         # x.shape = (batch_size, linear_relu_out)
         x = self.linear_tanh(x)
         # x.shape = (batch_size, 1)
@@ -0,0 +1,110 @@
+import argparse
+import os
+import torch
+import torch.nn as nn
+
+from torch.nn.utils.fusion import fuse_conv_bn_weights
+
+from . import create, res
+
+
+# (conv, batch norm) attribute names of the blocks in res
+BLOCK_PAIRS = {
+    res.ConvBlock: [('conv', 'batch_norm')],
+    res.ResBlock: [('conv1', 'batch_norm1'), ('conv2', 'batch_norm2')],
+    res.BottleneckBlock: [
+        ('conv1', 'batch_norm1'),
+        ('conv2', 'batch_norm2'),
+        ('conv3', 'batch_norm3'),
+    ],
+    res.PolicyHead: [('conv', 'batch_norm')],
+    res.ValueHead: [('conv', 'batch_norm1')],
+}
+
+
+def fold_conv(conv, batch_norm):
+    conv.weight, conv.bias = fuse_conv_bn_weights(
+        conv.weight,
+        conv.bias,
+        batch_norm.running_mean,
+        batch_norm.running_var,
+        batch_norm.eps,
+        batch_norm.weight,
+        batch_norm.bias,
+    )
+
+
+def reset_batch_norm(batch_norm):
+    # make batch_norm an identity in eval mode
+    with torch.no_grad():
+        batch_norm.weight.fill_(1)
+        batch_norm.bias.zero_()
+        batch_norm.running_mean.zero_()
+        batch_norm.running_var.fill_(1 - batch_norm.eps)
+
+
+def conv_batch_norm_pairs(model):
+    # (parent, conv name, batch norm name) of every batch norm that
+    # directly follows a conv
+    for module in model.modules():
+        if type(module) in BLOCK_PAIRS:
+            for conv, batch_norm in BLOCK_PAIRS[type(module)]:
+                if isinstance(getattr(module, batch_norm), nn.BatchNorm2d):
+                    yield module, conv, batch_norm
+        elif isinstance(module, nn.Sequential):
+            names = list(module._modules)
+            for conv, batch_norm in zip(names, names[1:]):
+                if isinstance(module._modules[conv], nn.Conv2d) and \
+                        isinstance(module._modules[batch_norm],
+                                   nn.BatchNorm2d):
+                    yield module, conv, batch_norm
+
+
+def fold_batch_norms(model, keep_batch_norms=False):
+    """Folds every batch norm of model into the conv before it, in place.
+
+    The batch norms are replaced with identities, unless keep_batch_norms
+    is set, in which case they're reset to parameters that make them
+    identities in eval mode so that the state dict still loads into the
+    model from models.create. Either way, the result is only good for
+    eval.
+    """
+    for module, conv, batch_norm in list(conv_batch_norm_pairs(model)):
+        fold_conv(module._modules[conv], module._modules[batch_norm])
+        if keep_batch_norms:
+            reset_batch_norm(module._modules[batch_norm])
+        else:
+            module._modules[batch_norm] = nn.Identity()
+    return model
+
+
+def folded_path(path):
+    root, ext = os.path.splitext(path)
+    return f'{root}.folded{ext}'
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Folds the batch norms of a model into its convs and '
+                    'saves checkpoints the engine can load as they are')
+    parser.add_argument('model')
+    parser.add_argument(
+        'model_files',
+        nargs='+',
+        help='the model file, or the tower, policy and value files of a '
+             'ResNet. the folded files are saved next to them.',
+    )
+    args = parser.parse_args()
+
+    modules = create(args.model)
+    if not isinstance(modules, tuple):
+        modules = (modules, )
+    for module, path in zip(modules, args.model_files):
+        module.load_state_dict(torch.load(path, map_location='cpu'))
+        fold_batch_norms(module.eval(), keep_batch_norms=True)
+        torch.save(module.state_dict(), folded_path(path))
+        print(f'Saved {folded_path(path)}')
+
+
+if __name__ == '__main__':
+    run()
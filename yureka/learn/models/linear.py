@@ -0,0 +1,25 @@
+import torch.nn as nn
+
+from ..data.move_translator import NUM_MOVE_PLANES
+
+
+class LinearPolicy(nn.Module):
+    """Move logits that are linear in the piece planes, so every piece on
+    a square adds its own weight to each move.
+
+    Cheap enough to pick the moves of rollouts, see
+    mcts.networks.rollout.
+    """
+    def __init__(self, name, piece_planes):
+        super(LinearPolicy, self).__init__()
+        self.name = name
+        self.piece_planes = piece_planes
+        self.linear = nn.Linear(piece_planes * 8 * 8, NUM_MOVE_PLANES * 8 * 8)
+
+    def forward(self, x):
+        # x.shape = (batch_size, in_channels, 8, 8)
+        x = x[:, :self.piece_planes]
+        # x.shape = (batch_size, piece_planes, 8, 8)
+        x = self.linear(x.reshape(x.shape[0], -1))
+        # x.shape = (batch_size, NUM_MOVE_PLANES * 8 * 8)
+        return x
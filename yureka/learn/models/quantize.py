@@ -0,0 +1,156 @@
+import argparse
+import copy
+import torch
+import torch.nn.functional as F
+
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from torch.utils.data import DataLoader, Subset
+
+from ..data.chess_dataset import ChessDataset, collate_batch
+from .res import Network
+from .script import to_torch_script
+from . import create
+
+
+DEFAULT_BACKEND = 'x86'
+DEFAULT_CALIBRATION_POSITIONS = 1024
+DEFAULT_BATCH_SIZE = 64
+
+
+def calibration_batches(
+    dataset,
+    positions=DEFAULT_CALIBRATION_POSITIONS,
+    batch_size=DEFAULT_BATCH_SIZE,
+):
+    # the input planes of the first positions of the dataset
+    dataset = Subset(dataset, range(min(positions, len(dataset))))
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        collate_fn=collate_batch,
+    )
+    return [inputs for inputs, _, _ in loader]
+
+
+def quantize(model, batches, backend=DEFAULT_BACKEND):
+    """Post-training static int8 quantization of a copy of model.
+
+    Convolutions are fused with the batch norms and relus that follow
+    them, and the activation ranges are calibrated by running batches
+    through the model. The result only runs on the cpu.
+    """
+    model = copy.deepcopy(model).cpu().eval()
+    prepared = prepare_fx(
+        model,
+        get_default_qconfig_mapping(backend),
+        (batches[0], ),
+    )
+    with torch.no_grad():
+        for inputs in batches:
+            prepared(inputs)
+    return convert_fx(prepared)
+
+
+def split_outputs(outputs):
+    # (policy, value) of a model, either of which may be None
+    if isinstance(outputs, tuple):
+        return outputs
+    if outputs.dim() == 2 and outputs.shape[1] == 1:
+        return None, outputs
+    return outputs, None
+
+
+def compare(float_model, quantized_model, batches):
+    """How often the top move of both models agree, the mean KL divergence
+    of the quantized policy from the float one, and the mean squared
+    difference of their values.
+    """
+    float_model = float_model.cpu().eval()
+    positions = 0
+    agreed = 0
+    divergence = 0.0
+    squared_error = 0.0
+    policy = value = None
+    with torch.no_grad():
+        for inputs in batches:
+            policy, value = split_outputs(float_model(inputs))
+            q_policy, q_value = split_outputs(quantized_model(inputs))
+            positions += inputs.shape[0]
+            if policy is not None:
+                policy = policy.reshape(policy.shape[0], -1)
+                q_policy = q_policy.reshape(q_policy.shape[0], -1)
+                agreed += (policy.argmax(1) == q_policy.argmax(1)).sum().item()
+                divergence += F.kl_div(
+                    F.log_softmax(q_policy, 1),
+                    F.log_softmax(policy, 1),
+                    reduction='sum',
+                    log_target=True,
+                ).item()
+            if value is not None:
+                squared_error += (value - q_value).pow(2).sum().item()
+    report = {'positions': positions}
+    if policy is not None:
+        report['top1_agreement'] = agreed / positions
+        report['policy_kl'] = divergence / positions
+    if value is not None:
+        report['value_mse'] = squared_error / positions
+    return report
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Quantizes a model to int8 and reports how much it '
+                    'differs from the float model')
+    parser.add_argument('model')
+    parser.add_argument('data_file', help='csv file of positions')
+    parser.add_argument(
+        'model_files',
+        nargs='+',
+        help='the model file, or the tower, policy and value files of a '
+             'ResNet',
+    )
+    parser.add_argument(
+        '-c', '--calibration-positions',
+        type=int,
+        default=DEFAULT_CALIBRATION_POSITIONS,
+    )
+    parser.add_argument('-t', '--test-positions', type=int, default=4096)
+    parser.add_argument('-b', '--backend', default=DEFAULT_BACKEND)
+    parser.add_argument(
+        '-o', '--output',
+        help='save the quantized model as TorchScript for the engine')
+    args = parser.parse_args()
+
+    model = create(args.model)
+    if isinstance(model, tuple):
+        model = Network(*model)
+        modules = [model.tower, model.policy, model.value]
+    else:
+        modules = [model]
+    for module, path in zip(modules, args.model_files):
+        module.load_state_dict(torch.load(path, map_location='cpu'))
+
+    calibration = ChessDataset(
+        args.data_file, limit=args.calibration_positions)
+    test = ChessDataset(
+        args.data_file,
+        offset=args.calibration_positions,
+        limit=args.calibration_positions + args.test_positions,
+    )
+    quantized = quantize(
+        model,
+        calibration_batches(calibration, args.calibration_positions),
+        backend=args.backend,
+    )
+    report = compare(
+        model, quantized, calibration_batches(test, args.test_positions))
+    for name, value in report.items():
+        print(f'{name}: {value}')
+    if args.output:
+        to_torch_script(quantized).save(args.output)
+        print(f'Saved {args.output}')
+
+
+if __name__ == '__main__':
+    run()
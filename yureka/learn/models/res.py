@@ -46,6 +46,50 @@ class ResBlock(nn.Module):
         return self.relu(out + x)
 
 
+class BottleneckBlock(nn.Module):
+    """A 1x1 conv to hidden_channels, a kernel_size conv, and a 1x1 conv
+    back, with a skip connection around them.
+
+    With depthwise, the middle conv is depthwise separable. Expanding
+    to more hidden_channels than channels then makes it the inverted
+    residual of MobileNetV2.
+    """
+    def __init__(
+        self,
+        channels,
+        hidden_channels,
+        kernel_size,
+        padding=0,
+        stride=1,
+        depthwise=False,
+    ):
+        super(BottleneckBlock, self).__init__()
+        self.conv1 = nn.Conv2d(channels, hidden_channels, 1)
+        self.batch_norm1 = nn.BatchNorm2d(hidden_channels)
+        self.conv2 = nn.Conv2d(
+            hidden_channels,
+            hidden_channels,
+            kernel_size,
+            padding=padding,
+            stride=stride,
+            groups=hidden_channels if depthwise else 1,
+        )
+        self.batch_norm2 = nn.BatchNorm2d(hidden_channels)
+        self.conv3 = nn.Conv2d(hidden_channels, channels, 1)
+        self.batch_norm3 = nn.BatchNorm2d(channels)
+        self.relu = nn.ReLU()
+
+    def forward(self, x):
+        # x.shape = (batch_size, channels, 8, 8)
+        out = self.relu(self.batch_norm1(self.conv1(x)))
+        # x.shape = (batch_size, hidden_channels, 8, 8)
+        out = self.relu(self.batch_norm2(self.conv2(out)))
+        # x.shape = (batch_size, hidden_channels, 8, 8)
+        out = self.batch_norm3(self.conv3(out))
+        # x.shape = (batch_size, channels, 8, 8)
+        return self.relu(out + x)
+
+
 class PolicyHead(nn.Module):
     def __init__(self, *args, **kwargs):
         super(PolicyHead, self).__init__()
@@ -65,7 +109,7 @@ class PolicyHead(nn.Module):
         # x.shape = (batch_size, out_channels, 8, 8)
         x = self.relu(x)
         # x.shape = (batch_size, out_channels, 8, 8)
-        x = self.linear(x.view(x.shape[0], -1))
+        x = self.linear(x.reshape(x.shape[0], -1))
         # x.shape = (batch_size, NUM_MOVE_PLANES * 8 * 8)
         return x
 
@@ -89,7 +133,7 @@ class ValueHead(nn.Module):
         # x.shape = (batch_size, in_channels, 8, 8)
         x = self.relu1(x)
         # x.shape = (batch_size, in_channels, 8, 8)
-        x = self.linear1(x.view(x.shape[0], -1))
+        x = self.linear1(x.reshape(x.shape[0], -1))
         x = self.relu2(x)
         x = self.linear2(x)
         x = self.tanh(x)
@@ -105,3 +149,16 @@ class ResNet(nn.Module):
     def forward(self, x):
         x = self.tower(x)
         return self.head(x)
+
+
+class Network(nn.Module):
+    # the tower with both heads, for inference
+    def __init__(self, tower, policy, value):
+        super(Network, self).__init__()
+        self.tower = tower
+        self.policy = policy
+        self.value = value
+
+    def forward(self, x):
+        x = self.tower(x)
+        return self.policy(x), self.value(x)
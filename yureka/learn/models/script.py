@@ -0,0 +1,19 @@
+import torch
+
+
+def to_torch_script(model, in_channels=21, batch_size=16, device='cpu'):
+    """Traces model in eval mode and freezes the result.
+
+    Freezing inlines the weights as constants and folds every batch norm
+    into the convolution before it. The graph only depends on the batch
+    size through the inputs, so any batch size works.
+    """
+    model = model.to(device).eval()
+    example = torch.randn(batch_size, in_channels, 8, 8, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    return torch.jit.freeze(traced)
+
+
+def load_torch_script(path, device='cpu'):
+    return torch.jit.load(path, map_location=device)
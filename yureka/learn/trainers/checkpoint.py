@@ -0,0 +1,114 @@
+import attr
+import collections
+import logging
+import os
+import queue
+import random
+import threading
+import numpy as np
+import torch
+
+
+def to_cpu(obj):
+    # copy every tensor so that the training thread can keep updating the
+    # originals while the snapshot is being written
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def get_rng_state():
+    state = {
+        'torch': torch.get_rng_state(),
+        'numpy': np.random.get_state(),
+        'random': random.getstate(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['random'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def load_checkpoint(filepath):
+    return torch.load(filepath, map_location='cpu', weights_only=False)
+
+
+@attr.s
+class CheckpointWriter():
+    """Writes snapshots on a background thread.
+
+    Files are written to a temporary path and renamed into place, so a
+    crash never leaves a truncated checkpoint behind. Only the last
+    ``keep`` rotated checkpoints are kept on disk.
+    """
+    keep = attr.ib(default=3)
+    existing = attr.ib(default=attr.Factory(list))
+    logger = attr.ib(default=logging.getLogger(__name__))
+
+    def __attrs_post_init__(self):
+        self.rotated = collections.deque(self.existing)
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def save(self, state, filepath, rotate=False):
+        self.raise_error()
+        self.queue.put((to_cpu(state), filepath, rotate))
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                state, filepath, rotate = item
+                self.write(state, filepath)
+                if rotate:
+                    self.rotate(filepath)
+            except Exception as e:
+                self.logger.exception(f'Failed to save {item[1]}')
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def write(self, state, filepath):
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filepath, filepath)
+        self.logger.info(f'Done saving: {filepath}')
+
+    def rotate(self, filepath):
+        self.rotated.append(filepath)
+        while len(self.rotated) > self.keep:
+            old = self.rotated.popleft()
+            if os.path.exists(old):
+                os.remove(old)
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def wait(self):
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
@@ -0,0 +1,171 @@
+import argparse
+import attr
+import os
+import torch
+import torch.nn.functional as F
+import torch.utils.data as data
+
+from .loss import DistillationLoss
+from .supervised import SupervisedTrainer
+from .. import models
+from ..data.chess_dataset import (
+    ChessDataset,
+    LMDBChessDataset,
+    TeacherDataset,
+    collate_batch,
+)
+
+
+DEFAULT_TOP_K = 16
+DEFAULT_TEMPERATURE = 1.0
+TARGETS_SUFFIX = '.teacher'
+
+
+def targets_path(data_file):
+    return data_file.rstrip('/') + TARGETS_SUFFIX
+
+
+def compute_targets(teacher, dataset, top_k=DEFAULT_TOP_K,
+                    temperature=DEFAULT_TEMPERATURE, batch_size=256,
+                    device=torch.device('cpu')):
+    """The indices and probabilities of the top_k moves of teacher, a
+    (tower, policy, value) ResNet, and its values for every row of dataset.
+    The probabilities are renormalized over the top moves.
+    """
+    tower, policy, value = (m.to(device).eval() for m in teacher)
+    loader = data.DataLoader(
+        dataset, batch_size=batch_size, collate_fn=collate_batch)
+    indices = []
+    probs = []
+    values = []
+    with torch.no_grad():
+        for inputs, _, _ in loader:
+            tower_output = tower(inputs.to(device))
+            logits = policy(tower_output).reshape(inputs.shape[0], -1)
+            top_probs, top_indices = F.softmax(
+                logits.float() / temperature, 1).topk(top_k, 1)
+            top_probs /= top_probs.sum(1, keepdim=True)
+            # the moves fit in 16 bits and the probabilities don't need
+            # more, so the targets stay small next to the data
+            indices.append(top_indices.short().cpu())
+            probs.append(top_probs.half().cpu())
+            values.append(value(tower_output).float().cpu())
+    return {
+        'indices': torch.cat(indices),
+        'probs': torch.cat(probs),
+        'values': torch.cat(values),
+        'temperature': temperature,
+    }
+
+
+def load_targets(data_file):
+    return torch.load(
+        targets_path(data_file), map_location='cpu', mmap=True)
+
+
+@attr.s
+class DistillationTrainer(SupervisedTrainer):
+    """Trains the model on the soft targets of a teacher instead of the
+    moves and values of the data. The targets of every data file have to
+    be computed first with this module's command.
+    """
+
+    def __attrs_post_init__(self):
+        # set from the targets, which all have to agree on it
+        self.temperature = None
+        super().__attrs_post_init__()
+        self.criterion = DistillationLoss(self.network, self.temperature)
+
+    def create_dataset(self, data_file, offset=0, limit=None):
+        targets = load_targets(data_file)
+        if self.temperature is None:
+            self.temperature = targets['temperature']
+        elif targets['temperature'] != self.temperature:
+            raise ValueError(
+                f'{targets_path(data_file)} is at temperature '
+                f"{targets['temperature']}, expected {self.temperature}")
+        dataset = super().create_dataset(data_file, offset, limit)
+        if len(targets['values']) < offset + len(dataset):
+            raise ValueError(
+                f'{targets_path(data_file)} has fewer rows than {data_file}')
+        return TeacherDataset(dataset, targets, offset)
+
+    def print_summary(self):
+        super().print_summary()
+        self.logger.info('Distilling')
+
+    def get_variables_from_inputs(self, row):
+        # the moves and values of the data aren't used
+        inputs, _, _, indices, probs, value = row
+        inputs = inputs.to(self.device, memory_format=self.memory_format)
+        labels = (
+            indices.to(self.device),
+            probs.to(self.device),
+            value.to(self.device),
+        )
+        return inputs, labels
+
+    def update_metrics(self, metrics, outputs, labels, loss):
+        # accuracy against the teacher's top move, mse against its values
+        indices, _, value = labels
+        if self.network == 'res':
+            labels = (indices[:, 0], value)
+        elif self.network == 'policy':
+            labels = indices[:, 0]
+        else:
+            labels = value
+        super().update_metrics(metrics, outputs, labels, loss)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Computes a teacher ResNet's targets for every data "
+                    'file, which a smaller model is then trained on with '
+                    'yureka.learn.trainers.supervised --distill')
+    parser.add_argument('teacher')
+    parser.add_argument('tower_file')
+    parser.add_argument('policy_file')
+    parser.add_argument('value_file')
+    parser.add_argument('-d', '--data', nargs='+', required=True)
+    parser.add_argument(
+        '-f', '--format', choices=['csv', 'lmdb'], default='csv')
+    parser.add_argument(
+        '-k', '--top-k', type=int, default=DEFAULT_TOP_K,
+        help='number of moves to keep the probabilities of')
+    parser.add_argument(
+        '-T', '--temperature', type=float, default=DEFAULT_TEMPERATURE)
+    parser.add_argument('-b', '--batch-size', type=int, default=256)
+    parser.add_argument('-c', '--cuda-device', type=int)
+    args = parser.parse_args()
+
+    if models.get_config(args.teacher)['type'] != 'resnet':
+        parser.error('the teacher has to be a ResNet')
+    if torch.cuda.is_available():
+        device = torch.device('cuda', args.cuda_device)
+    else:
+        device = torch.device('cpu')
+    teacher = models.create(args.teacher)
+    files = (args.tower_file, args.policy_file, args.value_file)
+    for module, path in zip(teacher, files):
+        module.load_state_dict(torch.load(path, map_location='cpu'))
+    for data_file in args.data:
+        data_file = os.path.expanduser(data_file)
+        if args.format == 'lmdb':
+            dataset = LMDBChessDataset(data_file)
+        else:
+            dataset = ChessDataset(data_file)
+        targets = compute_targets(
+            teacher,
+            dataset,
+            top_k=args.top_k,
+            temperature=args.temperature,
+            batch_size=args.batch_size,
+            device=device,
+        )
+        path = targets_path(data_file)
+        torch.save(targets, path)
+        print(f'Saved {path}')
+
+
+if __name__ == '__main__':
+    run()
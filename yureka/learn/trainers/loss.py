@@ -1,4 +1,5 @@
 import torch.nn as nn
+import torch.nn.functional as F
 
 
 class MSECrossEntropyLoss(nn.Module):
@@ -11,6 +12,10 @@ class MSECrossEntropyLoss(nn.Module):
     def forward(self, outputs, labels):
         pred_move, pred_value = outputs
         move, value = labels
+        # compute the losses in float32 even if the predictions came out of
+        # a bfloat16 autocast region
+        pred_move = pred_move.float()
+        pred_value = pred_value.float()
         cross_entropy_loss = self.cross_entropy(pred_move, move)
         mse_loss = self.mse(pred_value, value)
         return (
@@ -18,3 +23,42 @@ class MSECrossEntropyLoss(nn.Module):
             mse_loss,
             cross_entropy_loss,
         )
+
+
+class DistillationLoss(nn.Module):
+    """KL divergence of the predicted moves from a teacher's top moves,
+    and the mse against its values.
+
+    The teacher's probabilities were taken at temperature, so the
+    predictions are softened the same way and the divergence is scaled by
+    its square to keep the gradients the size they are at 1.
+    """
+
+    def __init__(self, network='res', temperature=1.0):
+        super(DistillationLoss, self).__init__()
+        self.network = network
+        self.temperature = temperature
+        self.mse = nn.MSELoss()
+
+    def forward(self, outputs, labels):
+        indices, probs, value = labels
+        if self.network == 'policy':
+            return self.kl_div(outputs, indices, probs)
+        if self.network == 'value':
+            return self.mse(outputs.float(), value)
+        pred_move, pred_value = outputs
+        kl_div_loss = self.kl_div(pred_move, indices, probs)
+        mse_loss = self.mse(pred_value.float(), value)
+        return (
+            0.01 * mse_loss + kl_div_loss,
+            mse_loss,
+            kl_div_loss,
+        )
+
+    def kl_div(self, pred_move, indices, probs):
+        log_probs = F.log_softmax(pred_move.float() / self.temperature, 1)
+        # only the teacher's top moves have probabilities, the rest of its
+        # distribution was cut off and renormalized
+        divergence = probs * (
+            probs.clamp_min(1e-12).log() - log_probs.gather(1, indices))
+        return divergence.sum(1).mean() * self.temperature ** 2
@@ -0,0 +1,85 @@
+import attr
+import torch
+import torch.distributed as dist
+
+
+@attr.s
+class StreamingMetrics():
+    """Running evaluation counts, updated one batch at a time.
+
+    Every position has exactly one move label, so micro-averaged
+    precision, recall and F1 all reduce to top-1 accuracy.
+    """
+    top_k = attr.ib(default=(1, 3, 5))
+
+    def __attrs_post_init__(self):
+        self.reset()
+
+    def reset(self):
+        self.batches = 0
+        self.loss_sum = 0.0
+        self.mse_loss_sum = 0.0
+        self.cross_entropy_loss_sum = 0.0
+        self.move_samples = 0
+        self.correct = [0] * len(self.top_k)
+        self.value_samples = 0
+        self.value_squared_error = 0.0
+
+    def update_loss(self, loss, mse_loss=None, cross_entropy_loss=None):
+        self.batches += 1
+        self.loss_sum += loss.item()
+        if mse_loss is not None:
+            self.mse_loss_sum += mse_loss.item()
+        if cross_entropy_loss is not None:
+            self.cross_entropy_loss_sum += cross_entropy_loss.item()
+
+    def update_moves(self, move_outputs, move_labels):
+        _, top = move_outputs.topk(max(self.top_k), dim=1)
+        hits = top == move_labels.view(-1, 1)
+        for i, k in enumerate(self.top_k):
+            self.correct[i] += hits[:, :k].sum().item()
+        self.move_samples += move_labels.shape[0]
+
+    def update_values(self, value_outputs, value_labels):
+        error = value_outputs.float() - value_labels.float()
+        self.value_squared_error += error.pow(2).sum().item()
+        self.value_samples += value_labels.numel()
+
+    def all_reduce(self, device=None):
+        # sum the counts of every process so that all of them report the
+        # metrics of the whole test set
+        counts = torch.tensor([
+            self.batches,
+            self.loss_sum,
+            self.mse_loss_sum,
+            self.cross_entropy_loss_sum,
+            self.move_samples,
+            self.value_samples,
+            self.value_squared_error,
+        ] + self.correct, dtype=torch.float64, device=device)
+        dist.all_reduce(counts)
+        counts = counts.tolist()
+        self.batches = int(counts[0])
+        self.loss_sum = counts[1]
+        self.mse_loss_sum = counts[2]
+        self.cross_entropy_loss_sum = counts[3]
+        self.move_samples = int(counts[4])
+        self.value_samples = int(counts[5])
+        self.value_squared_error = counts[6]
+        self.correct = [int(c) for c in counts[7:]]
+
+    def avg_loss(self):
+        return self.loss_sum / max(self.batches, 1)
+
+    def avg_mse_loss(self):
+        return self.mse_loss_sum / max(self.batches, 1)
+
+    def avg_cross_entropy_loss(self):
+        return self.cross_entropy_loss_sum / max(self.batches, 1)
+
+    def accuracy(self, k=1):
+        correct = self.correct[self.top_k.index(k)]
+        return correct / max(self.move_samples, 1)
+
+    def value_mse(self):
+        return self.value_squared_error / max(self.value_samples, 1)
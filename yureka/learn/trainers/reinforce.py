@@ -12,6 +12,12 @@ import torch.optim as optim
 from .. import models
 from ...mcts.networks import PolicyNetwork
 from ..data.state_generator import get_reward
+from .checkpoint import (
+    CheckpointWriter,
+    load_checkpoint,
+    get_rng_state,
+    set_rng_state,
+)
 
 
 @attr.s
@@ -32,8 +38,18 @@ class ReinforceTrainer():
     multi_process = attr.ib(default=True)
     cuda_device = attr.ib(default=None)
     logger = attr.ib(default=logging.getLogger(__name__))
+    keep_checkpoints = attr.ib(default=3)
+    resume = attr.ib(default=None)
 
     def __attrs_post_init__(self):
+        self.checkpoint_writer = CheckpointWriter(
+            keep=self.keep_checkpoints,
+            existing=sorted(
+                glob.glob(os.path.join(self.opponent_pool_path, '*.ckpt')),
+                key=os.path.getmtime,
+            ),
+            logger=self.logger,
+        )
         self.latest_saved_trainee = self.trainee_saved_model
         self.latest_saved_iteration = 0
         self.init_trainee_model_to_latest()
@@ -45,6 +61,8 @@ class ReinforceTrainer():
             self.trainee_model.share_memory()
 
     def init_trainee_model_to_latest(self):
+        # make sure the latest model has hit the disk
+        self.checkpoint_writer.wait()
         self.trainee_model = models.create(self.model)
         self.trainee_model.load_state_dict(
             torch.load(self.latest_saved_trainee))
@@ -120,6 +138,7 @@ class ReinforceTrainer():
         self.logger.info(f'Save interval: {self.save_interval}')
         self.logger.info(f'Multi process: {self.multi_process}')
         self.logger.info(f'Cuda device: {self.cuda_device}')
+        self.logger.info(f'Resume: {self.resume}')
 
         optimizer = optim.SGD(
             self.trainee_model.parameters(),
@@ -128,6 +147,8 @@ class ReinforceTrainer():
             nesterov=True
         )
         i = 0
+        if self.resume:
+            i = self.load_checkpoint(self.resume, optimizer)
         while i < self.num_iter:
             while True:
                 try:
@@ -144,7 +165,7 @@ class ReinforceTrainer():
                     policy_loss.backward()
                     optimizer.step()
                     if i != 0 and i % self.save_interval == 0:
-                        self.save(i)
+                        self.save(i, optimizer)
                 except PolicyLossIsNan:
                     if self.learning_rate <= 1e-8:
                         self.logger.error(
@@ -165,22 +186,45 @@ class ReinforceTrainer():
                 break
             i += 1
 
+        self.checkpoint_writer.close()
         self.logger.info('Training done')
 
-    def save(self, iteration):
+    def save(self, iteration, optimizer=None):
         filename = self.trainee_model.name
         filename += f"_{datetime.datetime.now():%Y-%m-%d_%H:%M:%S}"
-        filename += f"_{iteration}.model"
+        filename += f"_{iteration}"
         filepath = os.path.join(
             os.getcwd(),
             self.opponent_pool_path,
             filename
         )
-        self.logger.info(f'Saving: {filepath}')
-        torch.save(self.trainee_model.state_dict(), filepath)
-        self.latest_saved_trainee = filepath
+        self.logger.info(f'Saving: {filepath}.model')
+        self.checkpoint_writer.save(
+            self.trainee_model.state_dict(), f'{filepath}.model')
+        self.latest_saved_trainee = f'{filepath}.model'
         self.latest_saved_iteration = iteration
-        self.logger.info('Done saving')
+        if optimizer:
+            # the opponent pool only picks up *.model files
+            self.checkpoint_writer.save({
+                'iteration': iteration,
+                'model': self.trainee_model.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'learning_rate': self.learning_rate,
+                'latest_saved_trainee': self.latest_saved_trainee,
+                'rng_state': get_rng_state(),
+            }, f'{filepath}.ckpt', rotate=True)
+
+    def load_checkpoint(self, filepath, optimizer):
+        self.logger.info(f'Resuming from checkpoint: {filepath}')
+        state = load_checkpoint(filepath)
+        self.trainee_model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        self.learning_rate = state['learning_rate']
+        self.latest_saved_trainee = state['latest_saved_trainee']
+        self.latest_saved_iteration = state['iteration']
+        set_rng_state(state['rng_state'])
+        self.logger.info(f'Resuming at iteration {state["iteration"] + 1}')
+        return state['iteration'] + 1
 
 
 def self_play_multi(game_queue, done_queue):
@@ -245,6 +289,8 @@ def run():
     parser.add_argument('-c', '--cuda-device', type=int)
     parser.add_argument('-t', '--single-process', action="store_true")
     parser.add_argument('-d', '--debug', action="store_true")
+    parser.add_argument('--keep-checkpoints', type=int)
+    parser.add_argument('--resume')
 
     args = parser.parse_args()
 
@@ -277,6 +323,10 @@ def run():
         trainer_setting['multi_process'] = not args.single_process
     if args.cuda_device:
         trainer_setting['cuda_device'] = args.cuda_device
+    if args.keep_checkpoints:
+        trainer_setting['keep_checkpoints'] = args.keep_checkpoints
+    if args.resume:
+        trainer_setting['resume'] = args.resume
 
     trainer = ReinforceTrainer(**trainer_setting)
     trainer.run()
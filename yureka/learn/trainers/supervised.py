@@ -2,22 +2,35 @@ import logging
 import attr
 import argparse
 import datetime
+import glob
 import os
 import itertools
 import torch
+import torch.distributed as dist
 import torch.utils.data as data
 import torch.optim as optim
 import torch.nn as nn
-import numpy as np
-import sklearn.metrics as metrics
+
+from torch.nn.parallel import DistributedDataParallel
 
 from .loss import MSECrossEntropyLoss
+from .metrics import StreamingMetrics
+from .checkpoint import (
+    CheckpointWriter,
+    load_checkpoint,
+    get_rng_state,
+    set_rng_state,
+)
 from .. import models
 from ..data.chess_dataset import (
     LMDBChessDataset,
     InterleavenDataset,
     ChessDataset,
+    ConcatChessDataset,
+    collate_batch,
 )
+from ..data.samplers import ResumableSampler
+from ..data.prefetcher import Prefetcher
 
 
 @attr.s
@@ -45,14 +58,52 @@ class SupervisedTrainer():
     cuda = attr.ib(default=True)
     parallel = attr.ib(default=False)
     learning_rate = attr.ib(default=1e-2)
+    mixed_precision = attr.ib(default=False)
+    channels_last = attr.ib(default=False)
+    distributed = attr.ib(default=False)
+    backend = attr.ib(default='gloo')
+    num_workers = attr.ib(default=4)
+    prefetch = attr.ib(default=2)
+    checkpoint_interval = attr.ib(default=None)
+    keep_checkpoints = attr.ib(default=3)
+    resume = attr.ib(default=None)
 
     def __attrs_post_init__(self):
         self.cuda = self.cuda and torch.cuda.is_available()
         self.device = torch.device('cuda' if self.cuda else 'cpu')
+        if self.distributed:
+            # MASTER_ADDR, MASTER_PORT, RANK and WORLD_SIZE come from the
+            # environment, e.g. set by torchrun
+            if not dist.is_initialized():
+                dist.init_process_group(self.backend)
+            self.rank = dist.get_rank()
+            self.world_size = dist.get_world_size()
+            if self.cuda:
+                local_rank = int(os.environ.get('LOCAL_RANK', self.rank))
+                self.device = torch.device('cuda', local_rank)
+            if self.rank != 0:
+                self.logger.setLevel(logging.WARNING)
+        else:
+            self.rank = 0
+            self.world_size = 1
+        if self.channels_last:
+            self.memory_format = torch.channels_last
+        else:
+            self.memory_format = torch.contiguous_format
         # summary
         self.print_summary()
 
-        if self.parallel and torch.cuda.device_count() > 1:
+        if self.distributed:
+            self.logger.info(
+                f'Using {self.world_size} {self.backend} processes')
+            for m in self.get_modules():
+                m.to(self.device, memory_format=self.memory_format)
+            if self.network == 'res':
+                self.model = tuple(
+                    self.wrap_distributed(m) for m in self.model)
+            else:
+                self.model = self.wrap_distributed(self.model)
+        elif self.parallel and torch.cuda.device_count() > 1:
             device_count = torch.cuda.device_count()
             self.logger.info(f'Using {device_count} GPUs')
             self.model = nn.DataParallel(self.model)
@@ -62,26 +113,35 @@ class SupervisedTrainer():
                     m.to(self.device)
             else:
                 self.model.to(self.device)
+        if self.channels_last and not self.distributed:
+            for m in self.get_modules():
+                m.to(memory_format=self.memory_format)
         if self.split_data:
             self.train_data, self.test_data = self.split_train_test(
                 self.data, self.data_limit)
         else:
             # first n-1 is training, the last is test
-            self.train_data = data.DataLoader(
-                data.ConcatDataset([
-                    ChessDataset(f) for f in self.data[:-1]
+            self.train_data = self.create_loader(
+                ConcatChessDataset([
+                    self.create_dataset(f) for f in self.data[:-1]
                 ]),
-                batch_size=self.batch_size,
-                num_workers=4,
-                shuffle=True
-            )
-            self.test_data = data.DataLoader(
-                ChessDataset(self.data[-1]),
-                batch_size=self.batch_size
+                shuffle=True,
+                train=True,
             )
+            self.test_data = self.create_loader(
+                self.create_dataset(self.data[-1]))
         self.logger.info(f'Train data len: {len(self.train_data)}')
         self.logger.info(f'Test data len: {len(self.test_data)}')
 
+        self.checkpoint_writer = CheckpointWriter(
+            keep=self.keep_checkpoints,
+            existing=sorted(
+                glob.glob(os.path.join(self.model_path, '*.ckpt')),
+                key=os.path.getmtime,
+            ),
+            logger=self.logger,
+        )
+
         if self.network == 'value':
             self.criterion = nn.MSELoss()
         elif self.network == 'policy':
@@ -97,6 +157,65 @@ class SupervisedTrainer():
         self.logger.info(f'Num epochs: {self.num_epochs}')
         self.logger.info(f'Use cuda: {self.cuda}')
         self.logger.info(f'Learning rate: {self.learning_rate}')
+        self.logger.info(f'Mixed precision: {self.mixed_precision}')
+        self.logger.info(f'Channels last: {self.channels_last}')
+        self.logger.info(f'Distributed: {self.distributed}')
+        self.logger.info(f'Checkpoint interval: {self.checkpoint_interval}')
+        self.logger.info(f'Resume: {self.resume}')
+
+    def get_modules(self):
+        if self.network == 'res':
+            return list(self.model)
+        return [self.model]
+
+    def wrap_distributed(self, model):
+        if self.cuda:
+            return DistributedDataParallel(
+                model, device_ids=[self.device.index])
+        return DistributedDataParallel(model)
+
+    def unwrap(self, model):
+        if isinstance(model, (DistributedDataParallel, nn.DataParallel)):
+            return model.module
+        return model
+
+    def create_loader(self, dataset, shuffle=False, train=False):
+        if self.distributed:
+            # each process only sees its own shard of the dataset
+            sampler = data.distributed.DistributedSampler(
+                dataset,
+                num_replicas=self.world_size,
+                rank=self.rank,
+                shuffle=shuffle,
+            )
+        elif shuffle:
+            sampler = data.RandomSampler(dataset)
+        else:
+            sampler = data.SequentialSampler(dataset)
+        if train:
+            sampler = ResumableSampler(sampler)
+        # the datasets decode a whole batch at once in __getitems__
+        loader = data.DataLoader(
+            dataset,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers if train else 0,
+            sampler=sampler,
+            collate_fn=collate_batch,
+            pin_memory=self.cuda,
+        )
+        if not self.prefetch:
+            return loader
+        return Prefetcher(
+            loader,
+            self.device,
+            size=self.prefetch,
+            memory_format=self.memory_format,
+        )
+
+    def create_dataset(self, data_file, offset=0, limit=None):
+        if self.format == 'lmdb':
+            return LMDBChessDataset(data_file, offset=offset, limit=limit)
+        return ChessDataset(data_file, offset=offset, limit=limit)
 
     def split_train_test(self, data_files, limit=None):
         test = []
@@ -111,34 +230,29 @@ class SupervisedTrainer():
             else:
                 test_len = round(len(temp) * self.test_ratio)
             del temp
-            if self.format == 'csv':
-                test.append(ChessDataset(f, limit=test_len))
-                train.append(ChessDataset(f, limit=limit, offset=test_len))
-            elif self.format == 'lmdb':
-                test.append(LMDBChessDataset(f, limit=test_len))
-                train.append(LMDBChessDataset(f, limit=limit, offset=test_len))
+            test.append(self.create_dataset(f, limit=test_len))
+            train.append(
+                self.create_dataset(f, offset=test_len, limit=limit))
 
         if len(train) == 1:
             train_dataset = train[0]
-        elif len(train) == 2:
+        elif len(train) == 2 and not self.distributed:
+            # InterleavenDataset ignores the sampled indices, so every
+            # process would read the same rows
             train_dataset = InterleavenDataset(train)
         else:
-            train_dataset = data.ConcatDataset(train)
+            train_dataset = ConcatChessDataset(train)
 
-        return data.DataLoader(
+        return self.create_loader(
             train_dataset,
-            batch_size=self.batch_size,
-            num_workers=4,
-            shuffle=(self.format == 'csv')
-        ), data.DataLoader(
-            data.ConcatDataset(test),
-            batch_size=self.batch_size,
-        )
+            shuffle=(self.format == 'csv'),
+            train=True,
+        ), self.create_loader(ConcatChessDataset(test))
 
     def get_variables_from_inputs(self, row):
         # get the inputs
         inputs, move, value = row
-        inputs = inputs.to(self.device)
+        inputs = inputs.to(self.device, memory_format=self.memory_format)
 
         if self.network == 'value':
             labels = value.to(self.device)
@@ -157,10 +271,25 @@ class SupervisedTrainer():
         else:
             outputs = self.model(inputs)
             if self.network == 'policy':
-                return outputs.view(outputs.shape[0], -1)
+                return outputs.reshape(outputs.shape[0], -1)
             if self.network == 'value':
                 return outputs
 
+    def autocast(self):
+        # bfloat16 keeps the float32 exponent range, so unlike float16 it
+        # doesn't need a gradient scaler
+        return torch.autocast(
+            self.device.type,
+            dtype=torch.bfloat16,
+            enabled=self.mixed_precision,
+        )
+
+    def compute_loss(self, outputs, labels):
+        if self.network == 'res':
+            # MSECrossEntropyLoss upcasts the predictions itself
+            return self.criterion(outputs, labels)
+        return self.criterion(outputs.float(), labels)
+
     def run(self):
         if self.network == 'res':
             params = itertools.chain(*[m.parameters() for m in self.model])
@@ -176,29 +305,74 @@ class SupervisedTrainer():
             optimizer,
             patience=1
         )
-        for epoch in range(self.num_epochs):
+        start_epoch = 0
+        start_batch = 0
+        if self.resume:
+            start_epoch, start_batch = self.load_checkpoint(
+                self.resume, optimizer, scheduler)
+        for epoch in range(start_epoch, self.num_epochs):
             self.logger.info(f'Epoch {epoch}')
-            self.train(epoch, optimizer)
+            self.train(epoch, optimizer, scheduler, start=start_batch)
+            start_batch = 0
             self.save(epoch)
             loss = self.test(epoch)
             scheduler.step(loss)
+            self.save_checkpoint(epoch + 1, 0, optimizer, scheduler)
+        self.checkpoint_writer.close()
+
+    def save_checkpoint(self, epoch, batch, optimizer, scheduler=None):
+        if self.rank != 0:
+            return
+        state = {
+            'epoch': epoch,
+            'batch': batch,
+            'models': [
+                self.unwrap(m).state_dict() for m in self.get_modules()],
+            'optimizer': optimizer.state_dict(),
+            'scheduler': scheduler.state_dict() if scheduler else None,
+            'epoch_rng_state': self.epoch_rng_state,
+            'rng_state': get_rng_state(),
+        }
+        filename = 'Checkpoint'
+        filename += f"_{datetime.datetime.now():%Y-%m-%d_%H:%M:%S}"
+        filename += f"_{epoch}_{batch}.ckpt"
+        filepath = os.path.join(self.model_path, filename)
+        self.logger.info(f'Saving checkpoint: {filepath}')
+        self.checkpoint_writer.save(state, filepath, rotate=True)
+
+    def load_checkpoint(self, filepath, optimizer, scheduler=None):
+        self.logger.info(f'Resuming from checkpoint: {filepath}')
+        state = load_checkpoint(filepath)
+        for m, state_dict in zip(self.get_modules(), state['models']):
+            self.unwrap(m).load_state_dict(state_dict)
+        optimizer.load_state_dict(state['optimizer'])
+        if scheduler and state['scheduler']:
+            scheduler.load_state_dict(state['scheduler'])
+        self.epoch_rng_state = state['epoch_rng_state']
+        self.resume_rng_state = state['rng_state']
+        if not state['batch']:
+            set_rng_state(self.resume_rng_state)
+        return state['epoch'], state['batch']
 
     def save(self, epoch):
+        if self.rank != 0:
+            # every process holds the same weights
+            return
         if self.network == 'res':
             name_model = [
-                ('Tower', self.model[0]),
-                ('PolicyHead', self.model[1]),
-                ('ValueHead', self.model[2]),
+                ('Tower', self.unwrap(self.model[0])),
+                ('PolicyHead', self.unwrap(self.model[1])),
+                ('ValueHead', self.unwrap(self.model[2])),
             ]
         else:
-            name_model = [(self.model.name, self.model)]
+            model = self.unwrap(self.model)
+            name_model = [(model.name, model)]
         for filename, model in name_model:
             filename += f"_{datetime.datetime.now():%Y-%m-%d_%H:%M:%S}"
             filename += f"_{epoch}.model"
             filepath = os.path.join(self.model_path, filename)
             self.logger.info(f'Saving: {filepath}')
-            torch.save(model.state_dict(), filepath)
-            self.logger.info('Done saving')
+            self.checkpoint_writer.save(model.state_dict(), filepath)
 
     def test(self, epoch):
         self.logger.info('Testing...')
@@ -208,67 +382,55 @@ class SupervisedTrainer():
         else:
             self.model.eval()
 
-        losses = []
-        mse_losses = []
-        cross_entropy_losses = []
-        policy_or_res = self.network in ('res', 'policy')
-        if policy_or_res:
-            predictions = np.array([])
-            answers = np.array([])
-        for i, row in enumerate(self.test_data):
-            inputs, labels = self.get_variables_from_inputs(row)
+        metrics = StreamingMetrics()
+        with torch.no_grad():
+            for row in self.test_data:
+                inputs, labels = self.get_variables_from_inputs(row)
 
-            # loss
-            outputs = self.predict(inputs)
-            loss = self.criterion(outputs, labels)
-            if self.network == 'res':
-                total_loss, mse_loss, cross_entropy_loss = loss
-                losses.append(total_loss.item())
-                mse_losses.append(mse_loss.item())
-                cross_entropy_losses.append(cross_entropy_loss.item())
-            else:
-                losses.append(loss.item())
-
-            if policy_or_res:
-                if self.network == 'res':
-                    move_outputs, _ = outputs
-                    _, prediction = move_outputs.max(1)
-                else:
-                    _, prediction = outputs.max(1)
-                predictions = np.append(predictions, prediction)
-                if self.network == 'res':
-                    move_labels, _ = labels
-                    answers = np.append(answers, move_labels)
-                else:
-                    answers = np.append(answers, labels)
-
-        avg_loss = np.average(losses)
-        if self.network == 'res':
-            avg_mse_loss = np.average(mse_losses)
-            avg_cross_entropy_loss = np.average(cross_entropy_losses)
-        if policy_or_res:
-            precision = metrics.precision_score(
-                answers,
-                predictions,
-                average='micro'
-            )
-            recall = metrics.recall_score(
-                answers, predictions, average='micro')
-            f1_score = metrics.f1_score(answers, predictions, average='micro')
+                # loss
+                with self.autocast():
+                    outputs = self.predict(inputs)
+                loss = self.compute_loss(outputs, labels)
+                self.update_metrics(metrics, outputs, labels, loss)
+        if self.distributed:
+            metrics.all_reduce(self.device)
+
+        avg_loss = metrics.avg_loss()
         self.logger.info(f'Avg. loss at epoch {epoch}: {avg_loss}')
         if self.network == 'res':
-            self.logger.info(f'Avg. mse loss at epoch {epoch}: {avg_mse_loss}')
+            self.logger.info(
+                f'Avg. mse loss at epoch {epoch}: {metrics.avg_mse_loss()}')
             self.logger.info(
                 f'Avg. cross entropy loss at epoch {epoch}: '
-                f'{avg_cross_entropy_loss}')
-        if policy_or_res:
-            self.logger.info(f'Precision at epoch {epoch}: {precision}')
-            self.logger.info(f'Recall at epoch {epoch}: {recall}')
-            self.logger.info(f'F1 score at epoch {epoch}: {f1_score}')
+                f'{metrics.avg_cross_entropy_loss()}')
+        if self.network in ('res', 'policy'):
+            # micro-averaged precision, recall and F1 are all equal to
+            # the top-1 accuracy for single-label predictions
+            for k in metrics.top_k:
+                self.logger.info(
+                    f'Top-{k} accuracy at epoch {epoch}: '
+                    f'{metrics.accuracy(k)}')
+        if self.network in ('res', 'value'):
+            self.logger.info(
+                f'Value mse at epoch {epoch}: {metrics.value_mse()}')
         self.logger.info('Testing finished')
         return avg_loss
 
-    def train(self, epoch, optimizer):
+    def update_metrics(self, metrics, outputs, labels, loss):
+        if self.network == 'res':
+            metrics.update_loss(*loss)
+            move_outputs, value_outputs = outputs
+            move_labels, value_labels = labels
+            metrics.update_moves(move_outputs, move_labels)
+            metrics.update_values(value_outputs, value_labels)
+        elif self.network == 'policy':
+            metrics.update_loss(loss)
+            metrics.update_moves(outputs, labels)
+        else:
+            metrics.update_loss(loss)
+            metrics.update_values(outputs, labels)
+
+    def train(self, epoch, optimizer, scheduler=None, start=0):
         self.logger.info('Training...')
         if self.network == 'res':
             for m in self.model:
@@ -276,8 +438,22 @@ class SupervisedTrainer():
         else:
             self.model.train()
 
+        self.train_data.sampler.set_epoch(epoch)
+        if start:
+            self.logger.info(f'Skipping to batch {start}')
+            # replay the random state of the start of the epoch so that the
+            # sampler draws the same order as before
+            set_rng_state(self.epoch_rng_state)
+            self.train_data.sampler.start = start * self.batch_size
+        else:
+            self.epoch_rng_state = get_rng_state()
         running_loss = 0.0
-        for i, row in enumerate(self.train_data):
+        for i, row in enumerate(self.train_data, start):
+            if start and i == start:
+                # the sampler has drawn the order of this epoch by now, so
+                # continue with the random state of the checkpoint
+                set_rng_state(self.resume_rng_state)
+
             # get the inputs and labels
             inputs, labels = self.get_variables_from_inputs(row)
 
@@ -285,9 +461,10 @@ class SupervisedTrainer():
             optimizer.zero_grad()
 
             # forward + backward + optimize
-            outputs = self.predict(inputs)
+            with self.autocast():
+                outputs = self.predict(inputs)
 
-            loss = self.criterion(outputs, labels)
+            loss = self.compute_loss(outputs, labels)
             if self.network == 'res':
                 loss = loss[0]
             loss.backward()
@@ -299,6 +476,9 @@ class SupervisedTrainer():
                 self.logger.info('[%d, %5d] loss: %.3f' %
                                  (epoch, i, avg_loss))
                 running_loss = 0.0
+            if self.checkpoint_interval and \
+               i % self.checkpoint_interval == self.checkpoint_interval - 1:
+                self.save_checkpoint(epoch, i + 1, optimizer, scheduler)
 
         self.logger.info('Training finished')
 
@@ -323,6 +503,21 @@ def run():
     parser.add_argument('--saved-value-model')
     parser.add_argument('-r', '--learning-rate', type=float)
     parser.add_argument('-n', '--network', default='res')
+    parser.add_argument('--mixed-precision', action='store_true')
+    parser.add_argument('--channels-last', action='store_true')
+    parser.add_argument('--distributed', action='store_true')
+    parser.add_argument('--backend')
+    parser.add_argument('-w', '--num-workers', type=int)
+    parser.add_argument('--prefetch', type=int)
+    parser.add_argument('-k', '--checkpoint-interval', type=int)
+    parser.add_argument('--keep-checkpoints', type=int)
+    parser.add_argument('--resume')
+    parser.add_argument(
+        '--distill',
+        action='store_true',
+        help='train on the soft targets of a teacher, see '
+             'yureka.learn.trainers.distill',
+    )
 
     args = parser.parse_args()
 
@@ -378,8 +573,32 @@ def run():
         trainer_setting['data_limit'] = args.data_limit
     if args.split_data:
         trainer_setting['split_data'] = args.split_data
-    trainer = SupervisedTrainer(**trainer_setting)
+    if args.mixed_precision:
+        trainer_setting['mixed_precision'] = args.mixed_precision
+    if args.channels_last:
+        trainer_setting['channels_last'] = args.channels_last
+    if args.distributed:
+        trainer_setting['distributed'] = args.distributed
+    if args.backend:
+        trainer_setting['backend'] = args.backend
+    if args.num_workers is not None:
+        trainer_setting['num_workers'] = args.num_workers
+    if args.prefetch is not None:
+        trainer_setting['prefetch'] = args.prefetch
+    if args.checkpoint_interval:
+        trainer_setting['checkpoint_interval'] = args.checkpoint_interval
+    if args.keep_checkpoints:
+        trainer_setting['keep_checkpoints'] = args.keep_checkpoints
+    if args.resume:
+        trainer_setting['resume'] = args.resume
+    trainer_class = SupervisedTrainer
+    if args.distill:
+        from .distill import DistillationTrainer
+        trainer_class = DistillationTrainer
+    trainer = trainer_class(**trainer_setting)
     trainer.run()
+    if args.distributed:
+        dist.destroy_process_group()
 
 
 if __name__ == '__main__':
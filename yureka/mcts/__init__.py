@@ -1,8 +1,10 @@
 import attr
 import chess
 import math
+import queue
 import time
 import random
+import threading
 
 from ..common.utils import print_flush
 from ..learn.data.board_data import get_reward
@@ -12,7 +14,19 @@ from ..learn.data.move_translator import (
 )
 
 from .errors import MCTSError
-from .constants import DEFAULT_CONFIDENCE
+from .constants import (
+    DEFAULT_CONFIDENCE,
+    DEFAULT_SEED,
+    DEFAULT_INFO_INTERVAL,
+    DEFAULT_MAX_NODES,
+    PRUNE_RATIO,
+    PLAYOUT_COST_SMOOTHING,
+    WDL_DRAW_SHARE,
+    DEFAULT_MIXING,
+    DEFAULT_ROLLOUT_DEPTH,
+    ROLLOUT_PIECE_VALUES,
+    ROLLOUT_MATERIAL_SCALE,
+)
 
 
 @attr.s
@@ -23,6 +37,8 @@ class Node():
     value = attr.ib(default=0)
     visit = attr.ib(default=0)
     board = attr.ib(default=chess.Board())
+    # number of nodes in the subtree rooted at this node
+    size = attr.ib(default=1)
 
     def q(self):
         if self.visit == 0:
@@ -46,12 +62,167 @@ class Node():
         )
 
 
+@attr.s
+class TreeReclaimer():
+    """Frees discarded subtrees on a background thread.
+
+    Children point back to their parents, so a discarded subtree is full of
+    reference cycles that only the cyclic garbage collector would free, all
+    at once. Breaking the cycles here lets reference counting free the
+    nodes bit by bit, away from the search.
+    """
+    def __attrs_post_init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def reclaim(self, nodes, keep=None):
+        # keep is a node under one of nodes that's still in use
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.work, daemon=True)
+            self.thread.start()
+        self.queue.put((list(nodes), keep))
+
+    def work(self):
+        while True:
+            stack, keep = self.queue.get()
+            while stack:
+                node = stack.pop()
+                if node is keep:
+                    continue
+                node.parent = None
+                stack.extend(node.children.values())
+                node.children = {}
+            self.queue.task_done()
+
+    def wait(self):
+        self.queue.join()
+
+
+@attr.s
+class SearchLimits():
+    duration = attr.ib(default=math.inf)
+    nodes = attr.ib(default=None)
+    depth = attr.ib(default=None)
+    # decides when to stop within duration, see engine.time_manager
+    clock = attr.ib(default=None)
+
+    def infinite(self):
+        return math.isinf(self.duration) and self.nodes is None and \
+            self.depth is None
+
+
+@attr.s
+class SearchStats():
+    """Where the time of a search went, collected by MCTS when profile is
+    on. Times are in seconds. network is the time of the policy and value
+    evaluations, which the other phases don't include.
+
+    With a network shared by the policy and the value, the value of the
+    child picked by expand is queued and evaluated in one batch with the
+    policy of the leaf. hits are the values read from those batches, and
+    misses the ones evaluated on their own.
+    """
+    playouts = attr.ib(default=0)
+    select_time = attr.ib(default=0.0)
+    expand_time = attr.ib(default=0.0)
+    simulate_time = attr.ib(default=0.0)
+    backup_time = attr.ib(default=0.0)
+    network_time = attr.ib(default=0.0)
+    # leaves given children, and how many
+    expanded = attr.ib(default=0)
+    children = attr.ib(default=0)
+    # leaves without legal moves, which need no policy evaluation
+    terminal = attr.ib(default=0)
+    # playouts cut off by the deadline before the value evaluation
+    abandoned = attr.ib(default=0)
+    # visits of the tree kept from the previous search
+    reused = attr.ib(default=0)
+    queued = attr.ib(default=0)
+    hits = attr.ib(default=0)
+    misses = attr.ib(default=0)
+    # end of the last lap
+    last = attr.ib(default=0.0, repr=False)
+
+    def lap(self, phase=None):
+        # adds the time since the last lap to phase
+        now = time.perf_counter()
+        if phase is not None:
+            name = f'{phase}_time'
+            setattr(self, name, getattr(self, name) + now - self.last)
+        self.last = now
+
+    def total_time(self):
+        return self.select_time + self.expand_time + self.simulate_time + \
+            self.backup_time + self.network_time
+
+    def evaluations(self):
+        # calls of the networks, each a policy or a value on its own
+        return self.expanded + self.misses
+
+    def batch_size(self):
+        # mean number of positions per evaluation
+        if not self.evaluations():
+            return 0
+        return (self.evaluations() + self.queued) / self.evaluations()
+
+    def info(self):
+        line = f'info string profile playouts {self.playouts}'
+        total = self.total_time()
+        for phase in ('select', 'expand', 'simulate', 'backup', 'network'):
+            phase_time = getattr(self, f'{phase}_time')
+            share = phase_time / total if total else 0
+            line += f' {phase} {phase_time * 1000:.1f}ms {share:.0%}'
+        line += f' expanded {self.expanded} children {self.children}'
+        line += f' terminal {self.terminal} abandoned {self.abandoned}'
+        line += f' evaluations {self.evaluations()}'
+        line += f' batch {self.batch_size():.2f} queued {self.queued}'
+        line += f' hits {self.hits} misses {self.misses}'
+        line += f' reused {self.reused}'
+        return line
+
+
 @attr.s
 class MCTS():
     root = attr.ib()
     value = attr.ib()
     policy = attr.ib()
     confidence = attr.ib(default=DEFAULT_CONFIDENCE)
+    seed = attr.ib(default=DEFAULT_SEED)
+    info_interval = attr.ib(default=DEFAULT_INFO_INTERVAL)
+    show_wdl = attr.ib(default=False)
+    max_nodes = attr.ib(default=DEFAULT_MAX_NODES)
+    reclaimer = attr.ib(default=attr.Factory(TreeReclaimer))
+    # picks the moves of rollouts, see networks.rollout
+    rollout_policy = attr.ib(default=None)
+    mixing = attr.ib(default=DEFAULT_MIXING)
+    rollout_depth = attr.ib(default=DEFAULT_ROLLOUT_DEPTH)
+    # collect a SearchStats of every search in stats
+    profile = attr.ib(default=False)
+
+    def __attrs_post_init__(self):
+        self.previous_root = None
+        # visit, value and size of the root when it was advanced to
+        self.advanced_from = None
+        # (node, board, value function) of the child picked by expand
+        self.prefetched = None
+        self.random = random.Random(self.seed)
+        # moving average of the time a playout takes, in seconds
+        self.playout_cost = 0
+        self.stats = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes = 0
+        self.depth_sum = 0
+        self.seldepth = 0
+        if self.profile:
+            self.stats = SearchStats(reused=self.root.visit)
+
+    def depth(self):
+        # average depth of the playouts of the current search
+        if not self.nodes:
+            return 0
+        return round(self.depth_sum / self.nodes)
 
     def select(self):
         node = self.root
@@ -68,49 +239,256 @@ class MCTS():
         if node.children:
             raise MCTSError(node, 'Cannot expand a non-leaf node')
         if node.board.legal_moves:
-            priors = self.policy.get_probs(node.board).squeeze()
             for move in node.board.legal_moves:
+                node.add_child(move)
+            # the child to simulate is picked before the policy is
+            # evaluated, so that its value can be evaluated with it
+            child = self.random.choice(list(node.children.values()))
+            self.lap('expand')
+            self.prefetch_value(child)
+            # one copy to python floats, rather than a tensor per child
+            priors = self.policy.get_probs(node.board).squeeze().tolist()
+            self.lap('network')
+            for move, c in node.children.items():
                 engine_move = translate_to_engine_move(move, node.board.turn)
-                index = get_engine_move_index(engine_move)
-                prior = priors.data[index]
-                node.add_child(move, prior=prior)
-            return random.choice(list(node.children.values()))
+                c.prior = priors[get_engine_move_index(engine_move)]
+            walker = node
+            while walker:
+                walker.size += len(node.children)
+                walker = walker.parent
+            if self.profile:
+                self.stats.expanded += 1
+                self.stats.children += len(node.children)
+            return child
         else:
             # terminal state, just return itself
+            if self.profile:
+                self.stats.terminal += 1
             return node
 
+    def prefetch_value(self, node):
+        # the board simulate starts from, and its value if it can be
+        # evaluated in the same batch as the next policy. a game over
+        # isn't worth checking for here, it only costs an unused row.
+        board = chess.Board(fen=node.board.fen())
+        value = None
+        prefetch = getattr(self.value, 'prefetch', None)
+        if prefetch is not None and \
+                (self.rollout_policy is None or self.mixing != 1):
+            value = prefetch(board, self.root.board.turn)
+            if value is not None and self.profile:
+                self.stats.queued += 1
+        self.prefetched = (node, board, value)
+
+    def take_prefetched(self, node):
+        # (board, value function) of node from prefetch_value, if any
+        prefetched = self.prefetched
+        self.prefetched = None
+        if prefetched is not None and prefetched[0] is node:
+            return prefetched[1:]
+        return chess.Board(fen=node.board.fen()), None
+
+    def evaluate(self, board, prefetched):
+        self.lap('simulate')
+        if prefetched is not None:
+            value = prefetched()
+        else:
+            value = self.value.get_value(board, self.root.board.turn)
+        if self.profile:
+            if prefetched is not None:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+        self.lap('network')
+        return value
+
     def simulate(self, node):
         if node.children:
             raise MCTSError(node, 'cannot simulate from a non-leaf')
-        board = chess.Board(fen=node.board.fen())
+        board, prefetched = self.take_prefetched(node)
         if board.is_game_over(claim_draw=True):
             return get_reward(board.result(claim_draw=True), board.turn)
-        return self.value.get_value(board, self.root.board.turn)
+        if self.rollout_policy is None or not self.mixing:
+            return self.evaluate(board, prefetched)
+        if self.mixing == 1:
+            # the value network isn't needed at all
+            return self.rollout(board)
+        value = self.evaluate(board, prefetched)
+        return (1 - self.mixing) * value + self.mixing * self.rollout(board)
+
+    def rollout(self, board):
+        # plays rollout_policy from board, which is changed, and returns
+        # the result in the perspective of the root
+        color = self.root.board.turn
+        for _ in range(self.rollout_depth):
+            move = self.rollout_policy.get_move(board, self.random)
+            if move is None:
+                break
+            board.push(move)
+        if board.is_checkmate():
+            return get_reward(board.result(), color)
+        if board.is_stalemate() or board.is_insufficient_material():
+            return 0
+        return material_value(board, color)
 
     def backup(self, node, value):
+        # returns the depth of node
+        depth = -1
         walker = node
         while walker:
             walker.visit += 1
             walker.value += value
             walker = walker.parent
+            depth += 1
+        return depth
+
+    def lap(self, phase=None):
+        # timing hook of the phases of a playout, see SearchStats
+        if self.profile:
+            self.stats.lap(phase)
+
+    def playout(self, deadline=None):
+        # returns False if deadline passed before the value evaluation, in
+        # which case the playout is abandoned
+        self.lap()
+        leaf = self.select()
+        self.lap('select')
+        leaf = self.expand(leaf)
+        self.lap('expand')
+        if deadline is not None and time.monotonic() > deadline:
+            if self.profile:
+                self.stats.abandoned += 1
+            return False
+        value = self.simulate(leaf)
+        self.lap('simulate')
+        depth = self.backup(leaf, value)
+        self.lap('backup')
+        if self.profile:
+            self.stats.playouts += 1
+        self.nodes += 1
+        self.depth_sum += depth
+        self.seldepth = max(self.seldepth, depth)
+        return True
 
-    def search(self, duration):
+    def limit_reached(self, limits, elapsed):
+        if limits.clock is not None and limits.clock.time_up(self, elapsed):
+            return True
+        if limits.nodes is not None and self.nodes >= limits.nodes:
+            return True
+        if limits.depth is not None and self.depth() >= limits.depth:
+            return True
+        return False
+
+    def search(self, limits, stop_event=None):
+        self.reset_stats()
         if len(list(self.root.board.legal_moves)) == 1:
             for move in self.root.board.legal_moves:
                 self.root.add_child(move)
             print_flush('info string not searching b/c only one legal move')
             return
-        search_time = continue_search(duration)
-        count = 0
-        for t in search_time:
-            if not t:
-                print_flush(f'info string search iterations: {count}')
+        start = time.monotonic()
+        deadline = start + limits.duration
+        last_info = start
+        while True:
+            now = time.monotonic()
+            # we need at least one playout to pick a move, even if the
+            # search is stopped right away. after that, don't start one
+            # that is expected to end past the deadline.
+            if self.nodes:
+                if self.limit_reached(limits, now - start) or \
+                        (stop_event is not None and stop_event.is_set()):
+                    break
+                if now + self.playout_cost > deadline:
+                    break
+                if not self.playout(deadline):
+                    break
+            else:
+                self.playout()
+            cost = time.monotonic() - now
+            if self.playout_cost:
+                self.playout_cost += PLAYOUT_COST_SMOOTHING * \
+                    (cost - self.playout_cost)
+            else:
+                self.playout_cost = cost
+            if self.tree_size() > self.max_nodes:
+                self.prune()
+            now = time.monotonic()
+            if now - last_info >= self.info_interval:
+                print_flush(self.info(now - start))
+                last_info = now
+        print_flush(self.info(time.monotonic() - start))
+        if self.profile:
+            print_flush(self.stats.info())
+
+    def tree_size(self):
+        return self.root.size
+
+    def prune(self):
+        # turn the least visited subtrees back into leaves until the tree
+        # fits in the budget again
+        target = int(self.max_nodes * PRUNE_RATIO)
+        threshold = 1
+        while self.tree_size() > target and threshold <= self.root.visit:
+            self.collapse(self.root, threshold)
+            threshold *= 2
+
+    def collapse(self, node, threshold):
+        # returns the number of nodes removed under node
+        removed = 0
+        for child in node.children.values():
+            if not child.children:
+                continue
+            if child.visit < threshold:
+                removed += child.size - 1
+                self.reclaimer.reclaim(child.children.values())
+                child.children = {}
+                child.size = 1
+            else:
+                removed += self.collapse(child, threshold)
+        node.size -= removed
+        return removed
+
+    def hashfull(self):
+        # permille of the node budget in use
+        return min(1000, self.tree_size() * 1000 // self.max_nodes)
+
+    def get_pv(self):
+        # the most visited path from the root
+        pv = []
+        node = self.root
+        while node.children:
+            move = max(node.children, key=lambda m: node.children[m].visit)
+            node = node.children[move]
+            if not node.visit:
                 break
-            leaf = self.select()
-            leaf = self.expand(leaf)
-            value = self.simulate(leaf)
-            self.backup(leaf, value)
-            count += 1
+            pv.append(move)
+        return pv
+
+    def get_score(self):
+        # mean value of the most visited move, from the point of view of
+        # the side to move at the root
+        child = self.root.children[self.get_move()]
+        if not child.visit:
+            return 0
+        return child.value / child.visit
+
+    def info(self, elapsed):
+        line = f'info depth {self.depth()} seldepth {self.seldepth}'
+        line += f' nodes {self.nodes}'
+        if elapsed > 0:
+            line += f' nps {int(self.nodes / elapsed)}'
+        line += f' time {int(elapsed * 1000)}'
+        if self.root.children:
+            score = self.get_score()
+            line += f' score cp {value_to_cp(score)}'
+            if self.show_wdl:
+                win, draw, loss = value_to_wdl(score)
+                line += f' wdl {win} {draw} {loss}'
+        line += f' hashfull {self.hashfull()}'
+        pv = self.get_pv()
+        if pv:
+            line += ' pv ' + ' '.join(m.uci() for m in pv)
+        return line
 
     def get_move(self):
         # pick the move with the max visit from the root
@@ -121,22 +499,79 @@ class MCTS():
             key=lambda m: self.root.children[m].visit
         )
 
+    def get_ponder_move(self):
+        # the reply we expect to the move we're about to play
+        child = self.root.children[self.get_move()]
+        if not child.children:
+            return None
+        move = max(
+            child.children,
+            key=lambda m: child.children[m].visit
+        )
+        if not child.children[move].visit:
+            return None
+        return move
+
+    def previous_board(self):
+        if self.previous_root is None:
+            return None
+        return self.previous_root.board
+
+    def advanced_by(self, move):
+        # whether the root is the child of the previous root by move
+        return self.previous_root is not None and \
+            self.previous_root.children.get(move) is self.root
+
+    def rewind_root(self):
+        # go back to the root before the last advance_root
+        child = self.root
+        child.parent = self.previous_root
+        self.root = self.previous_root
+        self.previous_root = None
+        # the playouts since advance_root were only backed up as far as
+        # the child
+        visit, value, size = self.advanced_from
+        self.root.visit += child.visit - visit
+        self.root.value += child.value - value
+        self.root.size += child.size - size
+
     def advance_root(self, move):
+        if self.previous_root is not None:
+            # nothing but the current root is left to rewind to
+            self.reclaimer.reclaim([self.previous_root], keep=self.root)
+        self.previous_root = self.root
         child = self.root.children.get(move)
         if child:
+            self.advanced_from = (child.visit, child.value, child.size)
             self.root = child
         else:
+            # not counted in the size of the root yet
+            self.advanced_from = (0, 0, 0)
             self.root.add_child(move)
             self.root = self.root.children[move]
         self.root.parent = None
 
 
-def continue_search(duration):
-    # search for {duration} seconds
-    remaining = duration
-    while remaining >= 0:
-        start = time.time()
-        yield True
-        end = time.time()
-        remaining -= end - start
-    yield False
+def material_value(board, color):
+    material = 0
+    for piece in board.piece_map().values():
+        value = ROLLOUT_PIECE_VALUES[piece.piece_type]
+        material += value if piece.color == color else -value
+    return math.tanh(material / ROLLOUT_MATERIAL_SCALE)
+
+
+def value_to_cp(value):
+    # the same mapping from expected outcome to centipawns as Leela Chess
+    value = max(-1.0, min(1.0, value))
+    return round(290.680623072 * math.tan(1.548090806 * value))
+
+
+def value_to_wdl(value):
+    # per mille of wins, draws and losses whose expected outcome is value.
+    # the networks don't predict draws, so they are modelled as
+    # WDL_DRAW_SHARE of an even position, fewer the more one-sided it is.
+    value = max(-1.0, min(1.0, value))
+    draw = WDL_DRAW_SHARE * (1 - abs(value))
+    win = round((1 - draw + value) * 500)
+    loss = round((1 - draw - value) * 500)
+    return win, 1000 - win - loss, loss
@@ -1 +1,32 @@
+import chess
+
+
 DEFAULT_CONFIDENCE = 5
+DEFAULT_SEED = 0
+DEFAULT_INFO_INTERVAL = 1.0  # seconds
+# rough size of a Node, its board and its entry in the parent's children
+NODE_BYTES = 2048
+DEFAULT_HASH = 256  # MB
+DEFAULT_MAX_NODES = DEFAULT_HASH * 2**20 // NODE_BYTES
+# prune down to this fraction of the node budget once it's exceeded
+PRUNE_RATIO = 0.9
+# share of draws in the wdl of an even position. it falls linearly to
+# none as the expected outcome goes to a win or a loss.
+WDL_DRAW_SHARE = 0.5
+# weight of the latest playout in the moving average of playout times
+PLAYOUT_COST_SMOOTHING = 0.2
+# weight of the rollout result in the value of a leaf, AlphaGo's lambda.
+# 0 evaluates leaves with the value network only.
+DEFAULT_MIXING = 0.0
+# rollouts that don't end the game by then are scored by material
+DEFAULT_ROLLOUT_DEPTH = 20  # plies
+ROLLOUT_PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 0,
+}
+# a material difference of this many pawns is worth tanh(1)
+ROLLOUT_MATERIAL_SCALE = 10
@@ -1,5 +1,7 @@
+import attr
 import random
 import torch
+import torch.nn as nn
 
 from ...learn.data.move_translator import (
     TOTAL_MOVES,
@@ -14,6 +16,73 @@ from .policy_network import PolicyNetwork
 __all__ = ['ValueNetwork', 'PolicyNetwork']
 
 
+class Head(nn.Module):
+    """Makes one output of a network that returns (policy, value), like a
+    TorchScript model or a RemoteNetwork, look like a model with a single
+    head.
+    """
+    def __init__(self, network, index):
+        super(Head, self).__init__()
+        self.network = network
+        self.index = index
+
+    def forward(self, x):
+        outputs = self.network(x)
+        if isinstance(outputs, tuple):
+            return outputs[self.index]
+        return outputs
+
+    @property
+    def shared(self):
+        return isinstance(self.network, SharedNetwork)
+
+    def queue(self, x):
+        return self.network.queue(x)
+
+    def output(self, queued):
+        # this head's output for the inputs of queued, once evaluated
+        return queued.outputs[self.index]
+
+
+@attr.s
+class Queued():
+    # inputs waiting for the next call of a SharedNetwork, then their
+    # outputs
+    inputs = attr.ib()
+    outputs = attr.ib(default=None)
+
+
+class SharedNetwork(nn.Module):
+    """A network that returns (policy, value), shared by the Heads of a
+    PolicyNetwork and a ValueNetwork.
+
+    A playout evaluates the policy of the leaf and then the value of one
+    of its children. The search queues the input of that value first, and
+    it goes through the network in the same batch as the policy. The
+    outputs are handed back on the Queued returned by queue, so nothing
+    is left behind when they aren't used.
+    """
+    def __init__(self, network):
+        super(SharedNetwork, self).__init__()
+        self.network = network
+        self.queued = None
+
+    def queue(self, x):
+        # x is in a reused input buffer
+        self.queued = Queued(x.clone())
+        return self.queued
+
+    def forward(self, x):
+        if self.queued is None:
+            return self.network(x)
+        queued = self.queued
+        self.queued = None
+        outputs = self.network(torch.cat([x, queued.inputs]))
+        batch = x.shape[0]
+        queued.outputs = tuple(o[batch:] for o in outputs)
+        return tuple(o[:batch] for o in outputs)
+
+
 class ZeroValue():
     def get_value(self, board, color):
         return 0
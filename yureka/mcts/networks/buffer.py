@@ -0,0 +1,75 @@
+import attr
+import torch
+
+from ...learn.data.board_data import BOARD_SIZE
+from ...learn.data.chess_dataset import (
+    get_history,
+    get_planes,
+    write_planes_from_row,
+)
+
+
+@attr.s
+class InputBuffer():
+    """Reusable input batch of an evaluator.
+
+    Rows are encoded straight into the slots of a host buffer, which is
+    pinned when the model is on cuda so that the copy into the device
+    buffer doesn't block. The buffers are allocated on the first fill,
+    once the number of planes is known, and again only for a bigger
+    batch. The returned batch is overwritten by the next fill.
+    """
+    device = attr.ib()
+
+    def __attrs_post_init__(self):
+        self.host = None
+        self.inputs = None
+
+    def fill(self, rows):
+        batch = len(rows)
+        planes = get_planes(get_history(rows[0]))
+        if self.host is None or self.host.shape[0] < batch or \
+                self.host.shape[1] != planes:
+            self.allocate((batch, planes) + BOARD_SIZE)
+        slots = self.host.numpy()
+        for i, row in enumerate(rows):
+            write_planes_from_row(row, slots[i])
+        if self.inputs is self.host:
+            return self.host[:batch]
+        return self.inputs[:batch].copy_(self.host[:batch], non_blocking=True)
+
+    def allocate(self, shape):
+        cuda = self.device.type == 'cuda'
+        self.host = torch.empty(shape, pin_memory=cuda)
+        if cuda:
+            self.inputs = torch.empty(shape, device=self.device)
+        else:
+            self.inputs = self.host
+
+
+@attr.s
+class OutputBuffer():
+    """Reusable host batch that the outputs of an evaluator are read back
+    into.
+
+    It's pinned when the model is on cuda, so the copy back doesn't go
+    through a pageable staging buffer. Like InputBuffer, it's allocated on
+    the first read and again only for a bigger batch or a different shape,
+    and the returned batch is overwritten by the next read.
+    """
+    device = attr.ib()
+
+    def __attrs_post_init__(self):
+        self.host = None
+
+    def read(self, outputs):
+        batch = outputs.shape[0]
+        if self.host is None or self.host.shape[0] < batch or \
+                self.host.shape[1:] != outputs.shape[1:] or \
+                self.host.dtype != outputs.dtype:
+            self.host = torch.empty(
+                outputs.shape,
+                dtype=outputs.dtype,
+                pin_memory=self.device.type == 'cuda',
+            )
+        return self.host[:batch].copy_(outputs)
@@ -7,7 +7,6 @@ import torch.nn.functional as F
 
 from torch.distributions import Categorical
 
-from ...learn.data.chess_dataset import get_tensor_from_row
 from ...learn.data.move_translator import (
     translate_to_engine_move,
     translate_from_engine_move,
@@ -15,6 +14,7 @@ from ...learn.data.move_translator import (
     get_engine_move_index,
 )
 from ...learn.data.board_data import get_board_data
+from .buffer import InputBuffer, OutputBuffer
 
 
 @attr.s
@@ -31,6 +31,9 @@ class PolicyNetwork():
         else:
             self.device = torch.device('cpu')
         self.model.to(self.device)
+        self.inputs = InputBuffer(self.device)
+        self.outputs = OutputBuffer(self.device)
+        self.move_filter = None
         if self.train:
             self.model.train()
         else:
@@ -39,15 +42,18 @@ class PolicyNetwork():
     def get_probs(self, board):
         board_data = get_board_data(board, board.turn)
         with torch.set_grad_enabled(self.train):
-            inputs = get_tensor_from_row(board_data)
-            inputs = inputs.view(1, *inputs.shape).to(self.device)
+            inputs = self.inputs.fill([board_data])
+            if self.train:
+                # autograd keeps the inputs around until backward
+                inputs = inputs.clone()
             outputs = self.model(inputs)
 
             probs = F.softmax(outputs.view(outputs.shape[0], -1), dim=1)
             if self.train:
                 # clamp to 1e-12 for numerical stability
                 probs = probs.clamp(min=1e-12)
-            return self.filter_illegal_moves(board, probs)
+                return self.filter_illegal_moves(board, probs)
+            return self.outputs.read(self.filter_illegal_moves(board, probs))
 
     def get_move(self, board, sample=False):
         probs = self.get_probs(board)
@@ -85,22 +91,32 @@ class PolicyNetwork():
         else:
             return move
 
+    def get_move_filter(self, shape):
+        if self.train:
+            # autograd keeps the filter around until backward
+            return torch.zeros(shape, device=self.device)
+        if self.move_filter is None or self.move_filter.shape != shape:
+            self.move_filter = torch.zeros(shape, device=self.device)
+        return self.move_filter.zero_()
+
     def filter_illegal_moves(self, board, probs):
-        move_filter = torch.zeros(probs.shape).to(self.device)
+        move_filter = self.get_move_filter(probs.shape)
         move_indeces = []
         for move in board.legal_moves:
             engine_move = translate_to_engine_move(move, board.turn)
             index = get_engine_move_index(engine_move)
             move_indeces.append(index)
-        indeces = torch.LongTensor(move_indeces).to(self.device)
+        indeces = torch.tensor(move_indeces, device=self.device)
         move_filter.index_fill_(1, indeces, 1)
 
-        filtered = probs * move_filter
+        if self.train:
+            filtered = probs * move_filter
+        else:
+            # probs is a fresh softmax that nothing else holds on to
+            filtered = probs.mul_(move_filter)
         if not filtered.nonzero().size():
             # all the moves have zero probs. so make it uniform
             # by setting the probs of legal moves to 1
-            move_filter = torch.zeros(probs.shape).to(self.device)
-            move_filter.index_fill_(1, indeces, 1)
             filtered = filtered + move_filter
         return filtered
 
@@ -0,0 +1,212 @@
+import attr
+import concurrent.futures
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+import torch
+import torch.nn as nn
+
+
+DEFAULT_SOCKET_PATH = '/tmp/yureka.sock'
+DEFAULT_MAX_BATCH = 256
+DEFAULT_BATCH_WAIT = 0.002  # seconds
+
+# requests are (batch, channels, height, width) followed by the inputs,
+# responses (batch, policy size, value size) followed by the policies and
+# the values. both processes are on the same host, so tensors are sent as
+# native float32.
+REQUEST = struct.Struct('!4I')
+RESPONSE = struct.Struct('!3I')
+FLOAT_BYTES = 4
+
+STOP = object()
+
+
+def receive(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError('connection closed')
+        view = view[received:]
+    return data
+
+
+def receive_tensor(sock, shape):
+    size = FLOAT_BYTES
+    for dim in shape:
+        size *= dim
+    data = receive(sock, size)
+    return torch.frombuffer(data, dtype=torch.float32).view(*shape)
+
+
+def tensor_bytes(tensor):
+    return tensor.detach().float().cpu().contiguous().numpy().tobytes()
+
+
+class RemoteNetwork(nn.Module):
+    """Evaluates positions on an InferenceServer instead of a local model.
+
+    Returns (policy, value) like res.Network, so use it with Head for
+    PolicyNetwork and ValueNetwork. The heads of one engine share the
+    connection.
+    """
+    def __init__(self, path=DEFAULT_SOCKET_PATH):
+        super(RemoteNetwork, self).__init__()
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.lock = threading.Lock()
+
+    def forward(self, x):
+        with self.lock:
+            self.sock.sendall(REQUEST.pack(*x.shape) + tensor_bytes(x))
+            batch, policy_size, value_size = RESPONSE.unpack(
+                receive(self.sock, RESPONSE.size))
+            policy = receive_tensor(self.sock, (batch, policy_size))
+            value = receive_tensor(self.sock, (batch, value_size))
+        return policy.to(x.device), value.to(x.device)
+
+    def close(self):
+        self.sock.close()
+
+
+@attr.s
+class InferenceServer():
+    """Owns a model that returns (policy, value) and evaluates the
+    positions of every connected RemoteNetwork with it.
+
+    Requests that come in together are evaluated as one batch. A batch is
+    sent off once every client has a request in it, max_batch positions
+    are collected or batch_wait seconds have passed since the first one,
+    whichever comes first.
+    """
+    model = attr.ib()
+    path = attr.ib(default=DEFAULT_SOCKET_PATH)
+    device = attr.ib(default=torch.device('cpu'))
+    max_batch = attr.ib(default=DEFAULT_MAX_BATCH)
+    batch_wait = attr.ib(default=DEFAULT_BATCH_WAIT)
+
+    def __attrs_post_init__(self):
+        self.model = self.model.to(self.device).eval()
+        self.requests = queue.Queue()
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.listener = None
+        self.batcher = None
+        self.batches = 0
+        self.positions = 0
+
+    def start(self):
+        if os.path.exists(self.path):
+            # left behind by a server that didn't shut down cleanly
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen()
+        threading.Thread(target=self.accept, daemon=True).start()
+        self.batcher = threading.Thread(target=self.batch, daemon=True)
+        self.batcher.start()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self.batcher.join()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.listener is None:
+            return
+        self.listener.close()
+        self.listener = None
+        self.requests.put(STOP)
+        with self.lock:
+            clients = list(self.clients)
+        for conn in clients:
+            conn.shutdown(socket.SHUT_RDWR)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except (OSError, AttributeError):
+                # closed
+                return
+            threading.Thread(
+                target=self.handle, args=(conn, ), daemon=True).start()
+
+    def handle(self, conn):
+        with self.lock:
+            self.clients.add(conn)
+        try:
+            while True:
+                shape = REQUEST.unpack(receive(conn, REQUEST.size))
+                future = concurrent.futures.Future()
+                self.requests.put((receive_tensor(conn, shape), future))
+                policy, value = future.result()
+                conn.sendall(
+                    RESPONSE.pack(policy.shape[0], policy.shape[1],
+                                  value.shape[1]) +
+                    tensor_bytes(policy) + tensor_bytes(value)
+                )
+        except OSError:
+            # the client disconnected, or the server is closing
+            pass
+        except Exception as e:
+            print(f'inference failed: {e}', file=sys.stderr)
+        finally:
+            with self.lock:
+                self.clients.discard(conn)
+            conn.close()
+
+    def batch(self):
+        while True:
+            item = self.requests.get()
+            if item is STOP:
+                return
+            items = [item]
+            positions = item[0].shape[0]
+            deadline = time.monotonic() + self.batch_wait
+            while positions < self.max_batch and \
+                    len(items) < len(self.clients):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is STOP:
+                    self.requests.put(STOP)
+                    break
+                items.append(item)
+                positions += item[0].shape[0]
+            self.evaluate(items)
+
+    def evaluate(self, items):
+        try:
+            inputs = torch.cat([inputs for inputs, _ in items])
+            with torch.no_grad():
+                policy, value = self.model(inputs.to(self.device))
+            policy = policy.reshape(policy.shape[0], -1).cpu()
+            value = value.reshape(value.shape[0], -1).cpu()
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.positions += inputs.shape[0]
+        start = 0
+        for inputs, future in items:
+            end = start + inputs.shape[0]
+            future.set_result((policy[start:end], value[start:end]))
+            start = end
@@ -0,0 +1,65 @@
+import attr
+import chess
+import numpy as np
+
+from ...learn.data.move_translator import (
+    translate_to_engine_move,
+    get_engine_move_index,
+    square_invert,
+)
+
+
+def piece_square_features(board):
+    # indices of the nonzero inputs of a LinearPolicy. the piece planes
+    # are black's then white's, from the perspective of the side to move.
+    features = []
+    for square, piece in board.piece_map().items():
+        if board.turn == chess.BLACK:
+            square = square_invert(square)
+        plane = piece.piece_type - chess.PAWN
+        if piece.color == chess.WHITE:
+            plane += len(chess.PIECE_TYPES)
+        features.append(plane * 64 + square)
+    return features
+
+
+@attr.s
+class RolloutPolicy():
+    """Picks the moves of rollouts with a LinearPolicy, or uniformly at
+    random without one.
+
+    The inputs are sparse, so the logit of each legal move is just the
+    sum of the weights of the pieces on the board, which is done in numpy
+    without going through torch.
+    """
+    model = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        # translating moves is most of the work otherwise
+        self.move_indices = {}
+        if self.model is not None:
+            linear = self.model.linear
+            # (features, moves), so that a piece's weights are a row
+            self.weight = np.ascontiguousarray(
+                linear.weight.detach().float().cpu().numpy().T)
+            self.bias = linear.bias.detach().float().cpu().numpy()
+
+    def get_move(self, board, rand):
+        # None if there are no legal moves
+        moves = list(board.legal_moves)
+        if len(moves) < 2 or self.model is None:
+            return rand.choice(moves) if moves else None
+        indices = [self.move_index(m, board.turn) for m in moves]
+        logits = self.bias[indices] + self.weight[
+            np.ix_(piece_square_features(board), indices)].sum(axis=0)
+        weights = np.exp(logits - logits.max())
+        return rand.choices(moves, weights=weights)[0]
+
+    def move_index(self, move, color):
+        key = (move.from_square, move.to_square, move.promotion, color)
+        index = self.move_indices.get(key)
+        if index is None:
+            index = get_engine_move_index(
+                translate_to_engine_move(move, color))
+            self.move_indices[key] = index
+        return index
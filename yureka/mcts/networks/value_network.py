@@ -3,7 +3,7 @@ import chess
 import torch
 
 from ...learn.data.board_data import get_board_data
-from ...learn.data.chess_dataset import get_tensor_from_row
+from .buffer import InputBuffer, OutputBuffer
 
 
 @attr.s
@@ -20,17 +20,32 @@ class ValueNetwork():
         else:
             self.device = torch.device('cpu')
         self.network.to(self.device)
+        self.inputs = InputBuffer(self.device)
+        self.outputs = OutputBuffer(self.device)
 
     def get_value(self, board, color):
         board_data = get_board_data(board, color)
         with torch.no_grad():
-            tensor = get_tensor_from_row(board_data)
-            tensor = tensor.unsqueeze(0)
-            tensor = tensor.to(self.device)
-            value = self.network(tensor).squeeze().item()
-
-            # value network returns the result in the perspective of
-            # WHITE. So, we need to negate it if color is black
-            if color == chess.BLACK:
-                return -value
-            return value
+            inputs = self.inputs.fill([board_data])
+            return self.read_value(self.network(inputs), color)
+
+    def read_value(self, outputs, color):
+        value = self.outputs.read(outputs).squeeze().item()
+
+        # value network returns the result in the perspective of
+        # WHITE. So, we need to negate it if color is black
+        if color == chess.BLACK:
+            return -value
+        return value
+
+    def prefetch(self, board, color):
+        """Queues board to be evaluated in the same batch as the next
+        policy, when the network is shared with it. Returns a function
+        that returns the value of board after that, or None.
+        """
+        if not getattr(self.network, 'shared', False):
+            return None
+        with torch.no_grad():
+            queued = self.network.queue(
+                self.inputs.fill([get_board_data(board, color)]))
+        return lambda: self.read_value(self.network.output(queued), color)
@@ -0,0 +1,62 @@
+import pytest
+import sys
+
+from yureka.benchmarks import suite
+
+
+def test_benchmarks(tmpdir, monkeypatch):
+    monkeypatch.setattr(suite, 'SEARCH_NODES', 5)
+    for benchmark in suite.BENCHMARKS:
+        try:
+            work = benchmark.setup(str(tmpdir))
+        except suite.BenchmarkSkipped:
+            continue
+        assert work() > 0
+
+
+def test_measure():
+    rate = suite.measure(lambda: 10, min_time=0.01, rounds=2)
+    assert rate > 0
+
+
+def test_find_regressions():
+    baselines = {'encode': 100.0, 'move index': 100.0}
+    test_cases = [
+        ({'encode': 100.0}, 0),
+        ({'encode': 80.0}, 0),
+        ({'encode': 70.0}, 1),
+        ({'encode': 70.0, 'move index': 10.0}, 2),
+        # skipped, or without a baseline
+        ({'encode': None, 'mcts search': 1.0}, 0),
+    ]
+    for results, expected in test_cases:
+        regressions = suite.find_regressions(results, baselines, 0.25)
+        assert len(regressions) == expected
+
+
+def test_baselines(tmpdir):
+    path = str(tmpdir.join('baselines.json'))
+    assert suite.load_baselines(path) == {}
+    suite.save_baselines(path, {'encode': 1.5})
+    assert suite.load_baselines(path) == {'encode': 1.5}
+
+
+def test_run(tmpdir, monkeypatch, capsys):
+    path = str(tmpdir.join('cache', 'baselines.json'))
+
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', [
+            'suite', 'encode', '--min-time', '0.01', '-r', '1', '-b', path,
+            *args,
+        ])
+        suite.run()
+        return capsys.readouterr().out
+
+    # reported, but nothing to gate on
+    assert 'No baselines' in run()
+    assert 'Saved' in run('--save')
+    assert 'encode' in suite.load_baselines(path)
+    assert 'No regressions' in run('-t', '0.99')
+    suite.save_baselines(path, {'encode': 1e12})
+    with pytest.raises(SystemExit):
+        run()
@@ -0,0 +1,50 @@
+import chess
+
+from yureka.engine.bench import BenchResult, is_solved, read_epd
+from yureka.engine.constants import DEFAULT_BENCH_FILE
+
+
+def test_read_epd(tmpdir):
+    path = tmpdir.join('test.epd')
+    path.write(
+        '# comment\n'
+        '6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - bm Ra8#; id "mate";\n'
+        '\n'
+        f'{chess.STARTING_FEN.rsplit(" ", 2)[0]}\n'
+    )
+    positions = read_epd(str(path))
+    assert len(positions) == 2
+    board, operations = positions[0]
+    assert operations['bm'] == [chess.Move.from_uci('a1a8')]
+    assert operations['id'] == 'mate'
+    board, operations = positions[1]
+    assert board == chess.Board()
+    assert operations == {}
+
+    positions = read_epd(DEFAULT_BENCH_FILE)
+    assert positions
+    for _, operations in positions:
+        assert operations['bm']
+
+
+def test_is_solved():
+    e4 = chess.Move.from_uci('e2e4')
+    d4 = chess.Move.from_uci('d2d4')
+    test_cases = [
+        (e4, {'bm': [e4]}, True),
+        (d4, {'bm': [e4]}, False),
+        (e4, {'am': [e4]}, False),
+        (d4, {'am': [e4]}, True),
+        (e4, {'id': 'no moves'}, None),
+    ]
+    for move, operations, expected in test_cases:
+        assert is_solved(move, operations) == expected
+
+
+def test_bench_result():
+    result = BenchResult(
+        positions=4, nodes=800, seconds=2.0, tested=2, solved=1)
+    assert result.nps() == 400
+    assert result.time_per_position() == 0.5
+    assert result.solved_rate() == 0.5
+    assert BenchResult().nps() == 0
@@ -1,5 +1,7 @@
 import chess
+import math
 
+from yureka import mcts
 from yureka.engine import time_manager
 
 
@@ -41,6 +43,19 @@ def test_parse_time_control():
                 'btime': 20000,
             },
         },
+        {
+            'args': 'nodes 800 depth 5',
+            'data': {
+                'nodes': 800,
+                'depth': 5,
+            },
+        },
+        {
+            'args': 'infinite',
+            'data': {
+                'infinite': True,
+            },
+        },
         {
             'args': 'unknown',
             'data': {},
@@ -301,3 +316,95 @@ def test_time_manager():
         for d, e in zip(tc['data'], tc['expected']):
             duration = tm.calculate_duration(d['color'], d)
             assert duration == e
+
+
+def test_time_manager_infinite():
+    tm = time_manager.TimeManager()
+    assert tm.calculate_duration(chess.WHITE, {'infinite': True}) == math.inf
+    assert tm.calculate_duration(chess.WHITE, {}) == math.inf
+    assert tm.calculate_duration(chess.WHITE, {'nodes': 800}) == math.inf
+
+
+def test_create_clock():
+    tm = time_manager.TimeManager()
+    assert tm.create_clock(chess.WHITE, {'infinite': True}) is None
+
+    clock = tm.create_clock(chess.WHITE, {'movetime': 2000})
+    assert clock.optimum == clock.maximum == 2
+
+    clock = tm.create_clock(chess.WHITE, {
+        'wtime': 40000,
+        'btime': 50000,
+        'winc': 1000,
+        'binc': 1000,
+    })
+    assert clock.maximum == 2.75
+    assert clock.optimum < clock.maximum
+
+
+def create_search(visits):
+    children = {i: mcts.Node(visit=v) for i, v in enumerate(visits)}
+    m = mcts.MCTS(mcts.Node(children=children), '', '', '')
+    m.nodes = sum(visits)
+    return m
+
+
+def test_search_clock():
+    test_cases = [
+        {
+            # out of time
+            'visits': [30, 20],
+            'elapsed': 3,
+            'time_up': True,
+        },
+        {
+            # the second best move can still catch up
+            'visits': [300, 100],
+            'elapsed': 0.5,
+            'time_up': False,
+        },
+        {
+            # but not anymore
+            'visits': [900, 100],
+            'elapsed': 0.8,
+            'time_up': True,
+        },
+        {
+            # past the optimum with a clear best move
+            'visits': [90, 50, 10],
+            'elapsed': 1.05,
+            'time_up': True,
+        },
+        {
+            # past the optimum, but the visits are flat
+            'visits': [55, 50, 10],
+            'elapsed': 1.05,
+            'time_up': False,
+        },
+    ]
+    for tc in test_cases:
+        clock = time_manager.SearchClock(1, 3)
+        # the best move has been stable for a while
+        clock.time_up(create_search(tc['visits']), 0)
+        m = create_search(tc['visits'])
+        assert clock.time_up(m, tc['elapsed']) == tc['time_up']
+
+
+def test_search_clock_best_move_changed():
+    clock = time_manager.SearchClock(1, 3)
+    clock.time_up(create_search([50, 90]), 0.9)
+    # the best move just changed, so take more time
+    assert not clock.time_up(create_search([90, 50]), 1.05)
+    assert clock.time_up(create_search([90, 50]), 1.6)
+
+
+def test_search_clock_fixed():
+    clock = time_manager.SearchClock(2, 2)
+    assert not clock.time_up(create_search([1000, 0]), 1.9)
+    assert clock.time_up(create_search([1000, 0]), 2)
+
+
+def test_time_manager_move_overhead():
+    tm = time_manager.TimeManager(move_overhead=50)
+    assert tm.calculate_duration(chess.WHITE, {'movetime': 1000}) == 0.95
+    assert tm.calculate_duration(chess.WHITE, {'movetime': 40}) == 0.01
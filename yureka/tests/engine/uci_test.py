@@ -1,7 +1,32 @@
 import chess
+import os
+import pytest
+import re
+import threading
+import torch
+import unittest.mock as mock
 
-from yureka.engine import UCIPolicyEngine
-from yureka.engine.constants import DEFAULT_MODEL, DEFAULT_MODEL_FILE
+from yureka import engine
+from yureka.engine import UCIPolicyEngine, UCIMCTSEngine, load_state_dict
+from yureka.learn import models
+from yureka.learn.models.bundle import Bundle
+from yureka.learn.models.res import Network
+from yureka.learn.models.script import to_torch_script
+from yureka.mcts.constants import NODE_BYTES
+from yureka.mcts.networks import Head
+from yureka.mcts.networks.remote import InferenceServer
+from yureka.engine.constants import (
+    DEFAULT_MODEL,
+    DEFAULT_MODEL_FILE,
+    ZERO_VALUE,
+    RANDOM_POLICY,
+)
+
+
+RESNET_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)),
+    'test.resnet.csv',
+)
 
 
 def test_uci_setoption():
@@ -77,3 +102,471 @@ def test_uci_position():
         for m in tc['moves']:
             tc['board'].push_uci(m)
         assert uci.board == tc['board']
+
+
+def create_mcts_engine():
+    e = UCIMCTSEngine(
+        value_name=ZERO_VALUE,
+        policy_name=RANDOM_POLICY,
+        use_resnet=False,
+    )
+    e.isready('')
+    return e
+
+
+def count_playouts(e, count):
+    # returns an event that's set once a search of e has done count
+    # playouts, to wait on instead of sleeping for some progress
+    done = threading.Event()
+    playout = e.engine.playout
+
+    def counted(*args, **kwargs):
+        result = playout(*args, **kwargs)
+        if e.engine.nodes >= count:
+            done.set()
+        return result
+    e.engine.playout = counted
+    return done
+
+
+class WatchedEvent(threading.Event):
+    # knows when something started waiting on it
+    def __init__(self):
+        super(WatchedEvent, self).__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super(WatchedEvent, self).wait(timeout)
+
+
+def save_resnet_files(e, tmpdir, resnet):
+    # points e at the saved (tower, policy, value) modules of resnet
+    for name, module in zip(['tower', 'policy', 'value'], resnet):
+        path = str(tmpdir.join(f'{name}.model'))
+        torch.save(module.state_dict(), path)
+        setattr(e, f'resnet_{name}_file', path)
+
+
+def test_uci_go_infinite_stop(capsys):
+    e = create_mcts_engine()
+    capsys.readouterr()
+    searched = count_playouts(e, 5)
+    e.handle('go infinite')
+    assert searched.wait(10)
+    assert e.searching()
+    e.handle('isready')
+    assert capsys.readouterr().out == 'readyok\n'
+    e.handle('stop')
+    assert not e.searching()
+    out = capsys.readouterr().out
+    assert out.startswith('info depth')
+    assert re.search(r'^bestmove \w+', out, re.M)
+
+
+def test_uci_go_infinite_stop_immediately(capsys):
+    e = create_mcts_engine()
+    e.handle('position startpos moves e2e4')
+    capsys.readouterr()
+    e.handle('go infinite')
+    e.handle('stop')
+    assert not e.searching()
+    assert re.search(r'^bestmove \w+', capsys.readouterr().out, re.M)
+
+
+def test_uci_go_movetime(capsys):
+    e = create_mcts_engine()
+    e.handle('go movetime 100')
+    e.search_thread.join()
+    assert re.search(r'^bestmove \w+', capsys.readouterr().out, re.M)
+
+
+def test_uci_go_infinite_one_legal_move(capsys):
+    e = create_mcts_engine()
+    e.handle('position fen 7k/8/8/8/8/8/6q1/K7 w - - 0 1')
+    e.stop_event = WatchedEvent()
+    e.handle('go infinite')
+    assert e.stop_event.waiting.wait(10)
+    # bestmove must wait for stop even if there's nothing to search
+    assert 'bestmove' not in capsys.readouterr().out
+    e.handle('stop')
+    assert 'bestmove a1b1' in capsys.readouterr().out
+
+
+def test_uci_quit():
+    e = create_mcts_engine()
+    e.handle('go infinite')
+    with pytest.raises(SystemExit):
+        e.handle('quit')
+    assert not e.searching()
+
+
+def test_uci_ponderhit(capsys):
+    e = create_mcts_engine()
+    e.handle('position startpos moves e2e4 e7e5')
+    pondered = count_playouts(e, 5)
+    e.handle('go ponder movetime 250')
+    assert pondered.wait(10)
+    assert e.searching()
+    assert 'bestmove' not in capsys.readouterr().out
+    root = e.engine.root
+    visits = root.visit
+    assert visits > 0
+    e.handle('ponderhit')
+    e.search_thread.join()
+    # the timed search continued on the ponder tree
+    assert e.engine.root is root
+    assert root.visit > visits
+    out = capsys.readouterr().out
+    # minus the default move overhead
+    assert 'info string search for 0.2 seconds' in out
+    assert re.search(r'^bestmove \w+ ponder \w+$', out, re.M)
+
+
+def test_uci_ponder_stop(capsys):
+    e = create_mcts_engine()
+    pondered = count_playouts(e, 5)
+    e.handle('go ponder wtime 10000 btime 10000')
+    assert pondered.wait(10)
+    e.handle('stop')
+    assert not e.pondering
+    assert re.search(r'^bestmove \w+', capsys.readouterr().out, re.M)
+
+
+def test_uci_ponder_miss():
+    e = create_mcts_engine()
+    e.handle('position startpos moves e2e4')
+    e.handle('go movetime 100')
+    e.search_thread.join()
+    pondered = e.engine.root
+    e.handle('position startpos moves e2e4 e7e5')
+    searched = count_playouts(e, 5)
+    e.handle('go ponder')
+    assert searched.wait(10)
+    e.handle('stop')
+    # the opponent played something else, so go back to the tree we
+    # searched before pondering
+    e.handle('position startpos moves e2e4 c7c5')
+    assert e.engine.root is pondered.children[chess.Move.from_uci('c7c5')]
+
+
+def test_uci_position_after_own_move():
+    e = create_mcts_engine()
+    e.handle('position startpos moves e2e4')
+    e.handle('go nodes 20')
+    e.search_thread.join()
+    e.handle('position startpos moves e2e4 e7e5')
+    root = e.engine.root
+    with mock.patch.object(
+        e.engine, 'rewind_root', wraps=e.engine.rewind_root,
+    ) as rewind_root:
+        # the usual position after our move and the opponent's reply
+        e.handle('position startpos moves e2e4 e7e5 g1f3 b8c6')
+    assert not rewind_root.called
+    g1f3 = root.children[chess.Move.from_uci('g1f3')]
+    assert e.engine.root is g1f3.children[chess.Move.from_uci('b8c6')]
+
+
+def test_uci_ponderhit_args():
+    e = create_mcts_engine()
+    e.pondering = True
+    e.ponder_args = 'wtime 100 ponder btime 100'
+    with mock.patch.object(e, 'go') as go, \
+            mock.patch.object(e, 'stop_search'):
+        e.handle('ponderhit')
+    go.assert_called_once_with('wtime 100 btime 100')
+
+
+def test_uci_go_nodes(capsys):
+    outputs = []
+    for _ in range(2):
+        e = create_mcts_engine()
+        capsys.readouterr()
+        e.handle('position startpos moves d2d4')
+        e.handle('go nodes 40')
+        e.search_thread.join()
+        assert e.engine.nodes == 40
+        out = capsys.readouterr().out
+        assert ' nodes 40 ' in out
+        outputs.append(re.search(r'^bestmove .+$', out, re.M).group(0))
+    assert outputs[0] == outputs[1]
+
+
+def test_uci_go_nodes_zero(capsys):
+    e = create_mcts_engine()
+    e.handle('go nodes 0')
+    e.search_thread.join()
+    assert e.engine.nodes == 1
+    assert re.search(r'^bestmove \w+', capsys.readouterr().out, re.M)
+
+
+def test_uci_info_interval(capsys):
+    e = create_mcts_engine()
+    e.handle('setoption name Info Interval value 0')
+    e.handle('setoption name UCI_ShowWDL value true')
+    e.handle('isready')
+    capsys.readouterr()
+    e.handle('go nodes 5')
+    e.search_thread.join()
+    lines = capsys.readouterr().out.splitlines()
+    # one line per playout, and a final one
+    infos = [line for line in lines if line.startswith('info depth')]
+    assert len(infos) == 6
+    assert re.match(
+        r'info depth \d+ seldepth \d+ nodes 5 nps \d+ time \d+ '
+        r'score cp -?\d+ wdl \d+ \d+ \d+ hashfull \d+ pv( \w+)+$',
+        infos[-1],
+    )
+
+
+def test_uci_hash(capsys):
+    e = create_mcts_engine()
+    e.handle('uci')
+    assert 'option name Hash type spin default 256 min 1 max 65536\n' in \
+        capsys.readouterr().out
+    e.handle('setoption name Hash value 1')
+    e.handle('isready')
+    assert e.engine.max_nodes == 2**20 // NODE_BYTES
+
+
+def test_load_state_dict(tmpdir):
+    model = models.create('Policy.v2')
+    new = str(tmpdir.join('new.model'))
+    legacy = str(tmpdir.join('legacy.model'))
+    torch.save(model.state_dict(), new)
+    torch.save(
+        model.state_dict(), legacy, _use_new_zipfile_serialization=False)
+    load = torch.load
+
+    def load_without_mmap(f, map_location=None):
+        return load(f, map_location=map_location)
+    for path in [new, legacy]:
+        state_dicts = [load_state_dict(path)]
+        # a torch from before memory-mapped checkpoints
+        with mock.patch.object(torch, 'load', load_without_mmap):
+            state_dicts.append(load_state_dict(path))
+        for state_dict in state_dicts:
+            for name, tensor in model.state_dict().items():
+                assert torch.equal(state_dict[name], tensor)
+
+
+def test_uci_init_resnet(tmpdir, capsys):
+    resnet = models.create('ResNet.v0')
+    e = UCIMCTSEngine(
+        resnet_name='ResNet.v0',
+        warmup_passes=3,
+        fold_batch_norms=False,
+    )
+    save_resnet_files(e, tmpdir, resnet)
+    e.handle('isready')
+    out = capsys.readouterr().out
+    assert re.search(r'^info string loaded models in [\d.]+ seconds$',
+                     out, re.M)
+    assert re.search(r'^info string 3 warm-up passes in [\d.]+ seconds$',
+                     out, re.M)
+    assert out.endswith('readyok\n')
+    for name, tensor in resnet[0].state_dict().items():
+        assert torch.equal(
+            e.policy.model.tower.state_dict()[name].cpu(), tensor)
+    e.handle('go nodes 5')
+    e.search_thread.join()
+    assert 'bestmove' in capsys.readouterr().out
+
+
+def test_uci_script_file(tmpdir, capsys):
+    tower, policy, value = models.create('ResNet.v0')
+    path = str(tmpdir.join('model.pt'))
+    to_torch_script(Network(tower, policy, value)).save(path)
+
+    e = UCIMCTSEngine()
+    e.handle(f'setoption name Script File value {path}')
+    e.handle('isready')
+    e.handle('go nodes 5')
+    e.search_thread.join()
+    assert 'bestmove' in capsys.readouterr().out
+
+    uci = UCIPolicyEngine(script_file=path)
+    uci.handle('isready')
+    uci.handle('go')
+    assert 'bestmove' in capsys.readouterr().out
+
+
+class BatchRecorder(torch.nn.Module):
+    def __init__(self, network):
+        super(BatchRecorder, self).__init__()
+        self.network = network
+        self.batches = []
+
+    def forward(self, x):
+        self.batches.append(x.shape[0])
+        return self.network(x)
+
+
+def test_uci_warm_up_batches(tmpdir):
+    path = str(tmpdir.join('model.pt'))
+    to_torch_script(Network(*models.create('ResNet.v0'))).save(path)
+    recorders = []
+    load = engine.load_script
+
+    def load_script(path):
+        recorders.append(BatchRecorder(load(path)))
+        return recorders[-1]
+    e = UCIMCTSEngine(script_file=path, warmup_passes=2)
+    with mock.patch.object(engine, 'load_script', load_script):
+        e.handle('isready')
+    # the policy and value of a playout go through the graph together
+    assert recorders[0].batches == [2, 2]
+
+
+def test_uci_spin_options(capsys):
+    e = UCIMCTSEngine()
+    e.handle('uci')
+    out = capsys.readouterr().out
+    assert 'option name Seed type spin default 0 min 0 max 2147483647\n' \
+        in out
+    assert 'option name Info Interval type spin default 1000 min 0 ' \
+        'max 60000\n' in out
+    e.handle('setoption name Seed value 7')
+    assert e.seed == 7
+
+
+def test_uci_empty_option(capsys):
+    e = UCIMCTSEngine(script_file='model.pt')
+    e.handle('uci')
+    assert 'option name Script File type string default <empty>\n' in \
+        capsys.readouterr().out
+    e.handle('setoption name Script File value <empty>')
+    assert e.script_file == ''
+
+
+def test_uci_int8(tmpdir, capsys):
+    e = UCIMCTSEngine(resnet_name='ResNet.v0', int8=True)
+    save_resnet_files(e, tmpdir, models.create('ResNet.v0'))
+    e.handle('isready')
+    assert 'info string Int8 needs a Calibration File' in \
+        capsys.readouterr().out
+
+    e.handle(f'setoption name Calibration File value {RESNET_DATA_FILE}')
+    e.handle('isready')
+    assert re.search(r'^info string quantized models in [\d.]+ seconds$',
+                     capsys.readouterr().out, re.M)
+    assert e.policy.device.type == 'cpu'
+    # one quantized network for both heads
+    assert isinstance(e.policy.model, Head)
+    assert e.policy.model.network is e.value.network.network
+    e.handle('go nodes 5')
+    e.search_thread.join()
+    assert 'bestmove' in capsys.readouterr().out
+
+
+def test_uci_fold_batch_norms(tmpdir):
+    for fold in [True, False]:
+        e = UCIMCTSEngine(resnet_name='ResNet.v0', fold_batch_norms=fold)
+        save_resnet_files(e, tmpdir, models.create('ResNet.v0'))
+        e.handle('isready')
+        has_batch_norms = any(
+            isinstance(m, torch.nn.BatchNorm2d)
+            for m in e.policy.model.modules()
+        )
+        assert has_batch_norms != fold
+
+
+def test_uci_inference_server(tmpdir, capsys):
+    model = Network(*models.create('ResNet.v0'))
+    path = str(tmpdir.join('server.sock'))
+    server = InferenceServer(model, path).start()
+    try:
+        e = UCIMCTSEngine(inference_server=path)
+        e.handle('isready')
+        e.handle('go nodes 5')
+        e.search_thread.join()
+        assert 'bestmove' in capsys.readouterr().out
+        assert server.positions > 0
+    finally:
+        server.close()
+
+
+def test_uci_model_bundle(tmpdir, capsys):
+    path = str(tmpdir.join('model.bundle'))
+    bundle = Bundle.from_modules('ResNet.v0', models.create('ResNet.v0'))
+    bundle.quantized = to_torch_script(Network(*bundle.create()))
+    bundle.save(path)
+    test_cases = [
+        {'int8': False, 'quantized': False},
+        {'int8': True, 'quantized': True},
+    ]
+    for tc in test_cases:
+        e = UCIMCTSEngine(use_resnet=False, int8=tc['int8'])
+        e.handle(f'setoption name Model Bundle value {path}')
+        e.handle('isready')
+        assert isinstance(e.policy.model, Head) == tc['quantized']
+        e.handle('go nodes 5')
+        e.search_thread.join()
+        assert 'bestmove' in capsys.readouterr().out
+
+
+def test_uci_rollout(tmpdir, capsys):
+    path = str(tmpdir.join('rollout.model'))
+    torch.save(models.create('Rollout.v2').state_dict(), path)
+    test_cases = [
+        {'file': '', 'model': False},
+        {'file': path, 'model': True},
+    ]
+    for tc in test_cases:
+        e = create_mcts_engine()
+        rollout_file = tc['file'] or '<empty>'
+        e.handle(f'setoption name Rollout File value {rollout_file}')
+        e.handle('setoption name Rollout Mixing value 1')
+        e.handle('setoption name Rollout Depth value 5')
+        e.handle('isready')
+        assert (e.engine.rollout_policy.model is not None) == tc['model']
+        assert e.engine.mixing == 1
+        assert e.engine.rollout_depth == 5
+        e.handle('go nodes 10')
+        e.search_thread.join()
+        assert 'bestmove' in capsys.readouterr().out
+
+
+def test_uci_bench(tmpdir, capsys):
+    path = tmpdir.join('test.epd')
+    path.write(
+        '6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - bm Ra8#; id "mate";\n'
+        '8/8/4k3/8/2P5/8/4K3/8 w - -\n'
+    )
+    e = create_mcts_engine()
+    e.handle('position startpos moves e2e4')
+    capsys.readouterr()
+    e.handle(f'bench 20 {path}')
+    out = capsys.readouterr().out
+    assert re.search(
+        r'^info string bench 1/2 mate bestmove \w+ (solved|failed)$',
+        out, re.M)
+    assert re.search(
+        r'^info string bench 2/2 8/8/4k3/8/2P5/8/4K3/8 w - - bestmove \w+$',
+        out, re.M)
+    assert 'Positions: 2\n' in out
+    assert 'Nodes: 40\n' in out
+    assert re.search(r'^Nodes/second: \d+$', out, re.M)
+    assert re.search(r'^Solved: [01]/1 ', out, re.M)
+    # back to a new game
+    assert e.engine.root.board == chess.Board()
+
+    e.handle('bench nodes')
+    assert capsys.readouterr().out == 'Unknown command: bench nodes\n'
+    e.handle(f"bench 20 {tmpdir.join('missing.epd')}")
+    assert 'cannot read' in capsys.readouterr().out
+    e.handle(f'bench 0 {path}')
+    assert capsys.readouterr().out == \
+        'info string bench needs at least 1 node\n'
+
+
+def test_uci_profile(capsys):
+    e = create_mcts_engine()
+    e.handle('setoption name Profile value true')
+    e.handle('isready')
+    assert e.engine.profile
+    e.handle('go nodes 10')
+    e.search_thread.join()
+    out = capsys.readouterr().out
+    assert re.search(r'^info string profile playouts 10 ', out, re.M)
+    assert e.engine.stats.playouts == 10
@@ -1,7 +1,14 @@
 import torch
 import numpy as np
-from yureka.learn.data.chess_dataset import ChessDataset
+from torch.utils.data import DataLoader
+from torch.utils.data.dataloader import default_collate
+from yureka.learn.data.chess_dataset import (
+    ChessDataset,
+    ConcatChessDataset,
+    collate_batch,
+)
 from yureka.learn.data.board_data import BOARD_SIZE
+from yureka.learn.data.prefetcher import Prefetcher
 
 
 def test_chess_dataset():
@@ -282,3 +289,44 @@ def test_chess_dataset():
 
         assert tc['move'] == tc['expected_move']
         assert tc['value'].equal(torch.Tensor([float(tc['expected_value'])]))
+
+
+def test_chess_dataset_getitems():
+    for data_file in (
+        'yureka/tests/test.engine.csv',
+        'yureka/tests/test.resnet.csv',
+    ):
+        dataset = ChessDataset(data_file)
+        indices = list(reversed(range(len(dataset))))
+        batch = dataset.__getitems__(indices)
+        expected = default_collate([dataset[i] for i in indices])
+        for t, expected_t in zip(batch, expected):
+            assert t.dtype == expected_t.dtype
+            assert t.equal(expected_t)
+
+
+def test_concat_chess_dataset_getitems():
+    dataset = ConcatChessDataset([
+        ChessDataset('yureka/tests/test.resnet.csv', limit=10),
+        ChessDataset('yureka/tests/test.resnet.csv', offset=10),
+    ])
+    indices = [40, 3, 11, 9, 10, 0]
+    batch = dataset.__getitems__(indices)
+    expected = default_collate([dataset[i] for i in indices])
+    for t, expected_t in zip(batch, expected):
+        assert t.equal(expected_t)
+
+
+def test_prefetcher():
+    dataset = ChessDataset('yureka/tests/test.resnet.csv')
+    loader = DataLoader(dataset, batch_size=5, collate_fn=collate_batch)
+    prefetcher = Prefetcher(loader, torch.device('cpu'), size=2)
+    assert len(prefetcher) == len(loader)
+    for batch, expected in zip(prefetcher, loader):
+        for t, expected_t in zip(batch, expected):
+            assert t.equal(expected_t)
+
+    # stopping early doesn't hang
+    for i, batch in enumerate(prefetcher):
+        if i == 1:
+            break
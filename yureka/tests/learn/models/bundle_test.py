@@ -0,0 +1,92 @@
+import pytest
+import torch
+
+from yureka.learn import models
+from yureka.learn.models.bundle import Bundle, BundleError
+from yureka.learn.models.res import Network, ResNet
+from yureka.learn.models.script import to_torch_script
+from .fold_test import randomize_batch_norms
+
+
+def test_get_config():
+    test_cases = ['ResNet.v0', 'ResNet.v1', 'Policy.v2', 'Value.v2']
+    for name in test_cases:
+        config = models.get_config(name)
+        assert config['name'] == name
+        modules = models.create_from_config(config)
+        if not isinstance(modules, tuple):
+            modules = (modules, )
+        expected = models.create(name)
+        if not isinstance(expected, tuple):
+            expected = (expected, )
+        for m, e in zip(modules, expected):
+            assert m.state_dict().keys() == e.state_dict().keys()
+    with pytest.raises(ValueError):
+        models.get_config('ResNet.v100')
+
+
+def test_bundle(tmpdir):
+    modules = tuple(
+        randomize_batch_norms(m) for m in models.create('ResNet.v0'))
+    tower, policy, value = modules
+    inputs = torch.randn(4, 21, 8, 8)
+    with torch.no_grad():
+        expected = (
+            ResNet(tower, policy)(inputs),
+            ResNet(tower, value)(inputs),
+        )
+
+    test_cases = [
+        {'fold': True, 'folded': True},
+        {'fold': False, 'folded': True},
+        {'fold': True, 'folded': False},
+    ]
+    for tc in test_cases:
+        path = str(tmpdir.join('model.bundle'))
+        Bundle.from_modules('ResNet.v0', modules, fold=tc['fold']).save(path)
+        bundle = Bundle.load(path)
+        assert bundle.name == 'ResNet.v0'
+        assert (bundle.folded is not None) == tc['fold']
+        tower, policy, value = bundle.create(folded=tc['folded'])
+        with torch.no_grad():
+            outputs = (
+                ResNet(tower.eval(), policy.eval())(inputs),
+                ResNet(tower, value.eval())(inputs),
+            )
+        for o, e in zip(outputs, expected):
+            assert torch.allclose(o, e, atol=1e-4)
+
+
+def test_bundle_cnn(tmpdir):
+    path = str(tmpdir.join('model.bundle'))
+    model = models.create('Policy.v2')
+    Bundle.from_modules('Policy.v2', model).save(path)
+    loaded = Bundle.load(path).create()
+    for name, tensor in model.state_dict().items():
+        assert torch.equal(loaded.state_dict()[name], tensor)
+
+
+def test_bundle_quantized(tmpdir):
+    path = str(tmpdir.join('model.bundle'))
+    bundle = Bundle.from_modules('ResNet.v0', models.create('ResNet.v0'))
+    network = to_torch_script(Network(*bundle.create()))
+    bundle.quantized = network
+    bundle.save(path)
+    inputs = torch.randn(2, 21, 8, 8)
+    with torch.no_grad():
+        for o, e in zip(Bundle.load(path).quantized(inputs), network(inputs)):
+            assert torch.equal(o, e)
+
+
+def test_bundle_errors(tmpdir):
+    path = str(tmpdir.join('model.bundle'))
+    tower, _, _ = models.create('ResNet.v0')
+    torch.save(tower.state_dict(), path)
+    with pytest.raises(BundleError):
+        Bundle.load(path)
+
+    bundle = Bundle.from_modules('ResNet.v0', models.create('ResNet.v0'))
+    bundle.input_version = 0
+    bundle.save(path)
+    with pytest.raises(BundleError):
+        Bundle.load(path)
@@ -0,0 +1,68 @@
+import torch
+import torch.nn as nn
+
+from yureka.learn import models
+from yureka.learn.models.res import ResNet
+from yureka.learn.models.fold import fold_batch_norms
+
+
+def randomize_batch_norms(model):
+    # freshly created batch norms are identities already
+    with torch.no_grad():
+        for m in model.modules():
+            if isinstance(m, nn.BatchNorm2d):
+                m.weight.uniform_(0.5, 1.5)
+                m.bias.uniform_(-0.5, 0.5)
+                m.running_mean.uniform_(-0.5, 0.5)
+                m.running_var.uniform_(0.5, 1.5)
+    return model.eval()
+
+
+def forward(modules, input):
+    with torch.no_grad():
+        if len(modules) == 3:
+            tower, policy, value = modules
+            return (
+                ResNet(tower, policy)(input),
+                ResNet(tower, value)(input),
+            )
+        return (modules[0](input), )
+
+
+def test_fold_batch_norms():
+    test_cases = [
+        ['ResNet.v0', 21],
+        ['MobileResNet.v0', 21],
+        ['BottleneckResNet.v0', 21],
+        ['Policy.v2', 21],
+        ['Value.v2', 21],
+        ['Policy.v0', 23],
+    ]
+    for name, in_channels in test_cases:
+        modules = models.create(name)
+        if not isinstance(modules, tuple):
+            modules = (modules, )
+        for m in modules:
+            randomize_batch_norms(m)
+        input = torch.randn(4, in_channels, 8, 8)
+        expected = forward(modules, input)
+
+        for m in modules:
+            fold_batch_norms(m)
+            assert not any(
+                isinstance(c, nn.BatchNorm2d) for c in m.modules())
+        for e, o in zip(expected, forward(modules, input)):
+            assert torch.allclose(e, o, atol=1e-4)
+
+
+def test_fold_batch_norms_checkpoint():
+    modules = [randomize_batch_norms(m) for m in models.create('ResNet.v0')]
+    input = torch.randn(4, 21, 8, 8)
+    expected = forward(modules, input)
+
+    loaded = [m.eval() for m in models.create('ResNet.v0')]
+    for m, loaded_m in zip(modules, loaded):
+        fold_batch_norms(m, keep_batch_norms=True)
+        loaded_m.load_state_dict(m.state_dict())
+    for e, o in zip(expected, forward(loaded, input)):
+        assert torch.allclose(e, o, atol=1e-4)
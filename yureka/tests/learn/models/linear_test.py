@@ -0,0 +1,15 @@
+import torch
+
+from yureka.learn import models
+from yureka.learn.data.move_translator import NUM_MOVE_PLANES
+
+
+def test_rollout_v2():
+    m = models.create('Rollout.v2')
+    input = torch.randn(16, 21, 8, 8)
+    output = m(input)
+    assert output.shape == (16, NUM_MOVE_PLANES * 8 * 8)
+
+    # only the piece planes count
+    input[:, 12:] = 0
+    assert torch.equal(m(input), output)
@@ -0,0 +1,58 @@
+import os
+import torch
+
+from yureka.learn import models
+from yureka.learn.data.chess_dataset import ChessDataset
+from yureka.learn.models.res import Network, ResNet
+from yureka.learn.models.quantize import (
+    calibration_batches,
+    quantize,
+    compare,
+    split_outputs,
+)
+
+
+DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'test.resnet.csv',
+)
+
+
+def test_calibration_batches():
+    batches = calibration_batches(
+        ChessDataset(DATA_FILE), positions=20, batch_size=8)
+    assert [b.shape[0] for b in batches] == [8, 8, 4]
+    assert batches[0].shape[1:] == (21, 8, 8)
+
+
+def test_quantize():
+    torch.manual_seed(0)
+    batches = calibration_batches(ChessDataset(DATA_FILE), batch_size=16)
+    tower, policy, value = models.create('ResNet.v0')
+    test_cases = [
+        Network(tower, policy, value),
+        ResNet(tower, policy),
+        ResNet(tower, value),
+        models.create('Policy.v2'),
+        models.create('Value.v2'),
+    ]
+    for model in test_cases:
+        model.eval()
+        quantized = quantize(model, batches)
+        # the original model is left alone
+        assert all(p.dtype == torch.float for p in model.parameters())
+        with torch.no_grad():
+            expected = split_outputs(model(batches[0]))
+            outputs = split_outputs(quantized(batches[0]))
+        for e, o in zip(expected, outputs):
+            assert (e is None) == (o is None)
+            if e is not None:
+                assert o.shape == e.shape
+        report = compare(model, quantized, batches)
+        assert report['positions'] == 48
+        if expected[0] is not None:
+            # the top move of an untrained, nearly flat policy is easily
+            # swapped by rounding, so the whole distribution is compared
+            assert report['policy_kl'] < 0.05
+        if expected[1] is not None:
+            assert report['value_mse'] < 0.01
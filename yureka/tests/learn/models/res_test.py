@@ -1,6 +1,8 @@
 import torch
 from yureka.learn import models
 from yureka.learn.data.move_translator import NUM_MOVE_PLANES
+from yureka.learn.models.res import Network, BottleneckBlock
+from yureka.learn.models.script import to_torch_script, load_torch_script
 
 
 def test_res_v0():
@@ -27,3 +29,37 @@ def test_res_v1():
     # (batch_size, 1)
     value_output = value(tower(input))
     assert value_output.shape == (16, 1)
+
+
+def test_to_torch_script(tmpdir):
+    tower, policy, value = models.create('ResNet.v0')
+    network = Network(tower, policy, value).eval()
+    path = str(tmpdir.join('model.pt'))
+    to_torch_script(network).save(path)
+    scripted = load_torch_script(path)
+    # batch norms are folded into the convolutions
+    assert 'batch_norm' not in str(scripted.graph)
+    for batch_size in [1, 5]:
+        input = torch.randn(batch_size, 21, 8, 8)
+        with torch.no_grad():
+            expected_policy, expected_value = network(input)
+            policy_output, value_output = scripted(input)
+        assert policy_output.shape == (batch_size, NUM_MOVE_PLANES * 8 * 8)
+        assert torch.allclose(policy_output, expected_policy, atol=1e-5)
+        assert torch.allclose(value_output, expected_value, atol=1e-5)
+
+
+def test_bottleneck_res():
+    test_cases = [
+        ['MobileResNet.v0', 'separable'],
+        ['BottleneckResNet.v0', 'bottleneck'],
+    ]
+    for name, block_type in test_cases:
+        tower, policy, value = models.create(name)
+        blocks = [m for m in tower if isinstance(m, BottleneckBlock)]
+        assert len(blocks) == models.resnet_settings[name]['res_blocks']
+        depthwise = blocks[0].conv2.groups == blocks[0].conv2.in_channels
+        assert depthwise == (block_type == 'separable')
+        input = torch.randn(16, 21, 8, 8)
+        assert policy(tower(input)).shape == (16, NUM_MOVE_PLANES * 8 * 8)
+        assert value(tower(input)).shape == (16, 1)
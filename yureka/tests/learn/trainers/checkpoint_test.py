@@ -0,0 +1,43 @@
+import random
+import torch
+
+from yureka.learn.trainers.checkpoint import (
+    CheckpointWriter,
+    load_checkpoint,
+    get_rng_state,
+    set_rng_state,
+    to_cpu,
+)
+
+
+def test_to_cpu_copies():
+    t = torch.zeros(3)
+    snapshot = to_cpu({'a': [t, 1], 'b': (t, 'c')})
+    t += 1
+    assert snapshot['a'][0].equal(torch.zeros(3))
+    assert snapshot['a'][1] == 1
+    assert snapshot['b'][0].equal(torch.zeros(3))
+    assert snapshot['b'][1] == 'c'
+
+
+def test_rng_state():
+    state = get_rng_state()
+    expected = (torch.rand(1), random.random())
+    set_rng_state(state)
+    assert (torch.rand(1), random.random()) == expected
+
+
+def test_checkpoint_writer(tmpdir):
+    writer = CheckpointWriter(keep=2)
+    t = torch.zeros(2)
+    for i in range(4):
+        writer.save({'t': t, 'i': i}, str(tmpdir.join(f'{i}.ckpt')), True)
+        t += 1
+    writer.save({'t': t}, str(tmpdir.join('weights.model')))
+    writer.close()
+
+    assert sorted(f.basename for f in tmpdir.listdir()) == [
+        '2.ckpt', '3.ckpt', 'weights.model']
+    state = load_checkpoint(str(tmpdir.join('3.ckpt')))
+    assert state['i'] == 3
+    assert state['t'].equal(torch.full((2, ), 3.0))
@@ -0,0 +1,75 @@
+import logging
+import math
+import shutil
+import torch
+import torch.optim as optim
+
+from yureka.learn import models
+from yureka.learn.data.chess_dataset import ChessDataset
+from yureka.learn.trainers.distill import (
+    DistillationTrainer,
+    compute_targets,
+    targets_path,
+)
+
+
+def create_data(tmpdir, top_k=4, temperature=1.0):
+    data_file = str(tmpdir.join('test.resnet.csv'))
+    shutil.copy('yureka/tests/test.resnet.csv', data_file)
+    teacher = models.create('ResNet.v0')
+    targets = compute_targets(
+        teacher,
+        ChessDataset(data_file),
+        top_k=top_k,
+        temperature=temperature,
+        batch_size=16,
+    )
+    torch.save(targets, targets_path(data_file))
+    return teacher, data_file, targets
+
+
+def test_compute_targets(tmpdir):
+    teacher, data_file, targets = create_data(tmpdir)
+    assert targets['indices'].shape == (48, 4)
+    assert targets['probs'].shape == (48, 4)
+    assert targets['values'].shape == (48, 1)
+    assert torch.allclose(
+        targets['probs'].float().sum(1), torch.ones(48), atol=1e-2)
+
+    inputs, _, _ = ChessDataset(data_file).__getitems__(list(range(8)))
+    tower, policy, value = teacher
+    with torch.no_grad():
+        tower_output = tower(inputs)
+        best = policy(tower_output).reshape(8, -1).argmax(1)
+        values = value(tower_output)
+    assert targets['indices'][:8, 0].long().equal(best)
+    assert torch.allclose(targets['values'][:8], values, atol=1e-5)
+
+
+def test_distill(tmpdir):
+    test_cases = [
+        ('MobileResNet.v0', 'res'),
+        ('Policy.v2', 'policy'),
+        ('Value.v2', 'value'),
+    ]
+    _, data_file, _ = create_data(tmpdir, temperature=2.0)
+    for model_name, network in test_cases:
+        trainer = DistillationTrainer(
+            models.create(model_name),
+            [data_file],
+            0.25,
+            str(tmpdir),
+            split_data=True,
+            network=network,
+            batch_size=8,
+            cuda=False,
+            num_workers=0,
+            logger=logging.getLogger('distill_test'),
+        )
+        assert trainer.temperature == 2.0
+        if network == 'res':
+            params = [p for m in trainer.model for p in m.parameters()]
+        else:
+            params = trainer.model.parameters()
+        trainer.train(0, optim.SGD(params, lr=1e-3))
+        assert math.isfinite(trainer.test(0))
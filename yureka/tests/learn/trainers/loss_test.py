@@ -0,0 +1,38 @@
+import torch
+
+from yureka.learn.trainers.loss import DistillationLoss, MSECrossEntropyLoss
+
+
+def test_mse_cross_entropy_loss_bfloat16():
+    criterion = MSECrossEntropyLoss()
+    pred_move = torch.randn(8, 4672)
+    pred_value = torch.rand(8, 1)
+    move = torch.randint(4672, (8,))
+    value = torch.ones(8, 1)
+
+    expected = criterion((pred_move, pred_value), (move, value))
+    losses = criterion(
+        (pred_move.bfloat16(), pred_value.bfloat16()),
+        (move, value),
+    )
+    for loss, expected_loss in zip(losses, expected):
+        assert loss.dtype == torch.float32
+        assert abs(loss.item() - expected_loss.item()) < 0.1
+
+
+def test_distillation_loss():
+    logits = torch.randn(8, 4672)
+    probs, indices = torch.softmax(logits, 1).topk(4672, 1)
+    value = torch.rand(8, 1)
+    criterion = DistillationLoss()
+    loss, mse, kl_div = criterion((logits, value), (indices, probs, value))
+    # the student matches the teacher exactly
+    assert abs(loss.item()) < 1e-4
+    assert mse.item() == 0
+
+    policy_criterion = DistillationLoss('policy')
+    assert policy_criterion(
+        torch.zeros(8, 4672), (indices, probs, value)).item() > 0.1
+    hotter = DistillationLoss('policy', temperature=2.0)
+    assert hotter(
+        logits * 2, (indices, probs, value)).item() < 1e-3
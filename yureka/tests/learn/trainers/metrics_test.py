@@ -0,0 +1,34 @@
+import torch
+
+from yureka.learn.trainers.metrics import StreamingMetrics
+
+
+def test_streaming_metrics():
+    metrics = StreamingMetrics(top_k=(1, 2))
+    outputs = torch.Tensor([
+        [0.1, 0.7, 0.2],
+        [0.5, 0.3, 0.2],
+        [0.1, 0.2, 0.7],
+    ])
+    metrics.update_moves(outputs[:2], torch.LongTensor([1, 1]))
+    metrics.update_moves(outputs[2:], torch.LongTensor([0]))
+    assert metrics.move_samples == 3
+    assert metrics.accuracy(1) == 1 / 3
+    assert metrics.accuracy(2) == 2 / 3
+
+    metrics.update_values(
+        torch.Tensor([[0.5], [-1]]), torch.Tensor([[1], [1]]))
+    metrics.update_values(torch.Tensor([[0]]), torch.Tensor([[0]]))
+    assert metrics.value_mse() == (0.25 + 4) / 3
+
+    metrics.update_loss(
+        torch.tensor(1.0), torch.tensor(2.0), torch.tensor(3.0))
+    metrics.update_loss(
+        torch.tensor(3.0), torch.tensor(4.0), torch.tensor(5.0))
+    assert metrics.avg_loss() == 2
+    assert metrics.avg_mse_loss() == 3
+    assert metrics.avg_cross_entropy_loss() == 4
+
+    metrics.reset()
+    assert metrics.avg_loss() == 0
+    assert metrics.accuracy(1) == 0
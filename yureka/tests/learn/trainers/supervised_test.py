@@ -0,0 +1,96 @@
+import logging
+import math
+import os
+import pytest
+import socket
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.optim as optim
+
+from yureka.learn import models
+from yureka.learn.trainers.supervised import SupervisedTrainer
+
+
+def create_trainer(tmpdir, **kwargs):
+    return SupervisedTrainer(
+        models.create('ResNet.v0'),
+        ['yureka/tests/test.resnet.csv'],
+        0.25,
+        str(tmpdir),
+        split_data=True,
+        batch_size=8,
+        cuda=False,
+        logger=logging.getLogger('supervised_test'),
+        **kwargs
+    )
+
+
+def test_train_mixed_precision_channels_last(tmpdir):
+    trainer = create_trainer(
+        tmpdir, mixed_precision=True, channels_last=True)
+    optimizer = optim.SGD(
+        [p for m in trainer.model for p in m.parameters()], lr=1e-3)
+    trainer.train(0, optimizer)
+    loss = trainer.test(0)
+    assert math.isfinite(loss)
+
+
+def test_resume_mid_epoch(tmpdir):
+    torch.manual_seed(0)
+    full_run = tmpdir.mkdir('full')
+    trainer = create_trainer(
+        full_run, num_epochs=1, num_workers=0, checkpoint_interval=2)
+    trainer.run()
+    checkpoint = full_run.listdir('*_0_2.ckpt')
+    assert len(checkpoint) == 1
+
+    resumed_run = tmpdir.mkdir('resumed')
+    resumed = create_trainer(
+        resumed_run, num_epochs=1, num_workers=0, resume=str(checkpoint[0]))
+    resumed.run()
+    for m, resumed_m in zip(trainer.model, resumed.model):
+        for p, resumed_p in zip(m.parameters(), resumed_m.parameters()):
+            assert p.equal(resumed_p)
+    assert len(resumed_run.listdir('*.model')) == 3
+
+
+def distributed_worker(rank, world_size, port, tmpdir, results):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.manual_seed(rank)
+    trainer = create_trainer(tmpdir, distributed=True, num_workers=0)
+    assert len(trainer.train_data.sampler) == 18
+    optimizer = optim.SGD(
+        [p for m in trainer.model for p in m.parameters()], lr=1e-3)
+    trainer.train(0, optimizer)
+    trainer.save(0)
+    trainer.checkpoint_writer.close()
+    loss = trainer.test(0)
+    checksum = sum(
+        p.sum().item() for m in trainer.model for p in m.parameters())
+    results.put((rank, checksum, loss))
+    dist.destroy_process_group()
+
+
+def test_distributed_train(tmpdir):
+    world_size = 2
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    ctx = mp.get_context('spawn')
+    results = ctx.SimpleQueue()
+    mp.spawn(
+        distributed_worker,
+        args=(world_size, port, str(tmpdir), results),
+        nprocs=world_size,
+    )
+    results = [results.get() for _ in range(world_size)]
+    _, checksums, losses = zip(*results)
+    # DDP kept the replicas in sync even though they started from
+    # different random weights, and test metrics were reduced
+    assert checksums[0] == pytest.approx(checksums[1])
+    assert losses[0] == losses[1]
+    # only rank 0 saved
+    assert len(tmpdir.listdir()) == 3
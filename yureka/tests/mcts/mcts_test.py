@@ -2,11 +2,22 @@ import chess
 import math
 import unittest.mock as mock
 import pytest
+import re
+import threading
 import torch
 import time
 from yureka import mcts
 from yureka.engine import UCIMCTSEngine
 from yureka.engine.constants import ZERO_VALUE, RANDOM_POLICY
+from yureka.mcts.networks import (
+    Head,
+    PolicyNetwork,
+    RandomPolicy,
+    SharedNetwork,
+    ValueNetwork,
+    ZeroValue,
+)
+from yureka.mcts.networks.rollout import RolloutPolicy
 from yureka.learn.data.move_translator import (
     translate_to_engine_move,
     get_engine_move_index,
@@ -154,7 +165,7 @@ def test_backup():
     # white turn
     node.parent.parent = mcts.Node()
     m = mcts.MCTS('', '', '', '')
-    m.backup(node, 0.9)
+    assert m.backup(node, 0.9) == 2
     walker = node
     while walker:
         assert walker.value == 0.9
@@ -162,17 +173,6 @@ def test_backup():
         walker = walker.parent
 
 
-def test_continue_search():
-    count = 0
-    search_time = mcts.continue_search(1.5)
-    for t in search_time:
-        if not t:
-            break
-        count += 1
-        time.sleep(1)
-    assert count == 2
-
-
 def test_get_move():
     children = {
         'm1': mcts.Node(visit=1),
@@ -228,3 +228,468 @@ def test_engine_new_position():
     assert e.engine.root.board == expected
     assert e.engine.root.parent is None
     assert len(e.engine.root.children) == 0
+
+
+def test_get_ponder_move():
+    grandchildren = {
+        'r1': mcts.Node(visit=1),
+        'r2': mcts.Node(visit=4),
+    }
+    children = {
+        'm1': mcts.Node(visit=5, children=grandchildren),
+        'm2': mcts.Node(visit=2),
+    }
+    m = mcts.MCTS(mcts.Node(children=children), '', '', '')
+    assert m.get_ponder_move() == 'r2'
+
+    children = {
+        'm1': mcts.Node(visit=1),
+    }
+    m = mcts.MCTS(mcts.Node(children=children), '', '', '')
+    assert m.get_ponder_move() is None
+
+
+def test_rewind_root():
+    children = {i: mcts.Node() for i in range(5)}
+    root = mcts.Node(children=children)
+    m = mcts.MCTS(root, '', '', '')
+    assert m.previous_board() is None
+    m.advance_root(1)
+    assert m.previous_board() == root.board
+    m.rewind_root()
+    assert m.root is root
+    assert m.previous_root is None
+
+
+def test_search_after_rewind_root():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(nodes=50))
+    m.advance_root(m.get_move())
+    m.search(mcts.SearchLimits(nodes=50))
+    root = m.root
+    visit = root.visit
+    # visits of the root that didn't go through a child
+    own_visits = visit - sum(c.visit for c in root.children.values())
+    # ponder on the expected reply, which doesn't get played
+    m.advance_root(m.get_move())
+    pondered = m.root
+    m.search(mcts.SearchLimits(nodes=30))
+    m.rewind_root()
+    assert m.root is root
+    assert pondered.parent is root
+    m.search(mcts.SearchLimits(nodes=30))
+    # every playout since, pondered or not, reached the root
+    assert root.visit == visit + 60
+    assert root.visit == \
+        sum(c.visit for c in root.children.values()) + own_visits
+    assert root.size == count_nodes(root)
+
+
+def visits(node):
+    return {m.uci(): c.visit for m, c in node.children.items()}
+
+
+def test_search_nodes():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(nodes=50))
+    assert m.nodes == 50
+    assert m.root.visit == 50
+    assert m.seldepth >= m.depth() > 0
+
+    # the same seed searches the same tree
+    other = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    other.search(mcts.SearchLimits(nodes=50))
+    assert visits(other.root) == visits(m.root)
+    assert other.get_move() == m.get_move()
+
+
+def test_search_stopped():
+    # a search stopped before it started still plays out once, so that
+    # there's a move to play
+    stop_event = threading.Event()
+    stop_event.set()
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(), stop_event=stop_event)
+    assert m.nodes == 1
+    assert m.get_move() in m.root.board.legal_moves
+
+
+def test_search_depth():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(depth=2))
+    assert m.depth() == 2
+    assert m.seldepth >= 2
+
+
+def test_search_limits_infinite():
+    assert mcts.SearchLimits().infinite()
+    assert not mcts.SearchLimits(duration=1).infinite()
+    assert not mcts.SearchLimits(nodes=1).infinite()
+    assert not mcts.SearchLimits(depth=1).infinite()
+
+
+def test_value_to_cp():
+    assert mcts.value_to_cp(0) == 0
+    assert mcts.value_to_cp(0.5) == -mcts.value_to_cp(-0.5)
+    assert mcts.value_to_cp(0.2) < mcts.value_to_cp(0.5)
+    assert mcts.value_to_cp(2) == mcts.value_to_cp(1)
+
+
+def test_value_to_wdl():
+    test_cases = [
+        (0, (250, 500, 250)),
+        (1, (1000, 0, 0)),
+        (-1, (0, 0, 1000)),
+        (2, (1000, 0, 0)),
+        (0.5, (625, 250, 125)),
+        (-0.5, (125, 250, 625)),
+    ]
+    for value, expected in test_cases:
+        assert mcts.value_to_wdl(value) == expected
+    for value in [-0.9, -0.33, 0.01, 0.77]:
+        win, draw, loss = mcts.value_to_wdl(value)
+        assert win + draw + loss == 1000
+        assert min(win, draw, loss) >= 0
+        # the expected outcome is kept
+        assert abs((win - loss) / 1000 - value) < 0.0011
+
+
+def test_get_pv():
+    grandchildren = {
+        'r1': mcts.Node(visit=0),
+        'r2': mcts.Node(visit=2),
+    }
+    children = {
+        'm1': mcts.Node(visit=1),
+        'm2': mcts.Node(visit=3, value=1.5, children=grandchildren),
+    }
+    m = mcts.MCTS(mcts.Node(children=children), '', '', '')
+    assert m.get_pv() == ['m2', 'r2']
+    assert m.get_score() == 0.5
+
+
+def test_tree_size():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(nodes=10))
+
+    def count(node):
+        return 1 + sum(count(c) for c in node.children.values())
+
+    assert m.tree_size() == count(m.root)
+    m.advance_root(m.get_move())
+    assert m.tree_size() == count(m.root)
+    assert m.hashfull() == m.tree_size() * 1000 // m.max_nodes
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(c) for c in node.children.values())
+
+
+def test_prune():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy(), max_nodes=300)
+    m.search(mcts.SearchLimits(nodes=60))
+    assert m.nodes == 60
+    assert m.tree_size() <= 300
+    assert m.tree_size() == count_nodes(m.root)
+    # the root is never collapsed
+    assert m.root.children
+
+
+def test_collapse():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(nodes=30))
+    size = m.tree_size()
+    removed = m.collapse(m.root, m.root.visit + 1)
+    assert removed > 0
+    assert m.tree_size() == size - removed == count_nodes(m.root)
+    assert all(not c.children for c in m.root.children.values())
+
+
+def test_tree_reclaimer():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(nodes=30))
+    old_root = m.root
+    m.advance_root(m.get_move())
+    m.advance_root(m.get_move())
+    m.reclaimer.wait()
+    # the old root is taken apart, but not the previous root we may still
+    # rewind to
+    assert old_root.children == {}
+    assert m.root in m.previous_root.children.values()
+    assert m.tree_size() == count_nodes(m.root)
+
+
+class SlowValue():
+    def get_value(self, board, color):
+        time.sleep(0.02)
+        return 0
+
+
+def test_playout_deadline():
+    m = mcts.MCTS(mcts.Node(), SlowValue(), RandomPolicy())
+    assert not m.playout(deadline=time.monotonic() - 1)
+    # expanded, but not evaluated
+    assert m.root.children
+    assert m.root.visit == 0
+    assert m.nodes == 0
+    assert m.playout(deadline=time.monotonic() + 1)
+    assert m.nodes == 1
+
+
+class FakeClock():
+    # stands in for the time module in mcts, only moved on by tick
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def tick(self, seconds):
+        self.now += seconds
+
+
+class TimedValue():
+    def __init__(self, clock, cost):
+        self.clock = clock
+        self.cost = cost
+
+    def get_value(self, board, color):
+        self.clock.tick(self.cost)
+        return 0
+
+
+def test_search_deadline():
+    # powers of two so that the times add up exactly
+    test_cases = [
+        {'duration': 2, 'cost': 0.25, 'expected': 8},
+        {'duration': 2.125, 'cost': 0.25, 'expected': 8},
+        {'duration': 0.25, 'cost': 0.25, 'expected': 1},
+        {'duration': 0, 'cost': 0.25, 'expected': 1},
+    ]
+    for tc in test_cases:
+        clock = FakeClock()
+        m = mcts.MCTS(
+            mcts.Node(), TimedValue(clock, tc['cost']), RandomPolicy())
+        starts = []
+        playout = m.playout
+
+        def timed_playout(deadline=None):
+            starts.append((clock.now, m.playout_cost))
+            return playout(deadline=deadline)
+        m.playout = timed_playout
+        with mock.patch.object(mcts, 'time', clock):
+            m.search(mcts.SearchLimits(duration=tc['duration']))
+        assert m.nodes == tc['expected']
+        assert m.playout_cost == tc['cost']
+        # a search always does at least one playout, but after that, none
+        # is started unless it's expected to finish before the deadline
+        for start, cost in starts[1:]:
+            assert start <= tc['duration'] - cost
+        assert clock.now <= max(tc['duration'], tc['cost'])
+
+
+def test_simulate_mixing():
+    test_cases = [
+        {'mixing': 0, 'rollout': 1, 'expected': 0.5},
+        {'mixing': 0.5, 'rollout': 1, 'expected': 0.75},
+        {'mixing': 1, 'rollout': -1, 'expected': -1},
+    ]
+    for tc in test_cases:
+        value = mock.MagicMock()
+        value.get_value.return_value = 0.5
+        m = mcts.MCTS(
+            mcts.Node(), value, RandomPolicy(),
+            rollout_policy=RolloutPolicy(),
+            mixing=tc['mixing'],
+        )
+        m.rollout = mock.MagicMock(return_value=tc['rollout'])
+        assert m.simulate(m.root) == tc['expected']
+        assert value.get_value.called == (tc['mixing'] != 1)
+        assert m.rollout.called == (tc['mixing'] != 0)
+
+
+def test_rollout():
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.rollout_policy = RolloutPolicy()
+    for depth in [1, 10, 100]:
+        m.rollout_depth = depth
+        board = chess.Board()
+        assert -1 <= m.rollout(board) <= 1
+        assert len(board.move_stack) <= depth
+
+    # white mates with Qh5xf7
+    board = chess.Board(
+        'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4')
+    m.root = mcts.Node(board=board.copy())
+    m.rollout_policy = mock.MagicMock()
+    m.rollout_policy.get_move.side_effect = [
+        chess.Move.from_uci('h5f7'), None]
+    assert m.rollout(board) == 1
+
+    # black is a queen up when the rollout stops
+    board = chess.Board('4k3/8/8/8/8/8/8/q3K3 w - - 0 1')
+    m.root = mcts.Node(board=board.copy())
+    m.rollout_policy = RolloutPolicy()
+    m.rollout_depth = 0
+    assert m.rollout(board) == pytest.approx(-math.tanh(0.9))
+
+
+def test_material_value():
+    board = chess.Board('4k3/8/8/8/8/8/8/q3K2R w - - 0 1')
+    assert mcts.material_value(board, chess.WHITE) == \
+        pytest.approx(math.tanh(-0.4))
+    assert mcts.material_value(board, chess.BLACK) == \
+        pytest.approx(math.tanh(0.4))
+
+
+def test_search_mixing():
+    value = mock.MagicMock()
+    m = mcts.MCTS(
+        mcts.Node(), value, RandomPolicy(),
+        rollout_policy=RolloutPolicy(),
+        mixing=1,
+        rollout_depth=10,
+    )
+    m.search(mcts.SearchLimits(nodes=20))
+    assert m.nodes == 20
+    assert not value.get_value.called
+
+
+def test_search_profile(capsys):
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy())
+    m.search(mcts.SearchLimits(nodes=20))
+    assert m.stats is None
+    assert 'profile' not in capsys.readouterr().out
+
+    m = mcts.MCTS(mcts.Node(), ZeroValue(), RandomPolicy(), profile=True)
+    m.search(mcts.SearchLimits(nodes=20))
+    stats = m.stats
+    assert stats.playouts == m.nodes == 20
+    assert stats.expanded + stats.terminal == 20
+    assert stats.children == m.tree_size() - 1
+    assert stats.reused == 0
+    for phase in ('select', 'expand', 'simulate', 'backup', 'network'):
+        assert getattr(stats, f'{phase}_time') > 0
+    assert stats.total_time() < 1
+    out = capsys.readouterr().out
+    assert re.search(
+        r'^info string profile playouts 20 select [\d.]+ms \d+% .* '
+        r'expanded \d+ children \d+ terminal 0 abandoned 0 evaluations 40 '
+        r'batch 1.00 queued 0 hits 0 misses 20 reused 0$',
+        out, re.M)
+
+    # the visits of the kept subtree count as reused
+    move = m.get_move()
+    visit = m.root.children[move].visit
+    m.advance_root(move)
+    m.search(mcts.SearchLimits(nodes=5))
+    assert m.stats.reused == visit
+    assert m.stats.playouts == 5
+
+
+def test_playout_profile():
+    test_cases = [
+        # checkmated, so nothing to expand
+        ('7k/6Q1/6K1/8/8/8/8/8 b - - 0 1', 1, 0, 0),
+        (chess.STARTING_FEN, 0, 1, 20),
+    ]
+    for fen, terminal, expanded, children in test_cases:
+        m = mcts.MCTS(
+            mcts.Node(board=chess.Board(fen)), ZeroValue(), RandomPolicy(),
+            profile=True,
+        )
+        assert m.playout()
+        assert m.stats.terminal == terminal
+        assert m.stats.expanded == expanded
+        assert m.stats.children == children
+
+    m = mcts.MCTS(mcts.Node(), SlowValue(), RandomPolicy(), profile=True)
+    assert not m.playout(deadline=time.monotonic() - 1)
+    assert m.stats.abandoned == 1
+    assert m.stats.playouts == 0
+
+
+class PlanesNetwork(torch.nn.Module):
+    # (policy, value) from sums of the planes, which are small integers,
+    # so that the outputs of a position don't depend on its batch
+    def __init__(self):
+        super(PlanesNetwork, self).__init__()
+        self.batches = []
+
+    def forward(self, x):
+        self.batches.append(x.shape[0])
+        sums = x.flatten(1).sum(1, keepdim=True)
+        policy = torch.sin(sums * torch.arange(4672))
+        value = torch.tanh(x[:, :6].flatten(1).sum(1, keepdim=True) / 8)
+        return policy, value
+
+
+def test_search_shared_network():
+    fen = 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3'
+    searches = []
+    for shared in [False, True]:
+        network = PlanesNetwork()
+        heads = SharedNetwork(network) if shared else network
+        value = ValueNetwork(Head(heads, 1), cuda=False)
+        m = mcts.MCTS(
+            mcts.Node(board=chess.Board(fen)),
+            value,
+            PolicyNetwork(Head(heads, 0), cuda=False, train=False),
+        )
+        with mock.patch.object(
+            value, 'get_value', wraps=value.get_value,
+        ) as get_value:
+            m.search(mcts.SearchLimits(nodes=50))
+        searches.append((m, network.batches, get_value.call_count))
+
+    (m, batches, values), (shared_m, shared_batches, shared_values) = \
+        searches
+    # the policy and the value of each playout are evaluated together, and
+    # the value is read from the batch rather than evaluated again
+    assert batches == [1] * 100
+    assert values == 50
+    assert shared_batches == [2] * 50
+    assert shared_values == 0
+    # into the same search
+    assert [(c.visit, c.value) for c in shared_m.root.children.values()] == \
+        [(c.visit, c.value) for c in m.root.children.values()]
+
+
+def test_abandoned_prefetch():
+    network = PlanesNetwork()
+    heads = SharedNetwork(network)
+    m = mcts.MCTS(
+        mcts.Node(),
+        ValueNetwork(Head(heads, 1), cuda=False),
+        PolicyNetwork(Head(heads, 0), cuda=False, train=False),
+    )
+    assert not m.playout(deadline=time.monotonic() - 1)
+    # the unused value went through the network with the policy, and
+    # nothing is waiting for the next call
+    assert network.batches == [2]
+    assert heads.queued is None
+    assert m.playout()
+    assert network.batches == [2, 2]
+
+
+def test_search_profile_shared_network():
+    network = PlanesNetwork()
+    heads = SharedNetwork(network)
+    m = mcts.MCTS(
+        mcts.Node(),
+        ValueNetwork(Head(heads, 1), cuda=False),
+        PolicyNetwork(Head(heads, 0), cuda=False, train=False),
+        profile=True,
+    )
+    assert not m.playout(deadline=time.monotonic() - 1)
+    m.search(mcts.SearchLimits(nodes=30))
+    stats = m.stats
+    # every value came with a policy, in one batch per expansion
+    assert stats.expanded == stats.queued == len(network.batches) - 1 == 30
+    assert stats.hits == 30
+    assert stats.misses == 0
+    assert stats.batch_size() == 2
+    assert stats.network_time > 0
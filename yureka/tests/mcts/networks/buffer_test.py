@@ -0,0 +1,63 @@
+import chess
+import torch
+
+from unittest.mock import MagicMock
+from yureka.learn.data.board_data import get_board_data
+from yureka.learn.data.chess_dataset import get_tensor_from_row
+from yureka.mcts.networks import PolicyNetwork, ValueNetwork
+from yureka.mcts.networks.buffer import InputBuffer, OutputBuffer
+
+
+def test_input_buffer():
+    board = chess.Board()
+    rows = []
+    for uci in ['e2e4', 'e7e5', 'e1e2', 'e8e7']:
+        board.push_uci(uci)
+        rows.append(get_board_data(board, board.turn))
+    buffer = InputBuffer(torch.device('cpu'))
+
+    test_cases = [rows[:1], rows[1:], rows[:2], rows[3:]]
+    for tc in test_cases:
+        inputs = buffer.fill(tc)
+        assert inputs.shape == (len(tc), 21, 8, 8)
+        for i, row in enumerate(tc):
+            assert torch.equal(inputs[i], get_tensor_from_row(row))
+
+    # reused once big enough
+    storage = buffer.host.data_ptr()
+    assert buffer.fill(rows[:2]).data_ptr() == storage
+
+
+def test_output_buffer():
+    buffer = OutputBuffer(torch.device('cpu'))
+
+    test_cases = [
+        torch.rand(1, 4672),
+        torch.rand(4, 4672),
+        torch.rand(2, 4672),
+    ]
+    for tc in test_cases:
+        outputs = buffer.read(tc)
+        assert torch.equal(outputs, tc)
+        assert outputs.data_ptr() != tc.data_ptr()
+
+    # reused once big enough
+    storage = buffer.host.data_ptr()
+    assert buffer.read(torch.rand(3, 4672)).data_ptr() == storage
+    # but not for another shape
+    assert buffer.read(torch.rand(3, 1)).shape == (3, 1)
+
+
+def test_networks_read_into_output_buffers():
+    board = chess.Board()
+    policy = PolicyNetwork(
+        MagicMock(return_value=torch.rand(1, 4672)), cuda=False, train=False)
+    probs = policy.get_probs(board)
+    assert probs.data_ptr() == policy.outputs.host.data_ptr()
+    assert probs.sum() > 0
+    assert policy.get_probs(board).data_ptr() == probs.data_ptr()
+
+    value = ValueNetwork(MagicMock(return_value=torch.tensor([[0.5]])),
+                         cuda=False)
+    assert value.get_value(board, chess.BLACK) == -0.5
+    assert value.outputs.host.tolist() == [[0.5]]
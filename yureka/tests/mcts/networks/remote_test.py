@@ -0,0 +1,47 @@
+import threading
+import time
+import torch
+
+from yureka.learn import models
+from yureka.learn.models.res import Network
+from yureka.mcts.networks.remote import InferenceServer, RemoteNetwork
+
+
+def test_remote_network(tmpdir):
+    model = Network(*models.create('ResNet.v0')).eval()
+    path = str(tmpdir.join('server.sock'))
+    server = InferenceServer(model, path, batch_wait=1).start()
+    try:
+        clients = [RemoteNetwork(path) for _ in range(4)]
+        while len(server.clients) < len(clients):
+            time.sleep(0.01)
+        inputs = [torch.randn(batch, 21, 8, 8) for batch in [1, 1, 2, 3]]
+        outputs = [None] * len(clients)
+        barrier = threading.Barrier(len(clients))
+
+        def evaluate(i):
+            barrier.wait()
+            outputs[i] = clients[i](inputs[i])
+
+        threads = [
+            threading.Thread(target=evaluate, args=(i, ))
+            for i in range(len(clients))
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # all the clients had a request in, so no need to wait
+        assert server.batches == 1
+        assert server.positions == 7
+        with torch.no_grad():
+            for x, (policy, value) in zip(inputs, outputs):
+                expected_policy, expected_value = model(x)
+                assert torch.allclose(
+                    policy, expected_policy.view(x.shape[0], -1), atol=1e-5)
+                assert torch.allclose(value, expected_value, atol=1e-5)
+        for client in clients:
+            client.close()
+    finally:
+        server.close()
@@ -0,0 +1,58 @@
+import chess
+import random
+import torch
+
+from yureka.learn import models
+from yureka.learn.data.board_data import get_board_data
+from yureka.learn.data.chess_dataset import get_tensor_from_row
+from yureka.learn.data.move_translator import (
+    translate_to_engine_move,
+    get_engine_move_index,
+)
+from yureka.mcts.networks.rollout import RolloutPolicy, piece_square_features
+
+
+class RecordingRandom(random.Random):
+    def choices(self, population, weights=None, **kwargs):
+        self.weights = list(weights)
+        return super().choices(population, weights=weights, **kwargs)
+
+
+def test_piece_square_features():
+    board = chess.Board()
+    for uci in ['e2e4', 'd7d5', 'e4d5', 'g8f6']:
+        board.push_uci(uci)
+        planes = get_tensor_from_row(get_board_data(board, board.turn))
+        expected = planes[:12].flatten().nonzero().flatten().tolist()
+        assert sorted(piece_square_features(board)) == expected
+
+
+def test_rollout_policy():
+    model = models.create('Rollout.v2')
+    policy = RolloutPolicy(model)
+    board = chess.Board()
+    board.push_uci('e2e4')
+    moves = list(board.legal_moves)
+    rand = RecordingRandom(0)
+    assert policy.get_move(board, rand) in moves
+
+    # the same distribution as the model over the legal moves
+    with torch.no_grad():
+        inputs = get_tensor_from_row(get_board_data(board, board.turn))
+        logits = model(inputs.unsqueeze(0))[0]
+    indices = [
+        get_engine_move_index(translate_to_engine_move(m, board.turn))
+        for m in moves
+    ]
+    expected = torch.softmax(logits[indices], 0)
+    weights = torch.tensor(rand.weights, dtype=torch.float32)
+    assert torch.allclose(weights / weights.sum(), expected, atol=1e-5)
+
+
+def test_rollout_policy_random():
+    policy = RolloutPolicy()
+    board = chess.Board()
+    assert policy.get_move(board, random.Random(0)) in board.legal_moves
+    mate = chess.Board(
+        'rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3')
+    assert policy.get_move(mate, random.Random(0)) is None
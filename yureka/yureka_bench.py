@@ -0,0 +1,28 @@
+import argparse
+
+from .engine import constants, UCIMCTSEngine
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Searches every position of an EPD file for a fixed '
+                    'number of nodes and reports the speed of the engine '
+                    'and how many best moves it found')
+    parser.add_argument(
+        'epd_file', nargs='?', default=constants.DEFAULT_BENCH_FILE)
+    parser.add_argument(
+        '-n', '--nodes', type=int, default=constants.DEFAULT_BENCH_NODES)
+    parser.add_argument(
+        '-o', '--option', action='append', default=[],
+        help='engine option to set, e.g. "Use ResNet=false"')
+    args = parser.parse_args()
+
+    engine = UCIMCTSEngine()
+    for option in args.option:
+        name, value = option.split('=', 1)
+        engine.setoption(f'name {name} value {value}')
+    engine.bench(f'{args.nodes} {args.epd_file}')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import torch
+
+from .engine import constants, load_script, load_state_dicts
+from .learn import models
+from .learn.models.fold import fold_batch_norms
+from .learn.models.res import Network
+from .mcts.networks.remote import (
+    InferenceServer,
+    DEFAULT_SOCKET_PATH,
+    DEFAULT_MAX_BATCH,
+    DEFAULT_BATCH_WAIT,
+)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description='Serves a ResNet to the engines on this host that have '
+                    'their Inference Server option set to the socket')
+    parser.add_argument('-s', '--socket', default=DEFAULT_SOCKET_PATH)
+    parser.add_argument('-r', '--resnet', default=constants.DEFAULT_RESNET)
+    parser.add_argument(
+        '-t', '--tower-file', default=constants.DEFAULT_RESNET_TOWER_FILE)
+    parser.add_argument(
+        '-p', '--policy-file', default=constants.DEFAULT_RESNET_POLICY_FILE)
+    parser.add_argument(
+        '-v', '--value-file', default=constants.DEFAULT_RESNET_VALUE_FILE)
+    parser.add_argument(
+        '--script-file',
+        help='frozen TorchScript model with both heads, used instead of the '
+             'model files')
+    parser.add_argument('--no-fold', action='store_true')
+    parser.add_argument('-b', '--max-batch', type=int,
+                        default=DEFAULT_MAX_BATCH)
+    parser.add_argument(
+        '-w', '--batch-wait', type=float, default=DEFAULT_BATCH_WAIT * 1000,
+        help='milliseconds to wait for more positions before evaluating')
+    parser.add_argument('-c', '--cuda-device', type=int)
+    args = parser.parse_args()
+
+    if torch.cuda.is_available():
+        device = torch.device('cuda', args.cuda_device)
+    else:
+        device = torch.device('cpu')
+    if args.script_file:
+        model = load_script(args.script_file, args.cuda_device)
+    else:
+        tower, policy, value = models.create(args.resnet)
+        load_state_dicts([
+            (tower, args.tower_file),
+            (policy, args.policy_file),
+            (value, args.value_file),
+        ])
+        model = Network(tower, policy, value).eval()
+        if not args.no_fold:
+            fold_batch_norms(model)
+    server = InferenceServer(
+        model,
+        os.path.expanduser(args.socket),
+        device=device,
+        max_batch=args.max_batch,
+        batch_wait=args.batch_wait / 1000,
+    )
+    print(f'Serving on {server.path}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    run()